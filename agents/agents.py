@@ -1,6 +1,13 @@
+import asyncio
+import json
 import os
+import time
 from dotenv import load_dotenv
 
+from agents import clients, ratelimit
+from agents.cache import cache_key
+from agents.pricing import estimate_cost
+
 load_dotenv()
 
 """
@@ -12,11 +19,70 @@ want to pay for several hundred runs of this, haha.
 - Guojia La
 
 """
+class AgentFailure:
+    """
+    What act() returns when the provider call failed for good (after retries).
+    Deliberately not a string, so it can never be mistaken for the model's answer.
+    """
+
+    def __init__(self, provider, model, error, attempts, retryable):
+        self.provider = provider
+        self.model = model
+        self.error = error
+        self.attempts = attempts
+        self.retryable = retryable
+
+    def to_dict(self):
+        return {"provider": self.provider, "model": self.model, "error": self.error,
+                "attempts": self.attempts, "retryable": self.retryable}
+
+    def __repr__(self):
+        return f"AgentFailure({self.provider}/{self.model} after {self.attempts} attempts: {self.error})"
+
+
+class AgentResponse(str):
+    """
+    What act() returns when a provider call worked: the reply text, so tasks and the
+    cache use it like any string, with the call's telemetry attached:
+
+        latency_ms    wall clock of the whole call, retries and backoff included
+        ttft_ms       time to first token of the successful attempt (streaming calls only)
+        input_tokens, output_tokens, cache_read_tokens, cache_write_tokens
+                      from the SDK's usage, None when the provider doesn't report them
+        retries       attempts that failed before this one
+        cost_usd      estimate from agents.pricing, None for models without a price
+        cached        served from the ResponseCache, so nothing was spent
+    """
+
+    FIELDS = ("latency_ms", "ttft_ms", "input_tokens", "output_tokens", "cache_read_tokens",
+              "cache_write_tokens", "retries", "cost_usd", "cached")
+
+    def __new__(cls, text, **telemetry):
+        self = super().__new__(cls, text)
+        for field in cls.FIELDS:
+            setattr(self, field, telemetry.get(field))
+        return self
+
+    def telemetry(self):
+        """The fields that are known, for the match log."""
+        return {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) not in (None, False)}
+
+
+# model_config keys for us, not for the SDK
+_LOCAL_CONFIG = ("temperature", "max_tokens", "price", "stream")
+
+
 class Agent:
-    def __init__(self, name, model="claude", model_config=None):
+    def __init__(self, name, model="claude", model_config=None, cache=None, max_retries=4):
         self.name = name
         self.model = model
         self.model_config = model_config or {}
+        # retries for throttling / transient provider errors, with jittered exponential backoff
+        self.max_retries = max_retries
+        # optional agents.cache.ResponseCache shared between agents
+        self.cache = cache
+        # running conversation when the engine plays in session mode (see start_session)
+        self.session = None
         self.client = None
         self.provider = None
 
@@ -29,70 +95,382 @@ class Agent:
         #     self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         #     self.provider = "openai"
 
+        # clients come from a shared registry so all agents reuse the same connection pools
         if self.model.startswith("claude"):
-            from anthropic import Anthropic
-            self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+            self.client = clients.get_anthropic_client(os.getenv("ANTHROPIC_API_KEY"))
             self.provider = "anthropic"
 
         elif self.model.startswith("gemini"):
-            import google.generativeai as genai
-            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-            self.client = genai.GenerativeModel(self.model)
+            self.client = clients.get_gemini_model(self.model, os.getenv("GOOGLE_API_KEY"))
             self.provider = "gemini"
 
         else:
             self.provider = "dummy"
 
     def act(self, observation):
+        start = time.perf_counter()
+        key, cached = self._cache_lookup(observation)
+        if cached is not None:
+            return self._cached(cached, start)
+
+        response = self._call([{"role": "user", "content": observation}])
+        self._cache_store(key, response)
+        return response
+
+    async def aact(self, observation):
+        """
+        Async version of act(). Uses the async SDK clients so that the engine can
+        await every agent in a round at once instead of one after another.
+        """
+        # subclasses that only override act() (mocks, scripted agents) keep working,
+        # they just get pushed onto a worker thread so they don't block the loop
+        if type(self).act is not Agent.act:
+            return await asyncio.to_thread(self.act, observation)
+
+        start = time.perf_counter()
+        key, cached = self._cache_lookup(observation)
+        if cached is not None:
+            return self._cached(cached, start)
+
+        response = await self._acall([{"role": "user", "content": observation}])
+        self._cache_store(key, response)
+        return response
+
+    def start_session(self, system_prompt):
+        """
+        Session mode: instead of one big re-rendered prompt per turn, keep a running
+        conversation. system_prompt is the part of the game that never changes (rules,
+        inventory, valuations); providers that support it get it marked as cacheable,
+        so each turn only pays full price for what is new.
+        """
+        self.session = {"system": system_prompt, "messages": []}
+
+    def act_session(self, delta):
+        """Session mode act(): delta is only what changed since this agent's last turn."""
+        if type(self).act is not Agent.act:
+            # agents that only know act() just get the whole thing as one prompt
+            return self.act(f"{self.session['system']}\n\n{delta}")
+
+        start = time.perf_counter()
+        messages = self.session["messages"] + [{"role": "user", "content": delta}]
+        prompt = {"system": self.session["system"], "messages": messages}
+        key, cached = self._cache_lookup(prompt)
+        if cached is not None:
+            response = self._cached(cached, start)
+        else:
+            response = self._call(messages, system=self.session["system"])
+            self._cache_store(key, response)
+        self._record_session_turn(messages, response)
+        return response
+
+    async def aact_session(self, delta):
+        if type(self).act is not Agent.act:
+            return await asyncio.to_thread(self.act_session, delta)
+
+        start = time.perf_counter()
+        messages = self.session["messages"] + [{"role": "user", "content": delta}]
+        prompt = {"system": self.session["system"], "messages": messages}
+        key, cached = self._cache_lookup(prompt)
+        if cached is not None:
+            response = self._cached(cached, start)
+        else:
+            response = await self._acall(messages, system=self.session["system"])
+            self._cache_store(key, response)
+        self._record_session_turn(messages, response)
+        return response
+
+    def _record_session_turn(self, messages, response):
+        # a failed call leaves the session as it was, so the turn can be retried later
+        if not isinstance(response, AgentFailure):
+            self.session["messages"] = messages + [{"role": "assistant", "content": str(response)}]
+
+    def _call(self, messages, system=None):
         if self.provider == "openai":
-            return self._call_openai(observation)
+            return self._call_openai(messages, system)
         elif self.provider == "anthropic":
-            return self._call_anthropic(observation)
+            return self._call_anthropic(messages, system)
         elif self.provider == "gemini":
-            return self._call_gemini(observation)
+            return self._call_gemini(messages, system)
         else:
             return "dummy_action"
 
-    def _call_openai(self, observation):
-        try:
-            response = self.client.chat.completions.create(
+    async def _acall(self, messages, system=None):
+        if self.provider == "anthropic":
+            return await self._acall_anthropic(messages, system)
+        elif self.provider == "gemini":
+            return await self._acall_gemini(messages, system)
+        else:
+            return await asyncio.to_thread(self._call, messages, system)
+
+    def _cache_lookup(self, prompt):
+        # returns (key, cached response). key is None when the cache doesn't apply
+        if self.cache is None or self.provider == "dummy" or not self.cache.applies_to(self.model_config):
+            return None, None
+        key = cache_key(self.provider, self.model, self.model_config, prompt)
+        return key, self.cache.get(key)
+
+    def _cache_store(self, key, response):
+        # never remember failed calls
+        if key is not None and not isinstance(response, AgentFailure):
+            self.cache.put(key, str(response))
+
+    @staticmethod
+    def _cached(text, start):
+        return AgentResponse(text, latency_ms=round((time.perf_counter() - start) * 1000, 1),
+                             input_tokens=0, output_tokens=0, retries=0, cost_usd=0.0, cached=True)
+
+    def _response(self, result, retries, start, attempt_start):
+        """AgentResponse for an extracted result (see _with_retries)."""
+        first_token = result.get("first_token_at")
+        tokens = {k: result.get(k) for k in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")}
+        return AgentResponse(
+            result["text"],
+            latency_ms=round((time.perf_counter() - start) * 1000, 1),
+            ttft_ms=round((first_token - attempt_start) * 1000, 1) if first_token is not None else None,
+            retries=retries,
+            cost_usd=estimate_cost(self.model, price=self.model_config.get("price"), **tokens),
+            **tokens
+        )
+
+    def _async_client(self):
+        # the gemini GenerativeModel has async methods built in, only anthropic needs a second client.
+        # async clients belong to an event loop, so look it up on every call instead of keeping it
+        if self.provider == "anthropic":
+            return clients.get_async_anthropic_client(os.getenv("ANTHROPIC_API_KEY"))
+        return self.client
+
+    def _anthropic_request(self, messages, system=None):
+        request = {
+            "model": self.model,
+            "max_tokens": self.model_config.get("max_tokens", 1024),
+            "temperature": self.model_config.get("temperature", 0.7),
+            "messages": messages,
+            **{k: v for k, v in self.model_config.items() if k not in _LOCAL_CONFIG}
+        }
+        if system is not None:
+            # cache breakpoints: the stable system prompt, and everything up to the newest turn
+            request["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+            last = messages[-1]
+            request["messages"] = messages[:-1] + [{
+                "role": last["role"],
+                "content": [{"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}]
+            }]
+        return request
+
+    @staticmethod
+    def _gemini_contents(messages, system=None):
+        if system is None and len(messages) == 1:
+            return messages[0]["content"]
+        # gemini takes the system prompt at model construction, which would mean one model
+        # per session; putting it at the front of the first turn keeps the prefix stable instead
+        contents = []
+        for i, msg in enumerate(messages):
+            text = msg["content"]
+            if i == 0 and system is not None:
+                text = f"{system}\n\n{text}"
+            contents.append({"role": "model" if msg["role"] == "assistant" else "user", "parts": [text]})
+        return contents
+
+    def _gemini_config(self):
+        return {
+            "temperature": self.model_config.get("temperature", 0.7),
+            "max_output_tokens": self.model_config.get("max_tokens", 512),
+        }
+
+    def _with_retries(self, send, extract, estimated_tokens):
+        """
+        Send a request through the provider's shared limiter, retrying throttles and
+        transient errors with backoff.
+
+        Args:
+            send: () -> SDK response
+            extract: SDK response -> {"text", "input_tokens", "output_tokens", ...}
+            estimated_tokens: tokens/min to reserve up front
+
+        Returns:
+            an AgentResponse, or an AgentFailure
+        """
+        limiter = ratelimit.get_limiter(self.provider)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            limiter.acquire(estimated_tokens)
+            attempt_start = time.perf_counter()
+            # exactly one release per acquire, however the attempt ends (cancelled included)
+            outcome = {}
+            try:
+                try:
+                    response = send()
+                except Exception as e:
+                    outcome = {"throttled": ratelimit.is_throttle(e)}
+                    error = e
+                else:
+                    try:
+                        result = extract(response)
+                    except Exception as e:
+                        # e.g. gemini's response.text on a reply its safety filters blocked;
+                        # asking again won't change that
+                        return self._failed(e, attempt, retryable=False)
+                    outcome = {"succeeded": True, "estimated_tokens": estimated_tokens,
+                               "actual_tokens": _used(result)}
+                    return self._response(result, attempt, start, attempt_start)
+            finally:
+                limiter.release(**outcome)
+            failure = self._failed(error, attempt)
+            if failure is not None:
+                return failure
+            time.sleep(ratelimit.backoff_delay(attempt, error=error))
+            attempt += 1
+
+    async def _awith_retries(self, send, extract, estimated_tokens):
+        """Async version of _with_retries; send is a coroutine function."""
+        limiter = ratelimit.get_limiter(self.provider)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            await limiter.aacquire(estimated_tokens)
+            attempt_start = time.perf_counter()
+            # exactly one release per acquire, however the attempt ends (cancelled included)
+            outcome = {}
+            try:
+                try:
+                    response = await send()
+                except Exception as e:
+                    outcome = {"throttled": ratelimit.is_throttle(e)}
+                    error = e
+                else:
+                    try:
+                        result = extract(response)
+                    except Exception as e:
+                        # e.g. gemini's response.text on a reply its safety filters blocked;
+                        # asking again won't change that
+                        return self._failed(e, attempt, retryable=False)
+                    outcome = {"succeeded": True, "estimated_tokens": estimated_tokens,
+                               "actual_tokens": _used(result)}
+                    return self._response(result, attempt, start, attempt_start)
+            finally:
+                limiter.release(**outcome)
+            failure = self._failed(error, attempt)
+            if failure is not None:
+                return failure
+            await asyncio.sleep(ratelimit.backoff_delay(attempt, error=error))
+            attempt += 1
+
+    def _failed(self, error, attempt, retryable=None):
+        # None means "try again"
+        if retryable is None:
+            retryable = ratelimit.is_retryable(error)
+        if retryable and attempt < self.max_retries:
+            return None
+        print(f"{self.provider} API error: {error}")
+        return AgentFailure(self.provider, self.model, f"{type(error).__name__}: {error}",
+                            attempts=attempt + 1, retryable=retryable)
+
+    def _estimate(self, messages, system, default_max_tokens):
+        return ratelimit.estimate_request_tokens(
+            messages, system, self.model_config.get("max_tokens", default_max_tokens))
+
+    @staticmethod
+    def _anthropic_result(response):
+        usage = getattr(response, "usage", None)
+        result = {
+            "input_tokens": getattr(usage, "input_tokens", None),
+            "output_tokens": getattr(usage, "output_tokens", None),
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None),
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None),
+        }
+        # with a tool (e.g. a task's ActionSchema.tool()) the answer is the tool call's input
+        for block in response.content:
+            if getattr(block, "type", None) == "tool_use":
+                return {"text": json.dumps(block.input), **result}
+        return {"text": response.content[0].text.strip(), **result}
+
+    @staticmethod
+    def _anthropic_streamed(streamed):
+        message, first_token_at = streamed
+        return {**Agent._anthropic_result(message), "first_token_at": first_token_at}
+
+    @staticmethod
+    def _gemini_result(response):
+        usage = getattr(response, "usage_metadata", None)
+        return {"text": response.text.strip(),
+                "input_tokens": getattr(usage, "prompt_token_count", None),
+                "output_tokens": getattr(usage, "candidates_token_count", None)}
+
+    @staticmethod
+    def _openai_result(response):
+        usage = getattr(response, "usage", None)
+        return {"text": response.choices[0].message.content.strip(),
+                "input_tokens": getattr(usage, "prompt_tokens", None),
+                "output_tokens": getattr(usage, "completion_tokens", None)}
+
+    def _stream_anthropic(self, request):
+        # model_config={"stream": True}: same request, streamed, so we see the first token arrive
+        first_token_at = None
+        with self.client.messages.stream(**request) as stream:
+            for _ in stream.text_stream:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+            return stream.get_final_message(), first_token_at
+
+    @staticmethod
+    async def _astream_anthropic(client, request):
+        first_token_at = None
+        async with client.messages.stream(**request) as stream:
+            async for _ in stream.text_stream:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+            return await stream.get_final_message(), first_token_at
+
+    def _call_openai(self, messages, system=None):
+        estimated = self._estimate(messages, system, 512)
+        if system is not None:
+            messages = [{"role": "system", "content": system}] + messages
+        return self._with_retries(
+            lambda: self.client.chat.completions.create(
                 model=self.model,
-                messages=[{"role": "user", "content": observation}],
+                messages=messages,
                 temperature=self.model_config.get("temperature", 0.7),
                 max_tokens=self.model_config.get("max_tokens", 512),
-                **{k: v for k, v in self.model_config.items()
-                   if k not in ["temperature", "max_tokens"]}
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"OpenAI API error: {e}")
-            return f"ERROR: {str(e)}"
-
-    def _call_anthropic(self, observation):
-        try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=self.model_config.get("max_tokens", 1024),
-                temperature=self.model_config.get("temperature", 0.7),
-                messages=[{"role": "user", "content": observation}],
-                **{k: v for k, v in self.model_config.items()
-                   if k not in ["temperature", "max_tokens"]}
-            )
-            return response.content[0].text.strip()
-        except Exception as e:
-            print(f"Anthropic API error: {e}")
-            return f"ERROR: {str(e)}"
-
-    def _call_gemini(self, observation):
-        try:
-            response = self.client.generate_content(
-                observation,
-                generation_config={
-                    "temperature": self.model_config.get("temperature", 0.7),
-                    "max_output_tokens": self.model_config.get("max_tokens", 512),
-                }
-            )
-            return response.text.strip()
-        except Exception as e:
-            print(f"Gemini API error: {e}")
-            return f"ERROR: {str(e)}"
\ No newline at end of file
+                **{k: v for k, v in self.model_config.items() if k not in _LOCAL_CONFIG}
+            ),
+            self._openai_result, estimated
+        )
+
+    def _call_anthropic(self, messages, system=None):
+        request = self._anthropic_request(messages, system)
+        estimated = self._estimate(messages, system, 1024)
+        if self.model_config.get("stream"):
+            return self._with_retries(lambda: self._stream_anthropic(request), self._anthropic_streamed, estimated)
+        return self._with_retries(lambda: self.client.messages.create(**request), self._anthropic_result, estimated)
+
+    def _call_gemini(self, messages, system=None):
+        contents = self._gemini_contents(messages, system)
+        return self._with_retries(
+            lambda: self.client.generate_content(contents, generation_config=self._gemini_config()),
+            self._gemini_result, self._estimate(messages, system, 512)
+        )
+
+    async def _acall_anthropic(self, messages, system=None):
+        client = self._async_client()
+        request = self._anthropic_request(messages, system)
+        estimated = self._estimate(messages, system, 1024)
+        if self.model_config.get("stream"):
+            return await self._awith_retries(lambda: self._astream_anthropic(client, request),
+                                             self._anthropic_streamed, estimated)
+        return await self._awith_retries(lambda: client.messages.create(**request), self._anthropic_result, estimated)
+
+    async def _acall_gemini(self, messages, system=None):
+        client = self._async_client()
+        contents = self._gemini_contents(messages, system)
+        return await self._awith_retries(
+            lambda: client.generate_content_async(contents, generation_config=self._gemini_config()),
+            self._gemini_result, self._estimate(messages, system, 512)
+        )
+
+
+def _used(result):
+    # tokens the rate limiter should be charged, if the provider told us
+    if result.get("input_tokens") is None or result.get("output_tokens") is None:
+        return None
+    return result["input_tokens"] + result["output_tokens"]
@@ -0,0 +1,112 @@
+"""
+On-disk cache of LLM responses, so re-running a fixed-seed match doesn't pay for
+the same prompt twice.
+
+Entries are keyed by a hash of (provider, model, model_config, prompt) and kept in
+a SQLite file. Old entries are evicted least-recently-used first once the cache goes
+over max_entries or max_bytes.
+
+Sampled responses (temperature > 0) are different every time, so by default the
+cache stays out of the way for them. Pass allow_sampled=True to cache them anyway,
+e.g. when you want a re-run to reproduce a previous run exactly.
+
+replay=True opens the cache read-only: hits are served, nothing is written, and a
+miss raises CacheMiss instead of silently calling the provider.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Agent falls back to this temperature when model_config doesn't set one
+DEFAULT_TEMPERATURE = 0.7
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a prompt was never recorded."""
+    pass
+
+
+def cache_key(provider, model, model_config, prompt):
+    payload = json.dumps(
+        {"provider": provider, "model": model, "config": model_config or {}, "prompt": prompt},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, max_entries=None, max_bytes=None, replay=False, allow_sampled=False):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.allow_sampled = allow_sampled
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        if replay:
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+
+    def close(self):
+        self._conn.close()
+
+    def applies_to(self, model_config):
+        """Whether responses for this sampling config should go through the cache."""
+        if self.replay or self.allow_sampled:
+            return True
+        return (model_config or {}).get("temperature", DEFAULT_TEMPERATURE) == 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise CacheMiss(key)
+                return None
+            self.hits += 1
+            if not self.replay:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, response):
+        if self.replay:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), time.time())
+            )
+            self._evict()
+
+    def _evict(self):
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        if self.max_bytes is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
@@ -0,0 +1,116 @@
+"""
+Process-wide registry of provider SDK clients.
+
+Building an Anthropic client per Agent means a fresh HTTP connection pool (and
+fresh TLS handshakes) per Agent. Instead every Agent asks this module for a client,
+and agents with the same provider + credentials share one, along with its
+keep-alive connections.
+
+- sync clients are shared by every thread (httpx.Client is thread safe)
+- async clients are tied to an event loop, so there is one per (credentials, loop)
+- pool sizes are set with configure_pool() before the first client is built
+"""
+import hashlib
+import importlib
+import threading
+import weakref
+
+POOL_LIMITS = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 30.0,
+}
+
+_lock = threading.Lock()
+_clients = {}
+# event loop -> {key: async client}; entries go away with their loop
+_async_clients = weakref.WeakKeyDictionary()
+_gemini_api_key = None
+
+
+def configure_pool(max_connections=None, max_keepalive_connections=None, keepalive_expiry=None):
+    """Change connection pool limits for clients built after this call."""
+    with _lock:
+        if max_connections is not None:
+            POOL_LIMITS["max_connections"] = max_connections
+        if max_keepalive_connections is not None:
+            POOL_LIMITS["max_keepalive_connections"] = max_keepalive_connections
+        if keepalive_expiry is not None:
+            POOL_LIMITS["keepalive_expiry"] = keepalive_expiry
+
+
+def _credential_key(provider, api_key):
+    # don't keep raw API keys around as dict keys
+    digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+    return provider, digest
+
+
+def _limits(http_client_cls):
+    # the SDK's default http client subclasses httpx.Client (httpx2.Client on newer
+    # anthropic releases), so build the Limits from whichever package that is
+    httpx = importlib.import_module(http_client_cls.__mro__[1].__module__.partition(".")[0])
+    return httpx.Limits(**POOL_LIMITS)
+
+
+def get_anthropic_client(api_key):
+    key = _credential_key("anthropic", api_key)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            from anthropic import Anthropic, DefaultHttpxClient
+            # max_retries=0: Agent does its own retrying, through the shared rate limiter
+            client = Anthropic(api_key=api_key, max_retries=0,
+                               http_client=DefaultHttpxClient(limits=_limits(DefaultHttpxClient)))
+            _clients[key] = client
+        return client
+
+
+def get_async_anthropic_client(api_key):
+    """Async client for the running event loop."""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    key = _credential_key("anthropic", api_key)
+    with _lock:
+        per_loop = _async_clients.setdefault(loop, {})
+        client = per_loop.get(key)
+        if client is None:
+            from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+            client = AsyncAnthropic(api_key=api_key, max_retries=0,
+                                    http_client=DefaultAsyncHttpxClient(limits=_limits(DefaultAsyncHttpxClient)))
+            per_loop[key] = client
+        return client
+
+
+def get_gemini_model(model, api_key):
+    """
+    google.generativeai keeps its transport in global state, so it can only be
+    configured with one API key per process. Models are cheap wrappers around that
+    transport, but we still share one per model name.
+    """
+    global _gemini_api_key
+    key = _credential_key("gemini", api_key) + (model,)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            import google.generativeai as genai
+            if _gemini_api_key is None:
+                genai.configure(api_key=api_key)
+                _gemini_api_key = api_key
+            elif _gemini_api_key != api_key:
+                raise ValueError("google.generativeai only supports one API key per process")
+            client = genai.GenerativeModel(model)
+            _clients[key] = client
+        return client
+
+
+def close_clients():
+    """Close every shared sync client and forget all clients (e.g. at shutdown or in tests)."""
+    global _gemini_api_key
+    with _lock:
+        for client in _clients.values():
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
+        _clients.clear()
+        _async_clients.clear()
+        _gemini_api_key = None
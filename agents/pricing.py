@@ -0,0 +1,60 @@
+"""
+Rough USD prices per million tokens, for estimating what a match cost.
+
+These are list prices at the time of writing and will drift; override a model's
+price with register_price, or per agent with model_config={"price": [input, output]}.
+Models are matched by the longest known prefix of their name, so dated snapshots
+("claude-3-5-sonnet-20241022") pick up their family's price.
+"""
+
+# model prefix -> (input $/Mtok, output $/Mtok)
+PRICES = {
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-sonnet": (3.00, 15.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+    "claude-sonnet-4": (3.00, 15.00),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-opus-4": (15.00, 75.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-pro": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+# anthropic prompt caching: reads cost a tenth of normal input, writes a quarter more
+CACHE_READ_FACTOR = 0.1
+CACHE_WRITE_FACTOR = 1.25
+
+
+def register_price(model_prefix, input_per_mtok, output_per_mtok):
+    PRICES[model_prefix] = (input_per_mtok, output_per_mtok)
+
+
+def price_for(model):
+    """(input $/Mtok, output $/Mtok) for a model, or None if we don't know it."""
+    best = None
+    for prefix in PRICES:
+        if model.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return None if best is None else PRICES[best]
+
+
+def estimate_cost(model, input_tokens, output_tokens, cache_read_tokens=0, cache_write_tokens=0, price=None):
+    """
+    Estimated USD cost of one call, or None when the price or the token counts are unknown.
+
+    Args:
+        price: (input $/Mtok, output $/Mtok) to use instead of the table
+    """
+    price = price or price_for(model)
+    if price is None or input_tokens is None or output_tokens is None:
+        return None
+    input_price, output_price = price
+    return (input_tokens * input_price
+            + (cache_read_tokens or 0) * input_price * CACHE_READ_FACTOR
+            + (cache_write_tokens or 0) * input_price * CACHE_WRITE_FACTOR
+            + output_tokens * output_price) / 1e6
@@ -0,0 +1,189 @@
+"""
+Per-provider rate limiting, retries and adaptive concurrency.
+
+Every Agent talking to the same provider shares one ProviderLimiter, which
+- keeps requests/min and tokens/min under the quota with two token buckets
+- caps how many calls are in flight, and adapts that cap AIMD style: halve it when
+  the provider throttles us, grow it by about one per window of successful calls
+
+Retryable errors (429, 5xx, overloaded, timeouts, dropped connections) are retried
+with jittered exponential backoff by the Agent; see Agent._with_retries.
+"""
+import asyncio
+import random
+import threading
+import time
+
+# backoff jitter gets its own RNG so retries never disturb the game's random stream
+_jitter = random.Random()
+
+# backoff for attempt n is uniform in [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**n)] seconds
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+THROTTLE_STATUS = {429, 529}
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holds at most capacity (default: one minute's worth)."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """
+        Take amount tokens now, going into debt if needed.
+
+        Returns:
+            seconds to wait before the reservation is covered
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # a single request bigger than the whole bucket still has to go through eventually
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount):
+        """Give back (or, with a negative amount, take more) tokens once the real cost is known."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None,
+                 max_concurrency=32, min_concurrency=1, initial_concurrency=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(initial_concurrency or max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    def _try_enter(self):
+        with self._cond:
+            if self.in_flight < max(1, int(self.concurrency)):
+                self.in_flight += 1
+                return True
+            return False
+
+    def _reserve(self, tokens):
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens=0):
+        """Block until a request of about `tokens` tokens may be sent."""
+        with self._cond:
+            while self.in_flight >= max(1, int(self.concurrency)):
+                self._cond.wait()
+            self.in_flight += 1
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens=0, poll_interval=0.01):
+        # the limiter is shared with threads (and other loops), so poll instead of using asyncio primitives
+        while not self._try_enter():
+            await asyncio.sleep(poll_interval)
+        wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # cancelled before the request went out: give the slot back
+                self.release()
+                raise
+
+    def release(self, throttled=False, succeeded=False, estimated_tokens=0, actual_tokens=None):
+        """
+        Finish a request. throttled=True means the provider pushed back (429/529):
+        cut concurrency in half. succeeded=True grows it by 1/concurrency, i.e. about
+        one slot per full window of successful requests. Any other failure (400, auth,
+        5xx, a cancelled call) says nothing about our rate, so it leaves it alone.
+        """
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+            elif succeeded:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._cond.notify_all()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_limiter(provider, **kwargs):
+    """Set quotas for a provider, e.g. configure_limiter("anthropic", requests_per_minute=50)."""
+    with _limiters_lock:
+        _limiters[provider] = ProviderLimiter(**kwargs)
+        return _limiters[provider]
+
+
+def get_limiter(provider):
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = ProviderLimiter()
+        return limiter
+
+
+def error_status(error):
+    """HTTP-ish status code of an SDK exception, if it has one."""
+    for attr in ("status_code", "code"):
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_throttle(error):
+    return error_status(error) in THROTTLE_STATUS
+
+
+def is_retryable(error):
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # no status: connection errors and timeouts are worth another try, anything else isn't
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait, from a Retry-After header."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff, but never shorter than what the provider asked for."""
+    delay = _jitter.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    asked = retry_after(error) if error is not None else None
+    return max(delay, asked or 0.0)
+
+
+def estimate_request_tokens(messages, system=None, max_tokens=0):
+    """Rough tokens/min cost of a request before we know the real usage (~4 chars per token)."""
+    chars = sum(len(m["content"]) for m in messages) + len(system or "")
+    return chars // 4 + max_tokens
@@ -0,0 +1,33 @@
+"""
+Model name -> agent class.
+
+Real models ("claude-...", "gemini-...") are plain Agents; the local scripted agents
+are registered under "scripted/<kind>". Anything that builds agents from a spec
+(the tournament scheduler, the benchmarks) goes through create_agent, so a spec can
+swap a real model for a scripted one by changing the model string.
+"""
+from agents.agents import Agent
+from agents.scripted import (GreedyNegotiator, ReplayAgent, ReservationNegotiator, TitForTatNegotiator,
+                             TriviaOracle)
+
+AGENT_REGISTRY = {
+    "scripted/greedy-negotiator": GreedyNegotiator,
+    "scripted/tit-for-tat": TitForTatNegotiator,
+    "scripted/reservation": ReservationNegotiator,
+    "scripted/trivia-oracle": TriviaOracle,
+    "scripted/replay": ReplayAgent,
+}
+
+
+def register_agent(model, agent_cls):
+    """Make agent_cls(name, model, model_config) the agent for this model name."""
+    AGENT_REGISTRY[model] = agent_cls
+
+
+def create_agent(name, model, model_config=None, **kwargs):
+    agent_cls = AGENT_REGISTRY.get(model)
+    if agent_cls is None:
+        if model.startswith("scripted/"):
+            raise ValueError(f"unknown scripted agent {model}, have: {', '.join(AGENT_REGISTRY)}")
+        return Agent(name, model=model, model_config=model_config, **kwargs)
+    return agent_cls(name, model, model_config, **kwargs)
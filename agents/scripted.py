@@ -0,0 +1,248 @@
+"""
+Local agents that never call an API: heuristic negotiators, a trivia oracle with
+tunable accuracy, and a ReplayAgent that plays back a logged match.
+
+They are for driving the engine and the scheduler at volume (load and capacity
+testing, smoke tests) without network access. They only see what an LLM would see,
+the observation text, and pull what they need out of it with the regexes below.
+Use them like any model, through the registry:
+
+    {"name": "Greedy", "model": "scripted/greedy-negotiator"}
+    {"name": "Oracle", "model": "scripted/trivia-oracle",
+     "model_config": {"answers": {"What is 2+2?": "4"}, "accuracy": 0.8, "seed": 1}}
+    {"name": "Replay", "model": "scripted/replay", "model_config": {"log": "logs/....jsonl", "seat": 0}}
+"""
+import random
+import re
+from abc import ABC, abstractmethod
+
+from agents.agents import Agent, AgentFailure
+from engine.match_log import read_events
+
+# NegotiationGame observations
+_MY_ITEM = re.compile(r"^- (.+?): worth \$(\d+) to you$", re.MULTILINE)
+_THEIR_ITEM = re.compile(r"^- (.+?): worth \$(\d+) to you \(they value it differently\)$", re.MULTILINE)
+_ROUND = re.compile(r"== NEGOTIATION ROUND (\d+) / (\d+)")
+_OPPONENT_SAYS = re.compile(r"^Opponent: (.*)$", re.MULTILINE)
+_PROPOSAL = re.compile(r"PROPOSE:\s*I give (.+?) for (?:your )?(.+?)(?: - .*)?$", re.IGNORECASE)
+_STRUCTURED = "Reply with a single JSON object"
+_REPAIR = "Your last reply could not be used"
+
+# TriviaDuel observations
+_QUESTION = re.compile(r"Question: (.*?)\n\nYour answer:", re.DOTALL)
+
+
+class ScriptedAgent(Agent):
+    def __init__(self, name, model, model_config=None, **kwargs):
+        super().__init__(name, model=model, model_config=model_config, **kwargs)
+        self.provider = "scripted"
+
+    # no network, so no point in a worker thread either
+    async def aact(self, observation):
+        return self.act(observation)
+
+    async def aact_session(self, delta):
+        return self.act_session(delta)
+
+
+def _split_items(text):
+    return [item.strip().title() for item in re.split(r",|\sand\s", text) if item.strip()]
+
+
+class Negotiator(ScriptedAgent, ABC):
+    """
+    Base for NegotiationGame heuristics. Subclasses decide, from my valuations and the
+    opponent's latest proposal, whether to accept and what to propose.
+
+    model_config:
+        margin: minimum gain (in my valuation) a trade needs before I accept it
+    """
+
+    def __init__(self, name, model, model_config=None, **kwargs):
+        super().__init__(name, model, model_config, **kwargs)
+        self.margin = self.model_config.get("margin", 1)
+
+    def act(self, observation):
+        if observation.startswith(_REPAIR):
+            # our moves are always well formed; an illegal one is best replaced by talking
+            return '{"action": "message", "message": "Let me think again."}'
+        mine = {m.group(1): int(m.group(2)) for m in _MY_ITEM.finditer(observation)}
+        theirs = {m.group(1): int(m.group(2)) for m in _THEIR_ITEM.finditer(observation)}
+        match = _ROUND.search(observation)
+        round_index, max_rounds = (int(match.group(1)), int(match.group(2))) if match else (0, 1)
+        said = _OPPONENT_SAYS.findall(observation)
+        last = said[-1] if said else None
+
+        offer = self._offer(last, mine, theirs)
+        move = self.decide(mine, theirs, offer, last, round_index, max_rounds)
+        return self._format(move, structured=_STRUCTURED in observation)
+
+    def _offer(self, message, mine, theirs):
+        """The opponent's proposal as (what I'd get, what I'd give, my gain), or None."""
+        if message is None:
+            return None
+        match = _PROPOSAL.search(message)
+        if not match:
+            return None
+        get, give = _split_items(match.group(1)), _split_items(match.group(2))
+        values = {**mine, **theirs}
+        gain = sum(values.get(item, 0) for item in get) - sum(values.get(item, 0) for item in give)
+        return get, give, gain
+
+    @staticmethod
+    def swaps(mine, theirs):
+        """Every one-for-one swap as (my item, their item, my gain), best for me first."""
+        options = [(give, get, theirs[get] - mine[give]) for give in mine for get in theirs]
+        return sorted(options, key=lambda s: (-s[2], s[0], s[1]))
+
+    @abstractmethod
+    def decide(self, mine, theirs, offer, last, round_index, max_rounds):
+        """
+        The next move: ("accept",), ("reject",), ("propose", give, get) or ("message", text).
+
+        Args:
+            mine / theirs: {item: value to me}
+            offer: the opponent's proposal as (what I'd get, what I'd give, my gain), or None
+            last: the opponent's last message, or None
+        """
+        pass
+
+    @staticmethod
+    def _format(move, structured):
+        kind = move[0]
+        if structured:
+            if kind == "propose":
+                give, get = move[1], move[2]
+                return f'{{"action": "propose", "give": ["{give}"], "get": ["{get}"]}}'
+            if kind == "message":
+                return f'{{"action": "message", "message": "{move[1]}"}}'
+            return f'{{"action": "{kind}"}}'
+        if kind == "propose":
+            return f"PROPOSE: I give {move[1]} for your {move[2]}"
+        if kind == "message":
+            return move[1]
+        return kind.upper()
+
+
+class GreedyNegotiator(Negotiator):
+    """Accept anything worth at least the margin, otherwise offer my worst item for their best."""
+
+    def decide(self, mine, theirs, offer, last, round_index, max_rounds):
+        if offer is not None and offer[2] >= self.margin:
+            return ("accept",)
+        if not mine or not theirs:
+            return ("message", "What do you have in mind?")
+        give, get, _ = self.swaps(mine, theirs)[0]
+        return ("propose", give, get)
+
+
+class TitForTatNegotiator(Negotiator):
+    """
+    Cooperate (accept any non-losing offer, propose the smallest swap that still helps
+    me) until the opponent rejects or lowballs me, then answer in kind (accept only
+    offers worth the margin, propose greedily) until it cooperates again.
+    """
+
+    def decide(self, mine, theirs, offer, last, round_index, max_rounds):
+        defect = last is not None and (last.strip().upper().startswith("REJECT")
+                                       or (offer is not None and offer[2] < 0))
+        threshold = self.margin if defect else 0
+        if offer is not None and offer[2] >= threshold:
+            return ("accept",)
+        if not mine or not theirs:
+            return ("message", "What do you have in mind?")
+        options = self.swaps(mine, theirs)
+        if not defect:
+            helpful = [s for s in options if s[2] > 0]
+            if helpful:
+                give, get, _ = helpful[-1]
+                return ("propose", give, get)
+        give, get, _ = options[0]
+        return ("propose", give, get)
+
+
+class ReservationNegotiator(Negotiator):
+    """
+    Never accept or propose anything below a reservation gain, and concede from my
+    best swap towards the reservation value as the rounds run out.
+
+    model_config:
+        reservation: lowest gain I'll take (default 2)
+    """
+
+    def __init__(self, name, model, model_config=None, **kwargs):
+        super().__init__(name, model, model_config, **kwargs)
+        self.reservation = self.model_config.get("reservation", 2)
+
+    def decide(self, mine, theirs, offer, last, round_index, max_rounds):
+        if offer is not None and offer[2] >= self.reservation:
+            return ("accept",)
+        acceptable = [s for s in self.swaps(mine, theirs) if s[2] >= self.reservation]
+        if not acceptable:
+            return ("reject",) if offer is not None else ("message", "I don't see a trade that works for me.")
+        step = min(len(acceptable) - 1, round_index * len(acceptable) // max(max_rounds, 1))
+        give, get, _ = acceptable[step]
+        return ("propose", give, get)
+
+
+class TriviaOracle(ScriptedAgent):
+    """
+    Answers correctly with probability accuracy, otherwise with a plausible wrong
+    answer: another question's answer, picked with its own RNG. Says it doesn't know
+    only when it has no answer to the question, or no other answer to give.
+
+    model_config:
+        answers: {question: answer}, or questions: [{"question", "answer"}, ...]
+        accuracy: chance of answering correctly (default 1.0)
+        seed: seed for its own RNG (the game's RNG is never touched)
+    """
+
+    def __init__(self, name, model, model_config=None, **kwargs):
+        super().__init__(name, model, model_config, **kwargs)
+        self.answers = dict(self.model_config.get("answers", {}))
+        for q in self.model_config.get("questions", []):
+            self.answers[q["question"]] = q["answer"]
+        self.accuracy = self.model_config.get("accuracy", 1.0)
+        self.rng = random.Random(self.model_config.get("seed"))
+
+    def act(self, observation):
+        match = _QUESTION.search(observation)
+        question = match.group(1).strip() if match else None
+        if question not in self.answers:
+            return "I don't know"
+        answer = self.answers[question]
+        if self.rng.random() < self.accuracy:
+            return answer
+        # sorted, so the same seed gives the same wrong answers however the answers were loaded
+        wrong = sorted({str(a) for a in self.answers.values()
+                        if str(a).strip().lower() != str(answer).strip().lower()})
+        return self.rng.choice(wrong) if wrong else "I don't know"
+
+
+class ReplayAgent(ScriptedAgent):
+    """
+    Plays one seat of a logged match back, move for move (including any structured
+    action repairs). Runs out after the logged turns, with an AgentFailure.
+
+    model_config:
+        log: the match's .jsonl log
+        seat: which agent of that match to replay (default 0)
+    """
+
+    def __init__(self, name, model, model_config=None, **kwargs):
+        super().__init__(name, model, model_config, **kwargs)
+        seat = self.model_config.get("seat", 0)
+        self.moves = []
+        for event in read_events(self.model_config["log"]):
+            if event["type"] == "turn" and event["agent"] == seat:
+                self.moves.append(event["action"])
+                if event.get("repair"):
+                    self.moves.append(event["repair"]["reply"])
+        self.position = 0
+
+    def act(self, observation):
+        if self.position >= len(self.moves):
+            return AgentFailure(self.provider, self.model, "replay log exhausted", attempts=1, retryable=False)
+        move = self.moves[self.position]
+        self.position += 1
+        return move
@@ -0,0 +1,278 @@
+"""
+SQLite index over a directory of match logs.
+
+Answering "win rate of model X on seeds 1-100" shouldn't mean parsing every log, so
+LogIndex keeps what those questions need in {log_dir}/index.db:
+
+    matches       one row per match: id, timestamp, task, seed, rounds, finished/failed
+    match_agents  one row per seat: name, model, score (gain for negotiation), points
+    turns         one row per turn: latency and token counts when the log has them
+
+update() is incremental: it only stats the directory and (re)reads logs that are new
+or changed since the last update, so it's cheap to call before every query.
+
+    python -m engine.log_index logs win-rate --model claude-3-5-sonnet-20241022 --seeds 1:100
+    python -m engine.log_index logs sql "SELECT task, COUNT(*) FROM matches GROUP BY task"
+"""
+import argparse
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from engine.match_log import decode_state, is_match_log, read_events
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, match_id TEXT
+);
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY, file TEXT NOT NULL, timestamp TEXT, task TEXT, seed INTEGER,
+    session INTEGER, rounds INTEGER, finished INTEGER NOT NULL, failed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS match_agents (
+    match_id TEXT NOT NULL, seat INTEGER NOT NULL, name TEXT, model TEXT,
+    score REAL, score_json TEXT, points REAL,
+    PRIMARY KEY (match_id, seat)
+);
+CREATE TABLE IF NOT EXISTS turns (
+    match_id TEXT NOT NULL, round INTEGER NOT NULL, seat INTEGER NOT NULL,
+    latency_ms REAL, input_tokens INTEGER, output_tokens INTEGER, action_chars INTEGER
+);
+CREATE INDEX IF NOT EXISTS matches_task ON matches (task);
+CREATE INDEX IF NOT EXISTS matches_seed ON matches (seed);
+CREATE INDEX IF NOT EXISTS matches_timestamp ON matches (timestamp);
+CREATE INDEX IF NOT EXISTS match_agents_model ON match_agents (model);
+CREATE INDEX IF NOT EXISTS match_agents_name ON match_agents (name);
+CREATE INDEX IF NOT EXISTS turns_match ON turns (match_id);
+"""
+
+
+def _score_value(score):
+    # negotiation and coding battle scores are dicts; gain / score is what decides the match
+    if isinstance(score, dict):
+        return score.get("gain", score.get("score"))
+    return score
+
+
+def _points(values):
+    """1 for the single best score, 0.5 each for a shared best, 0 otherwise."""
+    best = max(values)
+    winners = sum(1 for v in values if v == best)
+    return [(1.0 if winners == 1 else 0.5) if v == best else 0.0 for v in values]
+
+
+class LogIndex:
+    def __init__(self, log_dir="logs", db_path=None):
+        self.log_dir = Path(log_dir)
+        self.db_path = str(db_path or self.log_dir / "index.db")
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def update(self):
+        """
+        Index new and changed logs, forget deleted ones.
+
+        Returns:
+            number of log files (re)read
+        """
+        known = {name: (size, mtime, match_id) for name, size, mtime, match_id
+                 in self._conn.execute("SELECT name, size, mtime_ns, match_id FROM files")}
+        seen = set()
+        changed = []
+        with os.scandir(self.log_dir) as entries:
+            for entry in entries:
+                if not is_match_log(entry.name) or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                previous = known.get(entry.name)
+                if previous is None or previous[:2] != (stat.st_size, stat.st_mtime_ns):
+                    changed.append((entry.name, stat.st_size, stat.st_mtime_ns))
+
+        with self._conn:
+            for name in known.keys() - seen:
+                self._forget(known[name][2])
+                self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+            for name, size, mtime in changed:
+                if name in known:
+                    self._forget(known[name][2])
+                match_id = self._ingest(name)
+                self._conn.execute("INSERT OR REPLACE INTO files (name, size, mtime_ns, match_id) VALUES (?, ?, ?, ?)",
+                                   (name, size, mtime, match_id))
+        return len(changed)
+
+    def _forget(self, match_id):
+        for table in ("matches", "match_agents", "turns"):
+            self._conn.execute(f"DELETE FROM {table} WHERE match_id = ?", (match_id,))
+
+    def _ingest(self, name):
+        header = None
+        end = None
+        failed = False
+        rounds = 0
+        turns = []
+        # nothing here needs observations or states, so compact logs stay compact
+        for event in read_events(self.log_dir / name, expand=False):
+            kind = event.get("type")
+            if kind == "match":
+                header = event
+            elif kind == "turn":
+                turns.append((event["round"], event["agent"], event.get("latency_ms"),
+                              event.get("input_tokens"), event.get("output_tokens"), len(event.get("action", ""))))
+                rounds = max(rounds, event["round"] + 1)
+            elif kind == "failure":
+                failed = True
+            elif kind == "end":
+                end = event
+        if header is None:
+            return None
+
+        match_id = header["match_id"]
+        # a resumed match writes more turns into the same file; start over for this match
+        self._forget(match_id)
+        self._conn.execute(
+            "INSERT INTO matches (match_id, file, timestamp, task, seed, session, rounds, finished, failed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (match_id, name, header.get("timestamp"), header.get("task"), header.get("seed"),
+             int(bool(header.get("session"))), rounds, int(end is not None), int(failed and end is None))
+        )
+
+        seats = header.get("agents", [])
+        scores = decode_state(end["scores"]) if end is not None else {}
+        values = [_score_value(scores.get(seat["id"], scores.get(str(seat["id"])))) for seat in seats]
+        points = _points(values) if end is not None and seats and None not in values else [None] * len(seats)
+        self._conn.executemany(
+            "INSERT INTO match_agents (match_id, seat, name, model, score, score_json, points) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(match_id, seat["id"], seat.get("name"), seat.get("model"), value,
+              None if end is None else json.dumps(scores.get(seat["id"])), pts)
+             for seat, value, pts in zip(seats, values, points)]
+        )
+        self._conn.executemany(
+            "INSERT INTO turns (match_id, round, seat, latency_ms, input_tokens, output_tokens, action_chars) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(match_id, *turn) for turn in turns]
+        )
+        return match_id
+
+    def _filters(self, model=None, agent=None, task=None, seeds=None, since=None, until=None):
+        clauses, params = ["m.finished = 1"], []
+        if model is not None:
+            clauses.append("a.model = ?")
+            params.append(model)
+        if agent is not None:
+            clauses.append("a.name = ?")
+            params.append(agent)
+        if task is not None:
+            clauses.append("m.task = ?")
+            params.append(task)
+        if seeds is not None:
+            clauses.append("m.seed BETWEEN ? AND ?")
+            params += list(seeds)
+        if since is not None:
+            clauses.append("m.timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("m.timestamp <= ?")
+            params.append(until)
+        return " AND ".join(clauses), params
+
+    def win_rate(self, **filters):
+        """
+        Record of the seats matching the filters, over finished matches.
+
+        Args (all optional):
+            model / agent: model id or agent name of the seat
+            task: task class name
+            seeds: (low, high) inclusive seed range
+            since / until: timestamps in the log format, e.g. "20250101_000000"
+
+        Returns:
+            {"matches", "wins", "ties", "losses", "win_rate"}; ties count half
+        """
+        where, params = self._filters(**filters)
+        matches, wins, ties, losses = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(a.points = 1), 0), COALESCE(SUM(a.points = 0.5), 0), "
+            "COALESCE(SUM(a.points = 0), 0) "
+            f"FROM match_agents a JOIN matches m USING (match_id) WHERE {where}",
+            params
+        ).fetchone()
+        return {"matches": matches, "wins": wins, "ties": ties, "losses": losses,
+                "win_rate": (wins + 0.5 * ties) / matches if matches else None}
+
+    def matches(self, **filters):
+        """Finished matches (one row per matching seat), newest first. Same filters as win_rate."""
+        where, params = self._filters(**filters)
+        cursor = self._conn.execute(
+            "SELECT m.match_id, m.timestamp, m.task, m.seed, a.seat, a.name, a.model, a.score, a.points "
+            f"FROM match_agents a JOIN matches m USING (match_id) WHERE {where} ORDER BY m.timestamp DESC",
+            params
+        )
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def turn_stats(self, **filters):
+        """Turn count, mean latency and token totals for the seats matching the filters."""
+        where, params = self._filters(**filters)
+        turns, latency, input_tokens, output_tokens = self._conn.execute(
+            "SELECT COUNT(*), AVG(t.latency_ms), SUM(t.input_tokens), SUM(t.output_tokens) "
+            "FROM turns t JOIN match_agents a ON a.match_id = t.match_id AND a.seat = t.seat "
+            f"JOIN matches m ON m.match_id = t.match_id WHERE {where}",
+            params
+        ).fetchone()
+        return {"turns": turns, "mean_latency_ms": latency,
+                "input_tokens": input_tokens, "output_tokens": output_tokens}
+
+    def query(self, sql, params=()):
+        return self._conn.execute(sql, params).fetchall()
+
+
+def _seed_range(text):
+    low, _, high = text.partition(":")
+    return int(low), int(high or low)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index and query a directory of match logs")
+    parser.add_argument("log_dir", nargs="?", default="logs")
+    parser.add_argument("--db", help="index file (default: <log_dir>/index.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("update", help="index new and changed logs")
+    for name in ("win-rate", "matches", "turns"):
+        command = commands.add_parser(name)
+        command.add_argument("--model")
+        command.add_argument("--agent")
+        command.add_argument("--task")
+        command.add_argument("--seeds", type=_seed_range, help="low:high, inclusive")
+        command.add_argument("--since")
+        command.add_argument("--until")
+    sql = commands.add_parser("sql", help="run a query against the index")
+    sql.add_argument("query")
+    args = parser.parse_args()
+
+    index = LogIndex(args.log_dir, args.db)
+    updated = index.update()
+    if args.command == "update":
+        print(f"Indexed {updated} new or changed logs into {index.db_path}")
+    elif args.command == "sql":
+        for row in index.query(args.query):
+            print("\t".join(str(v) for v in row))
+    else:
+        filters = {key: getattr(args, key) for key in ("model", "agent", "task", "seeds", "since", "until")}
+        if args.command == "win-rate":
+            print(index.win_rate(**filters))
+        elif args.command == "turns":
+            print(index.turn_stats(**filters))
+        else:
+            for row in index.matches(**filters):
+                print(row)
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""
+Append-only JSONL match logs.
+
+A match log is one JSON object per line, written as the match happens:
+
+    {"type": "match", "match_id": ..., "timestamp": ..., "task": ..., "agents": [...], "seed": ...}
+    {"type": "session", "agent": 0, "prefix": "..."}          (session mode only)
+    {"type": "turn", "round": 0, "agent": 0, "observation": "...", "action": "...", "latency_ms": 812.4,
+     "input_tokens": 1200, "output_tokens": 40, "retries": 0, "cost_usd": 0.0042}
+    {"type": "turn", "round": 0, "agent": 1, "observation": "...", "action": "...", "latency_ms": 640.0}
+    {"type": "checkpoint", "round": 1, "state": {...}}
+    ...
+    {"type": "end", "scores": {...}, "final_state": {...}, "telemetry": [...]}
+
+Every turn is written as soon as the agent answers, so a crash mid-match only loses
+the round in progress, and nothing has to keep the whole transcript in memory.
+The checkpoint after every task.step is what resume_match restarts from.
+Turns carry whatever call telemetry the agent's reply had (see AgentResponse), and
+the end event the per-seat totals (see engine.telemetry).
+
+Compact logs (MatchLogWriter(compact=True), header "compact": true) don't repeat
+themselves. NegotiationGame shows every agent its inventory, the instructions and the
+whole conversation on every turn, and checkpoints carry the whole conversation again,
+so a plain log grows with the square of the number of rounds. In a compact log:
+
+    turn        "obs_delta" instead of "observation": line diff against the same agent's
+                previous observation, [i, j] = copy its lines i..j-1, "text" = new lines
+    checkpoint  "state_delta" instead of "state": {"set": {key: value}, "append":
+                {key: items added to a list}, "del": [keys]} against the previous checkpoint
+    end         "final_state_delta" against the last checkpoint
+
+read_events puts the full observations and states back together while reading (pass
+expand=False to skip that when they aren't needed). A log named .jsonl.gz or .jsonl.xz
+is compressed; gzip logs are still flushed every round, lzma ones only on close.
+"""
+import difflib
+import gzip
+import json
+import lzma
+import os
+import random
+from collections.abc import Mapping
+
+from tasks.tasks import MatchRandom
+
+
+# compression -> log file suffix
+LOG_SUFFIXES = {None: ".jsonl", "gzip": ".jsonl.gz", "lzma": ".jsonl.xz"}
+
+
+def dumps(event):
+    # compact encoding: logs are for machines, the readable log is for people
+    return json.dumps(event, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def is_match_log(name):
+    return str(name).endswith(tuple(LOG_SUFFIXES.values()))
+
+
+def _compression(path):
+    for compression, suffix in LOG_SUFFIXES.items():
+        if compression is not None and str(path).endswith(suffix):
+            return compression
+    return None
+
+
+def _open(path, mode, buffer_size=-1):
+    compression = _compression(path)
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if compression == "lzma":
+        return lzma.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, buffering=buffer_size, encoding="utf-8")
+
+
+class MatchLogWriter:
+    def __init__(self, path, buffer_size=64 * 1024, fsync=False, append=False, compact=False):
+        """
+        Args:
+            path: log file to create (or to continue, with append=True); .jsonl.gz and
+                  .jsonl.xz are compressed
+            buffer_size: bytes buffered before hitting the disk
+            fsync: also fsync at the end of every round, so a machine crash
+                   (not just a process crash) can't lose a finished round
+            append: add to an existing log instead of starting a new one
+            compact: write observations and states as deltas (see the module docstring)
+        """
+        self.path = path
+        self.fsync = fsync
+        self.compact = compact
+        self.bytes_written = 0
+        # delta bases: every agent's last observation (as lines) and the last checkpointed state
+        self._observations = {}
+        self._state = None
+        if append:
+            self._continue(path)
+        self._file = _open(path, "a" if append else "w", buffer_size)
+
+    def _continue(self, path):
+        _drop_partial_line(path)
+        if not self.compact:
+            return
+        for event in read_events(path):
+            if event["type"] == "turn":
+                self._observations[event["agent"]] = event["observation"].split("\n")
+            elif event["type"] == "checkpoint":
+                self._state = event["state"]
+
+    def write(self, event):
+        if self.compact:
+            event = self._compact(event)
+        line = dumps(event) + "\n"
+        self._file.write(line)
+        self.bytes_written += len(line)
+
+    def _compact(self, event):
+        kind = event.get("type")
+        if kind == "turn" and "observation" in event:
+            lines = event["observation"].split("\n")
+            previous = self._observations.get(event["agent"])
+            self._observations[event["agent"]] = lines
+            if previous is not None:
+                ops, new_chars = diff_lines(previous, lines)
+                # a delta that is mostly new text (a fresh trivia question) isn't worth it
+                if new_chars < len(event["observation"]) // 2:
+                    return _replace(event, "observation", "obs_delta", ops)
+        elif kind == "checkpoint":
+            previous, self._state = self._state, event["state"]
+            if previous is not None:
+                return _replace(event, "state", "state_delta", state_delta(previous, event["state"]))
+        elif kind == "end" and self._state is not None:
+            return _replace(event, "final_state", "final_state_delta", state_delta(self._state, event["final_state"]))
+        return event
+
+    def end_round(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.end_round()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _drop_partial_line(path):
+    # a crash can leave half a line at the end of the file; cut it off before appending
+    if _compression(path) is not None:
+        # a compressed stream can't be cut at a line; write the complete lines out again
+        lines, clean = _complete_lines(path)
+        if not clean:
+            # same suffix, so it gets the same compression
+            tmp = os.path.join(os.path.dirname(path), f".tmp_{os.path.basename(path)}")
+            with _open(tmp, "w") as f:
+                f.writelines(lines)
+            os.replace(tmp, path)
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+
+def _complete_lines(path):
+    """(complete lines, whether the file ended cleanly) of a compressed log."""
+    lines, clean = [], True
+    try:
+        with _open(path, "r") as f:
+            lines.extend(f)
+    except EOFError:
+        clean = False
+    if lines and not lines[-1].endswith("\n"):
+        lines.pop()
+        clean = False
+    return lines, clean
+
+
+def _read_lines(path):
+    """Complete lines of a log; a half-written last line or a cut off compressed stream (crash) ends it."""
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                yield line
+        except EOFError:
+            return
+
+
+def _replace(event, old_key, new_key, value):
+    # same key order, so compact and expanded events look alike
+    return {(new_key if k == old_key else k): (value if k == old_key else v) for k, v in event.items()}
+
+
+def diff_lines(old, new):
+    """
+    Line diff of new against old.
+
+    Returns:
+        (ops, characters of new text in them); ops are [i, j] (old[i:j]) or a string
+        (new lines joined with newlines)
+    """
+    if old == new:
+        return [[0, len(old)]], 0
+    ops, new_chars = [], 0
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            text = "\n".join(new[j1:j2])
+            ops.append(text)
+            new_chars += len(text)
+    return ops, new_chars
+
+
+def apply_lines(old, ops):
+    """Inverse of diff_lines: the new lines."""
+    lines = []
+    for op in ops:
+        if isinstance(op, str):
+            lines.extend(op.split("\n"))
+        else:
+            lines.extend(old[op[0]:op[1]])
+    return lines
+
+
+def state_delta(old, new):
+    """Top-level difference between two encoded states; lists that only grew store the new items."""
+    delta = {"set": {}, "append": {}, "del": [key for key in old if key not in new]}
+    for key, value in new.items():
+        if key not in old:
+            delta["set"][key] = value
+            continue
+        previous = old[key]
+        if previous == value:
+            continue
+        if (isinstance(previous, list) and isinstance(value, list) and len(value) > len(previous)
+                and value[:len(previous)] == previous):
+            delta["append"][key] = value[len(previous):]
+        else:
+            delta["set"][key] = value
+    return {k: v for k, v in delta.items() if v}
+
+
+def apply_state_delta(old, delta):
+    """Inverse of state_delta. Makes a new dict; old is left alone."""
+    state = {k: v for k, v in old.items() if k not in delta.get("del", ())}
+    state.update(delta.get("set", {}))
+    for key, items in delta.get("append", {}).items():
+        state[key] = state[key] + items
+    return state
+
+
+def encode_state(obj):
+    """
+    Make task state JSON safe without losing information: task states use int agent
+    ids as dict keys and keep their RNG in state["rng"], and JSON would turn those into
+    string keys and lists (or nothing at all).
+    """
+    if isinstance(obj, random.Random):
+        return {"__rng__": encode_state(obj.getstate())}
+    if isinstance(obj, dict):
+        if obj and all(isinstance(k, int) for k in obj):
+            return {"__int_keys__": {str(k): encode_state(v) for k, v in obj.items()}}
+        return {k: encode_state(v) for k, v in obj.items()}
+    if isinstance(obj, tuple):
+        return {"__tuple__": [encode_state(v) for v in obj]}
+    if isinstance(obj, list):
+        return [encode_state(v) for v in obj]
+    return obj
+
+
+def decode_state(obj):
+    """Inverse of encode_state."""
+    if isinstance(obj, dict):
+        if "__int_keys__" in obj:
+            return {int(k): decode_state(v) for k, v in obj["__int_keys__"].items()}
+        if "__tuple__" in obj:
+            return tuple(decode_state(v) for v in obj["__tuple__"])
+        if "__rng__" in obj:
+            rng = MatchRandom()
+            rng.setstate(decode_state(obj["__rng__"]))
+            return rng
+        return {k: decode_state(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [decode_state(v) for v in obj]
+    return obj
+
+
+def read_events(path, expand=True):
+    """
+    Yield the events of a match log in order. A half-written last line (crash) is skipped.
+
+    Args:
+        expand: rebuild the full observations and states of a compact log; without it
+                compact events come back as written (obs_delta, state_delta, ...)
+    """
+    compact = False
+    observations = {}
+    state = None
+    for line in _read_lines(path):
+        event = json.loads(line)
+        kind = event.get("type")
+        if kind == "match":
+            compact = expand and event.get("compact", False)
+        elif not compact:
+            pass
+        elif kind == "turn":
+            if "obs_delta" in event:
+                lines = apply_lines(observations[event["agent"]], event["obs_delta"])
+                event = _replace(event, "obs_delta", "observation", "\n".join(lines))
+            else:
+                lines = event["observation"].split("\n")
+            observations[event["agent"]] = lines
+        elif kind == "checkpoint":
+            if "state_delta" in event:
+                event = _replace(event, "state_delta", "state", apply_state_delta(state, event["state_delta"]))
+            state = event["state"]
+        elif kind == "end" and "final_state_delta" in event:
+            event = _replace(event, "final_state_delta", "final_state", apply_state_delta(state, event["final_state_delta"]))
+        yield event
+
+
+class MatchResult(Mapping):
+    """
+    What run_match returns. Behaves like the old result dict, but the transcript
+    is only read back from the log file if someone actually asks for it.
+    """
+
+    def __init__(self, log_path, header, scores, final_state, telemetry=None):
+        self.log_path = log_path
+        self._data = {
+            "match_id": header["match_id"],
+            "timestamp": header["timestamp"],
+            "task": header["task"],
+            "agents": header["agents"],
+            "seed": header["seed"],
+            "scores": scores,
+            "final_state": final_state,
+            "telemetry": telemetry,
+        }
+        self._transcript = None
+
+    @property
+    def transcript(self):
+        if self._transcript is None:
+            self._transcript = list(self.iter_transcript())
+        return self._transcript
+
+    def iter_transcript(self):
+        """Stream transcript entries from the log without keeping them around."""
+        for event in read_events(self.log_path):
+            if event["type"] == "turn":
+                yield {k: v for k, v in event.items() if k != "type"}
+
+    def __getitem__(self, key):
+        if key == "transcript":
+            return self.transcript
+        return self._data[key]
+
+    def __iter__(self):
+        yield from self._data
+        yield "transcript"
+
+    def __len__(self):
+        return len(self._data) + 1
+
+    def to_dict(self):
+        return dict(self)
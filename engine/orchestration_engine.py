@@ -1,117 +1,438 @@
-import json
+import asyncio
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
+from agents.agents import AgentFailure, AgentResponse
+from engine.match_log import LOG_SUFFIXES, MatchLogWriter, MatchResult, decode_state, encode_state, read_events
+from engine.render_log import write_readable
+from engine.telemetry import MatchTelemetry
+from tasks.actions import InvalidAction
 
-def run_match(task, agents, seed=42, log_dir = "logs"):
+class AgentCallFailed(Exception):
+    """
+    An agent's provider call failed for good. The match stops instead of feeding the
+    error to the game as a move; its log is left resumable with resume_match.
+    """
+
+    def __init__(self, agentId, failure):
+        super().__init__(f"agent {agentId}: {failure!r}")
+        self.agentId = agentId
+        self.failure = failure
+
+
+# match ids that have been handed out in this process but may not be on disk yet.
+# concurrent matches between the same agents can start in the same second.
+_reserved_match_ids = set()
+_match_id_lock = threading.Lock()
+# base match id -> next suffix to try
+_next_suffix = {}
+
+
+def run_match(task, agents, seed=42, log_dir = "logs", fsync=False, session=False, compact=False, compression=None,
+              readable=False):
     """
      Run a match between agents and log the results.
 
+     Every turn is appended to {log_dir}/{match_id}.jsonl as soon as it happens
+     (.jsonl.gz / .jsonl.xz with compression).
+
      Args:
          task: Task instance
          agents: List of Agent instances
          seed: Random seed for reproducibility
          log_dir: Directory to save match logs
+         fsync: fsync the log after every round
+         session: play in session mode if the task supports it: each agent gets the
+                  task's stable prefix once and then only per-turn deltas
+         compact: write a compact log, observations and states as deltas (see engine.match_log)
+         compression: None, "gzip" or "lzma" (the log is then .jsonl.gz / .jsonl.xz)
+         readable: also write {match_id}_readable.txt. Off by default: render any log
+                   when you need it with python -m engine.render_log
 
      """
-    # create log directory if it doesn't exist
-    Path(log_dir).mkdir(exist_ok=True)
+    session = session and task.supports_sessions
+    header, log = _start_match(task, agents, seed, log_dir, fsync, session, compact, compression)
+    telemetry = MatchTelemetry(len(agents))
+    try:
+        # initialize match
+        state = task.init(seed)
+        if session:
+            _start_sessions(task, agents, state, log)
+        state = _play(task, agents, state, log, telemetry, session=session)
+        return _finish_match(task, header, log, state, telemetry, readable)
+    finally:
+        _release_match(header, log)
 
-    # generate match id
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    task_name = task.__class__.__name__
-    agent_names = "_vs_".join([agent.name for agent in agents])
-    match_id = f"{timestamp}_{task_name}_{agent_names}"
 
-    # initialize match
-    state = task.init(seed)
-    transcript = []
+def resume_match(log_path, task, agents, fsync=False):
+    """
+    Continue a match that died part way through, from its JSONL log.
+
+    The task state, RNG included, comes from the last checkpoint in the log. Turns
+    that were already logged for the unfinished round are reused, so no agent is
+    asked the same thing twice.
+
+    Args:
+        log_path: the match's .jsonl log
+        task: Task instance configured like the original one
+        agents: the same agents, in the same seats
+
+    Returns:
+        the match result, like run_match
+    """
+    events = list(read_events(log_path))
+    header = events[0]
+    if len(agents) != len(header["agents"]):
+        raise ValueError(f"log has {len(header['agents'])} agents, got {len(agents)}")
+
+    checkpoint = None
+    pending = {}
+    # session mode: each agent's prefix and its (delta, reply) turns so far
+    prefixes = {}
+    session_turns = {agentId: [] for agentId in range(len(agents))}
+    telemetry = MatchTelemetry(len(agents))
+    for event in events:
+        if event["type"] == "checkpoint":
+            checkpoint = event
+            pending = {}
+        elif event["type"] == "session":
+            prefixes[event["agent"]] = event["prefix"]
+        elif event["type"] == "turn":
+            pending[event["agent"]] = event.get("parsed", event["action"])
+            session_turns[event["agent"]].append((event["observation"], event["action"]))
+            repair = event.get("repair") or {}
+            if "prompt" in repair and "reply" in repair:
+                session_turns[event["agent"]].append((repair["prompt"], repair["reply"]))
+            telemetry.record(event)
+        elif event["type"] == "failure":
+            telemetry.record(event)
+        elif event["type"] == "end":
+            print(f"Match already finished: {log_path}")
+            return MatchResult(log_path, header, decode_state(event["scores"]), decode_state(event["final_state"]),
+                               event.get("telemetry"))
+
+    if checkpoint is None:
+        # died during the first round; init is deterministic given the seed
+        state = task.init(header["seed"])
+    else:
+        # older logs also have the global RNG's state under "rng"; tasks don't use it anymore
+        state = decode_state(checkpoint["state"])
 
+    session = header.get("session", False)
+    log = MatchLogWriter(log_path, fsync=fsync, append=True, compact=header.get("compact", False))
+    if session:
+        # rebuild every agent's conversation from the log instead of replaying it
+        for agentId, agent in enumerate(agents):
+            if agentId not in prefixes:
+                prefixes[agentId] = task.observe_prefix(state, agentId)
+                log.write({"type": "session", "agent": agentId, "prefix": prefixes[agentId]})
+            agent.start_session(prefixes[agentId])
+            for delta, reply in session_turns[agentId]:
+                agent.session["messages"] += [{"role": "user", "content": delta},
+                                              {"role": "assistant", "content": reply}]
+    try:
+        state = _play(task, agents, state, log, telemetry, pending=pending, session=session)
+        return _finish_match(task, header, log, state, telemetry)
+    finally:
+        log.close()
+
+
+def _play(task, agents, state, log, telemetry, pending=None, session=False):
+    """Play rounds until the task says it's done. pending = actions already logged for this round."""
+    pending = pending or {}
     while not state.get("done", False):
         actions = {}
         for agentId, agent in enumerate(agents):
-            obs = task.observe(state, agentId)
-            action = agent.act(obs)
-            actions[agentId] = action
-            transcript.append({
+            if agentId in pending:
+                actions[agentId] = pending[agentId]
+                continue
+            obs = task.observe_delta(state, agentId) if session else task.observe(state, agentId)
+            start = time.perf_counter()
+            action = agent.act_session(obs) if session else agent.act(obs)
+            latency = time.perf_counter() - start
+            _check_action(log, state, agentId, action)
+            move, extra = _structured_move(task, state, agentId, action)
+            if extra.get("repair") is not None:
+                # in session mode the repair is part of the agent's conversation, so the
+                # move that was actually played shows up in its history
+                prompt = extra["repair"]["prompt"]
+                repaired = agent.act_session(prompt) if session else agent.act(prompt)
+                _check_action(log, state, agentId, repaired)
+                move, extra = _repaired_move(task, state, agentId, action, extra, repaired)
+            actions[agentId] = move
+            _log_turn(log, telemetry, {
+                "type": "turn",
                 "round": state.get("round", 0),
                 "agent": agentId,
                 "observation": obs,
-                "action": action
+                "action": action,
+                "latency_ms": round(latency * 1000, 1),
+                **_telemetry(action),
+                **extra
             })
+        pending = {}
         state = task.step(state, actions)
+        _checkpoint(log, state)
+    return state
 
-    scores = task.score(state)
 
-    # prepare result
-    result = {
+async def arun_match(task, agents, seed=42, log_dir="logs", fsync=False, session=False, compact=False,
+                     compression=None, readable=False):
+    """
+    Async version of run_match. All agents in a round are queried at once, so a
+    round takes as long as the slowest agent instead of the sum of all of them.
+
+    Args:
+        task: Task instance
+        agents: List of Agent instances (must support aact)
+        seed: Random seed for reproducibility
+        log_dir: Directory to save match logs
+        fsync: fsync the log after every round
+        session: play in session mode if the task supports it (see run_match)
+        compact, compression, readable: log format (see run_match)
+    """
+    session = session and task.supports_sessions
+    header, log = _start_match(task, agents, seed, log_dir, fsync, session, compact, compression)
+    telemetry = MatchTelemetry(len(agents))
+    try:
+        state = task.init(seed)
+        if session:
+            _start_sessions(task, agents, state, log)
+
+        while not state.get("done", False):
+            if session:
+                observations = {agentId: task.observe_delta(state, agentId) for agentId in range(len(agents))}
+                calls = [agent.aact_session(observations[agentId]) for agentId, agent in enumerate(agents)]
+            else:
+                observations = {agentId: task.observe(state, agentId) for agentId in range(len(agents))}
+                calls = [agent.aact(observations[agentId]) for agentId, agent in enumerate(agents)]
+            replies = await asyncio.gather(*(_timed(call) for call in calls))
+            actions, extras, failures = {}, {}, {}
+            for agentId, (action, latency) in enumerate(replies):
+                if isinstance(action, AgentFailure):
+                    failures[agentId] = action
+                    continue
+                actions[agentId], extras[agentId] = _structured_move(task, state, agentId, action)
+
+            # repairs for malformed replies go out together too
+            broken = [agentId for agentId, extra in extras.items() if extra.get("repair") is not None]
+            repair_calls = [agents[agentId].aact_session(extras[agentId]["repair"]["prompt"]) if session
+                            else agents[agentId].aact(extras[agentId]["repair"]["prompt"]) for agentId in broken]
+            repairs = await asyncio.gather(*repair_calls)
+            for agentId, repaired in zip(broken, repairs):
+                if isinstance(repaired, AgentFailure):
+                    failures[agentId] = repaired
+                    del actions[agentId]
+                    continue
+                actions[agentId], extras[agentId] = _repaired_move(
+                    task, state, agentId, replies[agentId][0], extras[agentId], repaired)
+
+            # the replies that did come back are logged even if someone else failed,
+            # so resume_match doesn't pay for them a second time
+            for agentId in sorted(actions):
+                action, latency = replies[agentId]
+                _log_turn(log, telemetry, {
+                    "type": "turn",
+                    "round": state.get("round", 0),
+                    "agent": agentId,
+                    "observation": observations[agentId],
+                    "action": action,
+                    "latency_ms": round(latency * 1000, 1),
+                    **_telemetry(action),
+                    **extras[agentId]
+                })
+            for agentId in sorted(failures):
+                _check_action(log, state, agentId, failures[agentId])
+            state = task.step(state, actions)
+            _checkpoint(log, state)
+
+        return _finish_match(task, header, log, state, telemetry, readable)
+    finally:
+        _release_match(header, log)
+
+
+async def _timed(call):
+    start = time.perf_counter()
+    reply = await call
+    return reply, time.perf_counter() - start
+
+
+async def arun_matches(matches, log_dir="logs", max_concurrency=None, fsync=False, session=False, compact=False,
+                       compression=None, readable=False):
+    """
+    Run many matches on one event loop.
+
+    Args:
+        matches: iterable of (task, agents, seed) tuples
+        log_dir: Directory to save match logs
+        max_concurrency: cap on the number of matches in flight at once (None = no cap)
+        fsync, session, compact, compression, readable: passed on to every arun_match
+
+    Returns:
+        list of results, in the same order as matches
+    """
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+    options = {"log_dir": log_dir, "fsync": fsync, "session": session, "compact": compact,
+               "compression": compression, "readable": readable}
+
+    async def _run(task, agents, seed):
+        if semaphore is None:
+            return await arun_match(task, agents, seed=seed, **options)
+        async with semaphore:
+            return await arun_match(task, agents, seed=seed, **options)
+
+    return await asyncio.gather(*(_run(task, agents, seed) for task, agents, seed in matches))
+
+
+def _new_match_id(task, agents, log_dir):
+    # create log directory if it doesn't exist
+    Path(log_dir).mkdir(exist_ok=True)
+
+    # generate match id
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    task_name = task.__class__.__name__
+    agent_names = "_vs_".join([agent.name for agent in agents])
+    base_id = f"{timestamp}_{task_name}_{agent_names}"
+
+    with _match_id_lock:
+        # start after the last suffix handed out for this id, so thousands of matches
+        # in the same second don't probe every earlier suffix again
+        n = _next_suffix.get(base_id, 0)
+        match_id = f"{base_id}_{n}" if n else base_id
+        while match_id in _reserved_match_ids or _log_exists(log_dir, match_id):
+            n += 1
+            match_id = f"{base_id}_{n}"
+        if len(_next_suffix) >= 1024:
+            _next_suffix.clear()
+        _next_suffix[base_id] = n + 1
+        _reserved_match_ids.add(match_id)
+
+    return match_id, timestamp
+
+
+def _log_exists(log_dir, match_id):
+    return any((Path(log_dir) / f"{match_id}{suffix}").exists() for suffix in LOG_SUFFIXES.values())
+
+
+def _start_match(task, agents, seed, log_dir, fsync, session=False, compact=False, compression=None):
+    match_id, timestamp = _new_match_id(task, agents, log_dir)
+    header = {
+        "type": "match",
         "match_id": match_id,
         "timestamp": timestamp,
-        "task": task_name,
-        "agents": [{"id": i, "name": agent.name, "model": agent.model}
+        "task": task.__class__.__name__,
+        # enough to rebuild the task for re-scoring (engine/rescore.py)
+        "task_config": task.config(),
+        "agents": [{"id": i, "name": agent.name, "model": agent.model, "provider": getattr(agent, "provider", None)}
                    for i, agent in enumerate(agents)],
         "seed": seed,
-        "scores": scores,
-        "transcript": transcript,
-        "final_state": state
+        "session": session,
+        "compact": compact,
+        "log_dir": str(log_dir),
     }
-    # save to json
-    log_path = Path(log_dir) / f"{match_id}.json"
-    with open(log_path, 'w') as f:
-        json.dump(result, f, indent=2)
-
-    print(f"Match logged to: {log_path}")
-    # also save human-readable version
-    readable_path = Path(log_dir) / f"{match_id}_readable.txt"
-    with open(readable_path, 'w') as f:
-        _write_readable_log(f, result, task)
-
-    print(f"Readable log: {readable_path}")
-
-    return result
-
-
-def _write_readable_log(f, result, task):
-    """Write a human-readable version of the match log."""
-    f.write("=" * 80 + "\n")
-    f.write(f"MATCH: {result['match_id']}\n")
-    f.write("=" * 80 + "\n\n")
-
-    f.write(f"Task: {result['task']}\n")
-    f.write(f"Timestamp: {result['timestamp']}\n")
-    f.write(f"Seed: {result['seed']}\n\n")
-
-    f.write("Agents:\n")
-    for agent in result['agents']:
-        f.write(f"  [{agent['id']}] {agent['name']} ({agent['model']})\n")
-    f.write("\n")
-
-    f.write("=" * 80 + "\n")
-    f.write("TRANSCRIPT\n")
-    f.write("=" * 80 + "\n\n")
-
-    for entry in result['transcript']:
-        f.write(f"--- Round {entry['round']} | Agent {entry['agent_id']} ({entry['agent_name']}) ---\n")
-        f.write(f"\nObservation:\n{entry['observation']}\n")
-        f.write(f"\nAction:\n{entry['action']}\n")
-        f.write("\n" + "-" * 80 + "\n\n")
-
-    f.write("=" * 80 + "\n")
-    f.write("FINAL SCORES\n")
-    f.write("=" * 80 + "\n\n")
-
-    scores = result['scores']
-    for agent_id, score in scores.items():
-        agent_name = result['agents'][agent_id]['name']
-        f.write(f"Agent {agent_id} ({agent_name}):\n")
-        if isinstance(score, dict):
-            for key, value in score.items():
-                f.write(f"  {key}: {value}\n")
-        else:
-            f.write(f"  Score: {score}\n")
-        f.write("\n")
-
-    f.write("=" * 80 + "\n")
-    f.write("FINAL STATE\n")
-    f.write("=" * 80 + "\n\n")
-    f.write(task.render(result['final_state']))
\ No newline at end of file
+    log = MatchLogWriter(Path(log_dir) / f"{match_id}{LOG_SUFFIXES[compression]}", fsync=fsync, compact=compact)
+    log.write(header)
+    log.end_round()
+    return header, log
+
+
+def _start_sessions(task, agents, state, log):
+    for agentId, agent in enumerate(agents):
+        prefix = task.observe_prefix(state, agentId)
+        agent.start_session(prefix)
+        log.write({"type": "session", "agent": agentId, "prefix": prefix})
+
+
+def _check_action(log, state, agentId, action):
+    if isinstance(action, AgentFailure):
+        log.write({"type": "failure", "round": state.get("round", 0), "agent": agentId, **action.to_dict()})
+        log.end_round()
+        raise AgentCallFailed(agentId, action)
+
+
+def _telemetry(reply):
+    # the provider's numbers (latency without engine overhead, tokens, cost) win over ours
+    return reply.telemetry() if isinstance(reply, AgentResponse) else {}
+
+
+def _log_turn(log, telemetry, event):
+    log.write(event)
+    telemetry.record(event)
+
+
+def _parse_move(task, state, agentId, reply):
+    move = task.action_schema.parse(reply)
+    task.validate_move(state, agentId, move)
+    return move
+
+
+def _structured_move(task, state, agentId, action):
+    """
+    Structured action mode: validate a reply before it reaches task.step.
+
+    Returns:
+        (move for task.step, extra fields for the turn event). If the reply doesn't
+        validate, extra["repair"] holds the error and the repair prompt to send.
+    """
+    if task.action_schema is None:
+        return action, {}
+    try:
+        move = task.action_schema.parse(action)
+    except InvalidAction as error:
+        return action, {"repair": {"error": str(error), "prompt": task.action_schema.repair_prompt(action, error)}}
+    try:
+        task.validate_move(state, agentId, move)
+    except InvalidAction as error:
+        prompt = task.action_schema.repair_prompt(action, error, illegal=True)
+        return action, {"repair": {"error": str(error), "prompt": prompt}}
+    return move, {"parsed": move}
+
+
+def _repaired_move(task, state, agentId, action, extra, repaired):
+    # only one repair per turn: if that doesn't validate either, the task gets the
+    # original reply as free text
+    # the prompt is kept so resume_match can rebuild a session with the repair in it
+    repair = {"error": extra["repair"]["error"], "prompt": extra["repair"]["prompt"], "reply": repaired,
+              **_telemetry(repaired)}
+    try:
+        move = _parse_move(task, state, agentId, repaired)
+    except InvalidAction as error:
+        repair["failed"] = str(error)
+        return action, {"repair": repair}
+    return move, {"parsed": move, "repair": repair}
+
+
+def _checkpoint(log, state):
+    # everything needed to carry on from here; the match's RNG is part of the state
+    log.write({
+        "type": "checkpoint",
+        "round": state.get("round", 0),
+        "state": encode_state(state),
+    })
+    log.end_round()
+
+
+def _release_match(header, log):
+    log.close()
+    with _match_id_lock:
+        _reserved_match_ids.discard(header["match_id"])
+
+
+def _finish_match(task, header, log, state, telemetry, readable=False):
+    scores = task.score(state)
+    summary = telemetry.summary()
+
+    # closing record
+    log.write({"type": "end", "scores": encode_state(scores), "final_state": encode_state(state), "telemetry": summary})
+    log.close()
+    print(f"Match logged to: {log.path}")
+
+    if readable:
+        # rendered from the structured log; python -m engine.render_log does the same on demand
+        readable_path = Path(header["log_dir"]) / f"{header['match_id']}_readable.txt"
+        write_readable(log.path, readable_path, task)
+        print(f"Readable log: {readable_path}")
+
+    return MatchResult(log.path, header, scores, state, summary)
@@ -0,0 +1,146 @@
+"""
+Human-readable rendering of a match log, when someone actually wants to read one.
+
+Works from the structured log alone (plain or compact, compressed or not), streaming:
+turns are rendered as they are read, so paging through a long match doesn't load it.
+
+    python -m engine.render_log logs/<match>.jsonl
+    python -m engine.render_log logs/<match>.jsonl --rounds 10:12 --agent Claude
+    python -m engine.render_log logs/<match>.jsonl.gz --page 3 --page-size 20 --no-observations
+"""
+import argparse
+import sys
+
+from engine.match_log import decode_state, read_events
+
+RULE = "=" * 80 + "\n"
+
+
+def _title(text):
+    return f"{RULE}{text}\n{RULE}\n"
+
+
+def _state_text(state):
+    # without the task we can't call task.render; show the scalar parts of the state
+    # (the conversation is in the transcript already, and nobody wants to read the RNG)
+    lines = []
+    for key, value in state.items():
+        if key in ("rng", "conversation"):
+            continue
+        lines.append(f"{key}: {value}")
+    return "\n".join(lines) + "\n"
+
+
+def render(events, task=None, rounds=None, agents=None, page=None, page_size=20, observations=True):
+    """
+    Yield the readable log of a match piece by piece.
+
+    Args:
+        events: the match's events (read_events)
+        task: the match's Task, to render the final state with task.render
+        rounds: (first, last) rounds to show, inclusive
+        agents: seats to show, by id or name
+        page, page_size: show only the page-th (1-based) group of page_size turns
+            (after filtering); scores and the final state come with the last page
+        observations: include what every agent was shown, not just what it did
+    """
+    header = None
+    shown = 0
+    matched = 0
+    first = (page - 1) * page_size if page else 0
+    last = first + page_size if page else None
+    for event in events:
+        kind = event["type"]
+        if kind == "match":
+            header = event
+            names = {agent["id"]: agent["name"] for agent in header["agents"]}
+            seats = None if agents is None else {agent["id"] for agent in header["agents"]
+                                                   if agent["id"] in agents or agent["name"] in agents}
+            yield f"{RULE}MATCH: {header['match_id']}\n{RULE}\n"
+            yield f"Task: {header['task']}\nTimestamp: {header['timestamp']}\nSeed: {header['seed']}\n\n"
+            yield "Agents:\n"
+            for agent in header["agents"]:
+                yield f"  [{agent['id']}] {agent['name']} ({agent['model']})\n"
+            yield "\n" + _title("TRANSCRIPT")
+        elif kind == "turn":
+            if rounds is not None and not rounds[0] <= event["round"] <= rounds[1]:
+                continue
+            if seats is not None and event["agent"] not in seats:
+                continue
+            matched += 1
+            if matched <= first or (last is not None and matched > last):
+                continue
+            shown += 1
+            yield f"--- Round {event['round']} | Agent {event['agent']} ({names[event['agent']]}) ---\n"
+            if observations:
+                yield f"\nObservation:\n{event['observation']}\n"
+            yield f"\nAction:\n{event['action']}\n"
+            if event.get("repair"):
+                repair = event["repair"]
+                yield f"\n(invalid: {repair['error']}; repair reply: {repair.get('reply')})\n"
+            yield "\n" + "-" * 80 + "\n\n"
+        elif kind == "failure":
+            yield f"!!! Round {event['round']} | Agent {event['agent']}: {event['error']}\n\n"
+        elif kind == "end":
+            if page and matched > last:
+                continue
+            yield _title("FINAL SCORES")
+            scores = decode_state(event["scores"])
+            for agentId, score in scores.items():
+                yield f"Agent {agentId} ({names[agentId]}):\n"
+                if isinstance(score, dict):
+                    for key, value in score.items():
+                        yield f"  {key}: {value}\n"
+                else:
+                    yield f"  Score: {score}\n"
+                yield "\n"
+            final_state = decode_state(event["final_state"])
+            yield _title("FINAL STATE")
+            yield task.render(final_state) if task is not None else _state_text(final_state)
+
+    if page:
+        pages = max(1, -(-matched // page_size))
+        yield f"\n[page {page} of {pages}: {shown} of {matched} turns]\n"
+
+
+def write_readable(log_path, out_path, task=None, **options):
+    """Render a match log into a text file (see render for the options)."""
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.writelines(render(read_events(log_path), task=task, **options))
+
+
+def _round_range(text):
+    low, _, high = text.partition(":")
+    return int(low), int(high or low)
+
+
+def _seat(text):
+    return int(text) if text.isdigit() else text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a match log for reading")
+    parser.add_argument("log", help="the match's .jsonl(.gz/.xz) log")
+    parser.add_argument("--rounds", type=_round_range, help="first:last round, inclusive")
+    parser.add_argument("--agent", type=_seat, action="append", help="seat id or agent name (repeatable)")
+    parser.add_argument("--page", type=int, help="show only this page of turns (1-based)")
+    parser.add_argument("--page-size", type=int, default=20, help="turns per page")
+    parser.add_argument("--no-observations", action="store_true", help="show only the actions")
+    parser.add_argument("--out", help="write to a file instead of stdout")
+    args = parser.parse_args()
+
+    options = {"rounds": args.rounds, "agents": args.agent, "page": args.page, "page_size": args.page_size,
+               "observations": not args.no_observations}
+    if args.out:
+        write_readable(args.log, args.out, **options)
+        return
+    try:
+        for chunk in render(read_events(args.log), **options):
+            sys.stdout.write(chunk)
+    except BrokenPipeError:
+        # piped into head or a pager that quit early
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Offline re-scoring of finished matches, with no agent calls.
+
+When scoring logic changes (TriviaDuel answer matching, NegotiationGame.score, ...)
+the logs already hold everything needed to score the old matches again: the task's
+config and seed (in the header) and every action (in the turns). rescore_log rebuilds
+the task, runs init(seed) and step() over the logged actions round by round, calls
+score(), and saves the result as a new score version in a sidecar next to the log:
+
+    logs/<match>.jsonl          the match, untouched (its end event keeps the original scores)
+    logs/<match>.scores.json    {"match_id", "versions": [{"version", "status", "scores", ...}]}
+
+Re-running a version replaces it; other versions stay. Logs are spread over a
+process pool (spawned, non-daemon workers, so a replay can start processes of its
+own, like CodingBattle's sandbox), so a whole log directory takes minutes of local CPU:
+
+    python -m engine.rescore logs --version trivia-matching-fix --processes 8
+    python -m engine.rescore logs --version v2 --task-params params.json
+
+Logs from before headers had a task_config need --task-params (task name -> constructor
+params). A replay whose game ends earlier than the log did is scored where it ended
+("truncated"); one that needs more moves than were logged can't be scored offline
+("incomplete"). Unseeded matches can't be replayed at all.
+
+rescored_results() hands the chosen version to tournament/ratings.py
+(outcomes_from_results) for corrected standings.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+from engine.match_log import LOG_SUFFIXES, decode_state, encode_state, is_match_log, read_events
+from tournament.scheduler import TASK_REGISTRY, match_points
+
+SIDECAR_SUFFIX = ".scores.json"
+
+
+def _match_name(log_path):
+    name = Path(log_path).name
+    for suffix in sorted(LOG_SUFFIXES.values(), key=len, reverse=True):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def sidecar_path(log_path):
+    return Path(log_path).parent / f"{_match_name(log_path)}{SIDECAR_SUFFIX}"
+
+
+def _load(log_path):
+    """(header, actions per round, end event) of a match log."""
+    header, end = None, None
+    rounds, actions = [], {}
+    # observations and states aren't needed: compact logs stay compact
+    for event in read_events(log_path, expand=False):
+        kind = event["type"]
+        if kind == "match":
+            header = event
+        elif kind == "turn":
+            # a resumed match logs some turns of its unfinished round twice; the last one was played
+            actions[event["agent"]] = event.get("parsed", event["action"])
+        elif kind == "checkpoint":
+            rounds.append(actions)
+            actions = {}
+        elif kind == "end":
+            end = event
+    return header, rounds, end
+
+
+def build_task(header, task_params=None):
+    """The match's Task, from the header's task_config (or task_params[task name] for old logs)."""
+    config = header.get("task_config")
+    if config is None:
+        config = (task_params or {}).get(header["task"], {})
+    return TASK_REGISTRY[header["task"]](**config)
+
+
+def replay(task, seed, rounds):
+    """
+    Run init / step / score over logged actions.
+
+    Returns:
+        (status, final state, scores): status "ok", "truncated" (the game ended before
+        the logged rounds ran out) or "incomplete" (scores None)
+    """
+    state = task.init(seed)
+    played = 0
+    for actions in rounds:
+        if state.get("done", False):
+            break
+        state = task.step(state, dict(actions))
+        played += 1
+    if not state.get("done", False):
+        return "incomplete", state, None
+    return ("ok" if played == len(rounds) else "truncated"), state, task.score(state)
+
+
+def rescore_log(log_path, version, task_params=None):
+    """
+    Score one match again.
+
+    Returns:
+        the version entry: {"version", "status", "scores", "changed", "winner_changed",
+        "rounds", "rescored_at"} (scores only when status is "ok" or "truncated")
+    """
+    entry = {"version": version, "rescored_at": datetime.now().isoformat(timespec="seconds")}
+    header, rounds, end = _load(log_path)
+    if header is None or end is None:
+        return {**entry, "status": "unfinished"}
+    if header.get("seed") is None:
+        return {**entry, "status": "unseeded"}
+    try:
+        status, _, scores = replay(build_task(header, task_params), header["seed"], rounds)
+    except Exception as e:
+        # old logs meeting new code; one bad match shouldn't stop the run
+        return {**entry, "status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    entry.update({"status": status, "rounds": len(rounds)})
+    if scores is not None:
+        old = decode_state(end["scores"])
+        entry["scores"] = encode_state(scores)
+        # the logged scores went through JSON, so compare them that way
+        entry["changed"] = json.loads(json.dumps(entry["scores"])) != end["scores"]
+        entry["winner_changed"] = len(scores) == 2 and match_points(scores) != match_points(old)
+    return entry
+
+
+def save_version(log_path, match_id, entry):
+    """Add (or replace) a score version in the log's sidecar."""
+    path = sidecar_path(log_path)
+    data = {"match_id": match_id, "versions": []}
+    if path.exists():
+        with open(path) as f:
+            data = json.load(f)
+    data["versions"] = [v for v in data["versions"] if v["version"] != entry["version"]] + [entry]
+    # write and rename, so a reader never sees half a file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _rescore_and_save(log_path, version, task_params):
+    entry = rescore_log(log_path, version, task_params)
+    if entry["status"] != "unfinished":
+        save_version(log_path, _match_name(log_path), entry)
+    return entry
+
+
+def rescore_logs(log_dir, version, processes=None, task_params=None, chunksize=16):
+    """
+    Re-score every match log in log_dir.
+
+    Args:
+        processes: pool size (default: one per CPU; 1 runs in this process)
+        task_params: {task name: constructor params} for logs without task_config
+
+    Returns:
+        Counter of statuses, plus "changed" / "winner_changed" counts
+    """
+    paths = sorted(str(p) for p in Path(log_dir).iterdir() if is_match_log(p.name))
+    work = partial(_rescore_and_save, version=version, task_params=task_params)
+    summary = Counter()
+
+    def _count(entries):
+        for entry in entries:
+            summary[entry["status"]] += 1
+            summary["changed"] += bool(entry.get("changed"))
+            summary["winner_changed"] += bool(entry.get("winner_changed"))
+
+    if processes == 1:
+        _count(map(work, paths))
+    else:
+        # not multiprocessing.Pool: its workers are daemons, which can't start a SandboxPool,
+        # and forked ones would inherit this process's sandbox pool without its threads
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            _count(pool.map(work, paths, chunksize=chunksize))
+    return summary
+
+
+def load_scores(log_path, version=None):
+    """
+    A match's scores: the original ones from the log (version None), the newest
+    re-scored version ("latest") or a named one. None if there is no such version.
+    """
+    if version is not None:
+        path = sidecar_path(log_path)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            versions = [v for v in json.load(f)["versions"] if "scores" in v]
+        if version != "latest":
+            versions = [v for v in versions if v["version"] == version]
+        return decode_state(versions[-1]["scores"]) if versions else None
+
+    for event in read_events(log_path, expand=False):
+        if event["type"] == "end":
+            return decode_state(event["scores"])
+    return None
+
+
+def rescored_results(log_dir, version="latest"):
+    """
+    (job, result) pairs like JobQueue.results(), with the chosen score version, for
+    tournament.ratings.outcomes_from_results. Matches without that version are left out.
+    """
+    for path in sorted(p for p in Path(log_dir).iterdir() if is_match_log(p.name)):
+        scores = load_scores(path, version)
+        if scores is None:
+            continue
+        header = next(iter(read_events(path, expand=False)))
+        yield {"agents": header["agents"], "task": header["task"], "seed": header["seed"]}, {"scores": scores}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score finished matches from their logs, without agent calls")
+    parser.add_argument("log_dir", nargs="?", default="logs")
+    parser.add_argument("--version", default=datetime.now().strftime("%Y%m%d-%H%M%S"),
+                        help="name of the new score version (default: a timestamp)")
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--task-params", help="JSON file {task name: params} for logs without task_config")
+    args = parser.parse_args()
+
+    task_params = None
+    if args.task_params:
+        with open(args.task_params) as f:
+            task_params = json.load(f)
+    summary = rescore_logs(args.log_dir, args.version, processes=args.processes, task_params=task_params)
+    print(f"Version {args.version}: " + ", ".join(f"{key} {count}" for key, count in sorted(summary.items())))
+
+
+if __name__ == "__main__":
+    main()
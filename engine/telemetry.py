@@ -0,0 +1,215 @@
+"""
+Per-match call telemetry and an OpenMetrics export of it.
+
+Every turn event carries what the agent's AgentResponse knew about the call
+(latency_ms, ttft_ms, input/output tokens, retries, cost_usd, cached). MatchTelemetry
+adds those up per seat while the match runs; the summary goes into the log's end
+event and result["telemetry"].
+
+The summaries of a whole log directory can be written out as an OpenMetrics text
+file for a local Prometheus (or node_exporter's textfile collector) to scrape:
+
+    python -m engine.telemetry logs --out logs/metrics.prom
+
+Series are labelled by task, agent, model and provider, and summed over matches;
+latencies are histograms, so p50/p95 per provider can be computed by the scraper.
+"""
+import argparse
+import math
+import os
+from pathlib import Path
+
+from engine.match_log import is_match_log, read_events
+
+# histogram buckets, seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+PREFIX = "llm_tournament"
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def _bucket_counts(values_ms):
+    # cumulative, like Prometheus: counts[i] = calls that took <= LATENCY_BUCKETS[i]
+    return [sum(1 for v in values_ms if v <= bound * 1000) for bound in LATENCY_BUCKETS]
+
+
+class MatchTelemetry:
+    """Adds up the telemetry of one match's provider calls, per seat."""
+
+    def __init__(self, num_agents):
+        self.seats = [{"latency_ms": [], "ttft_ms": [], "calls": 0, "cached": 0, "failures": 0, "retries": 0,
+                       "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "unpriced": 0}
+                      for _ in range(num_agents)]
+
+    def record(self, event):
+        """Take a turn (or failure) event as it is written to the log."""
+        seat = self.seats[event["agent"]]
+        if event["type"] == "failure":
+            seat["failures"] += 1
+            seat["retries"] += max(event.get("attempts", 1) - 1, 0)
+            return
+        if event["type"] != "turn":
+            return
+        self._call(seat, event)
+        if event.get("repair") and "reply" in event["repair"]:
+            self._call(seat, event["repair"])
+
+    @staticmethod
+    def _call(seat, call):
+        seat["calls"] += 1
+        if call.get("latency_ms") is not None:
+            seat["latency_ms"].append(call["latency_ms"])
+        if call.get("ttft_ms") is not None:
+            seat["ttft_ms"].append(call["ttft_ms"])
+        seat["cached"] += bool(call.get("cached"))
+        seat["retries"] += call.get("retries") or 0
+        seat["input_tokens"] += call.get("input_tokens") or 0
+        seat["output_tokens"] += call.get("output_tokens") or 0
+        if call.get("cost_usd") is not None:
+            seat["cost_usd"] += call["cost_usd"]
+        elif not call.get("cached"):
+            seat["unpriced"] += 1
+
+    def summary(self):
+        """
+        Returns:
+            one dict per seat: call/token/retry/cost totals, latency and ttft
+            percentiles (ms) and cumulative latency bucket counts
+        """
+        out = []
+        for seat in self.seats:
+            row = {k: v for k, v in seat.items() if k not in ("latency_ms", "ttft_ms")}
+            row["cost_usd"] = round(row["cost_usd"], 6)
+            for name in ("latency_ms", "ttft_ms"):
+                values = sorted(seat[name])
+                row[name] = {
+                    "count": len(values),
+                    "sum": round(sum(values), 1),
+                    "p50": _percentile(values, 0.5),
+                    "p95": _percentile(values, 0.95),
+                    "max": values[-1] if values else None,
+                    "buckets": _bucket_counts(values),
+                }
+            out.append(row)
+        return out
+
+
+class Metrics:
+    """Telemetry summaries of many matches, summed per (task, agent, model, provider)."""
+
+    COUNTERS = {
+        "calls": "Provider calls made",
+        "cached": "Calls served from the response cache",
+        "failures": "Calls that failed for good",
+        "retries": "Retried attempts",
+        "input_tokens": "Input tokens billed",
+        "output_tokens": "Output tokens billed",
+        "cost_usd": "Estimated cost in USD",
+    }
+    HISTOGRAMS = {
+        "latency_ms": ("call_latency_seconds", "Wall clock per call, retries included"),
+        "ttft_ms": ("time_to_first_token_seconds", "Time to first token (streaming calls)"),
+    }
+
+    def __init__(self):
+        self.series = {}
+        self.matches = {}
+
+    def add(self, header, telemetry):
+        """Add one match, from its log header and telemetry summary."""
+        self.matches[header["task"]] = self.matches.get(header["task"], 0) + 1
+        for agent, seat in zip(header["agents"], telemetry):
+            labels = (("task", header["task"]), ("agent", agent["name"]), ("model", agent["model"]),
+                      ("provider", agent.get("provider") or "unknown"))
+            total = self.series.setdefault(labels, {
+                **{name: 0 for name in self.COUNTERS},
+                **{name: {"count": 0, "sum": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)} for name in self.HISTOGRAMS},
+            })
+            for name in self.COUNTERS:
+                total[name] += seat.get(name, 0)
+            for name in self.HISTOGRAMS:
+                hist = seat[name]
+                total[name]["count"] += hist["count"]
+                total[name]["sum"] += hist["sum"]
+                total[name]["buckets"] = [a + b for a, b in zip(total[name]["buckets"], hist["buckets"])]
+
+    def render(self):
+        """OpenMetrics text exposition."""
+        lines = [f"# TYPE {PREFIX}_matches counter", f"# HELP {PREFIX}_matches Finished matches"]
+        for task, count in sorted(self.matches.items()):
+            lines.append(f'{PREFIX}_matches_total{{task="{_escape(task)}"}} {count}')
+
+        for name, help_text in self.COUNTERS.items():
+            metric = f"{PREFIX}_{name}"
+            lines += [f"# TYPE {metric} counter", f"# HELP {metric} {help_text}"]
+            for labels, total in self.series.items():
+                lines.append(f"{metric}_total{{{_labels(labels)}}} {_number(total[name])}")
+
+        for name, (metric, help_text) in self.HISTOGRAMS.items():
+            metric = f"{PREFIX}_{metric}"
+            lines += [f"# TYPE {metric} histogram", f"# UNIT {metric} seconds", f"# HELP {metric} {help_text}"]
+            for labels, total in self.series.items():
+                hist = total[name]
+                label_text = _labels(labels)
+                for bound, count in zip(LATENCY_BUCKETS, hist["buckets"]):
+                    lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{label_text},le="+Inf"}} {hist["count"]}')
+                lines.append(f"{metric}_count{{{label_text}}} {hist['count']}")
+                lines.append(f"{metric}_sum{{{label_text}}} {_number(hist['sum'] / 1000)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # write and rename, so a scraper never sees half a file
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+
+def _number(value):
+    return repr(round(value, 9)) if isinstance(value, float) else str(value)
+
+
+def metrics_from_logs(log_dir):
+    """Metrics over every finished match log in log_dir."""
+    metrics = Metrics()
+    for path in sorted(p for p in Path(log_dir).iterdir() if is_match_log(p.name)):
+        header, telemetry = None, None
+        for event in read_events(path, expand=False):
+            if event["type"] == "match":
+                header = event
+            elif event["type"] == "end":
+                telemetry = event.get("telemetry")
+        # logs from before telemetry existed, or unfinished matches
+        if header is not None and telemetry is not None:
+            metrics.add(header, telemetry)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write provider call metrics of a log directory as OpenMetrics")
+    parser.add_argument("log_dir", nargs="?", default="logs")
+    parser.add_argument("--out", help="metrics file (default: <log_dir>/metrics.prom)")
+    args = parser.parse_args()
+
+    out = args.out or str(Path(args.log_dir) / "metrics.prom")
+    metrics = metrics_from_logs(args.log_dir)
+    metrics.write(out)
+    print(f"Metrics for {sum(metrics.matches.values())} matches written to {out}")
+
+
+if __name__ == "__main__":
+    main()
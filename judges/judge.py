@@ -1,23 +1,254 @@
-# judges/judge.py
+"""
+Judges for tasks that can't score themselves.
 
+Negotiation and trivia are self-scoring (RuleBasedJudge just hands back task.score).
+Subjective things (code quality in a CodingBattle, persuasion, creative writing) need
+a model to look at the final state, and at tournament scale that can't mean one
+synchronous judge call per match. So LLMJudge:
 
-"""
-This will probably not be used for the negotiation or trivia duel tasks, as they are self-scoring.
-I thought we might use this for the coding battle, but I haven't decided how to proceed with that task.
-It may be useful for some future tasks, though.
+    - takes whole batches of (task, final_state) and packs several of them into one
+      request while the prompt stays under max_batch_tokens (every match is judged on
+      its own, the prompt says so; a batch reply that doesn't parse is retried one
+      match per request)
+    - caches verdicts per (judge model, config, rubric, match), so the packing doesn't
+      matter for the cache and re-judging a tournament is free
+    - runs a panel of judge models concurrently and aggregates their verdicts by
+      majority vote on the winner or by mean score. With early_exit only a quorum
+      (a majority of the panel) is asked first; the rest are only asked about the
+      matches the quorum didn't agree on.
 
+    judge = LLMJudge([Agent("J1", "claude-3-5-haiku-20241022", {"temperature": 0}),
+                      Agent("J2", "gemini-1.5-flash", {"temperature": 0}),
+                      Agent("J3", "claude-3-5-sonnet-20241022", {"temperature": 0})],
+                     cache=ResponseCache("judge_cache.db"))
+    verdicts = judge.evaluate_many([(task, final_state), ...])
+
+The judge sees task.judge_view(state) if the task has one (CodingBattle shows the
+submitted code), task.render(state) otherwise, and task.judge_rubric if it has one.
 """
-class Judge:
-    def evaluate(self, state, task_type):
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.agents import AgentFailure
+from agents.cache import cache_key
+from tasks.actions import InvalidAction, extract_json
+from tasks.tasks import estimate_tokens
+
+DEFAULT_RUBRIC = (
+    "Decide which agent played better overall, and score each agent from 0 (terrible) "
+    "to 10 (excellent)."
+)
+MAX_SCORE = 10
+
+
+class Judge(ABC):
+    def evaluate(self, state, task):
         """
         Returns scores for agents based on task state
         """
+        return self.evaluate_many([(task, state)])[0]
+
+    @abstractmethod
+    def evaluate_many(self, items):
+        """Verdicts for a list of (task, final_state), in order"""
         pass
 
+
 class RuleBasedJudge(Judge):
-    # For tasks with clear winners. May not be useful, as those may all be self-scoring
-    pass
+    # For tasks with clear winners: the task's own score, so self-scoring tasks can go
+    # through the same judging pipeline as subjective ones
+    def evaluate_many(self, items):
+        return [task.score(state) for task, state in items]
+
+
+def judge_view(task, state):
+    """What a judge gets to see of a finished match."""
+    view = getattr(task, "judge_view", None)
+    return view(state) if view is not None else task.render(state)
+
+
+def judge_prompt(rubric, views):
+    """One request judging every view in it independently."""
+    prompt = (f"You are judging {len(views)} independent two-player match(es) between agent 0 and agent 1. "
+              "Judge each match on its own; don't compare them with each other.\n\n"
+              f"Rubric: {rubric}\n\n")
+    for number, view in enumerate(views, 1):
+        prompt += f"=== MATCH {number} ===\n{view}\n\n"
+    prompt += ('Reply with only a JSON object, one verdict per match: {"verdicts": [{"match": 1, '
+               f'"scores": [<agent 0, 0-{MAX_SCORE}>, <agent 1, 0-{MAX_SCORE}>], "winner": 0, 1 or null}}, ...]}}')
+    return prompt
+
+
+def parse_verdicts(reply, count):
+    """
+    Verdicts by match number (1-based) from a judge's reply; matches the reply
+    skipped or got wrong are missing.
+    """
+    try:
+        verdicts = extract_json(reply).get("verdicts")
+    except InvalidAction:
+        return {}
+    out = {}
+    for verdict in verdicts if isinstance(verdicts, list) else []:
+        if not isinstance(verdict, dict):
+            continue
+        number, scores, winner = verdict.get("match"), verdict.get("scores"), verdict.get("winner")
+        if not isinstance(number, int) or not 1 <= number <= count or winner not in (0, 1, None):
+            continue
+        if (not isinstance(scores, list) or len(scores) != 2
+                or not all(isinstance(s, (int, float)) and 0 <= s <= MAX_SCORE for s in scores)):
+            continue
+        out[number] = {"scores": scores, "winner": winner}
+    return out
+
 
 class LLMJudge(Judge):
     # For subjective tasks (code quality, creative writing, persuasion).
-    pass
\ No newline at end of file
+    def __init__(self, judges, rubric=None, aggregate="majority", early_exit=True, cache=None,
+                 batch_size=8, max_batch_tokens=6000, concurrency=8):
+        """
+        Args:
+            judges: the panel, a list of Agents (temperature 0 recommended)
+            rubric: what to judge on, for tasks without a judge_rubric
+            aggregate: "majority" (vote on the winner) or "mean" (highest mean score wins)
+            early_exit: ask a quorum first and the rest only where it disagreed
+            cache: agents.cache.ResponseCache for verdicts
+            batch_size: most matches packed into one request
+            max_batch_tokens: most (estimated) prompt tokens per request; bigger
+                matches get a request of their own
+            concurrency: requests in flight at once, over the whole panel
+        """
+        if aggregate not in ("majority", "mean"):
+            raise ValueError(f"unknown aggregate: {aggregate}")
+        self.judges = list(judges)
+        self.rubric = rubric or DEFAULT_RUBRIC
+        self.aggregate = aggregate
+        self.early_exit = early_exit
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.concurrency = concurrency
+        self.quorum = len(self.judges) // 2 + 1
+        # requests sent and verdicts served from the cache, for the curious
+        self.calls = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def evaluate_many(self, items):
+        """
+        Returns:
+            one verdict per item: {"winner": 0, 1 or None, "scores": {0: mean, 1: mean},
+            "votes": each judge's winner, "judges": judges that answered,
+            "agreement": share of votes for the most common winner}
+        """
+        views = [(getattr(task, "judge_rubric", None) or self.rubric, judge_view(task, state))
+                 for task, state in items]
+        verdicts = [[] for _ in items]
+        first = self.judges[:self.quorum] if self.early_exit else self.judges
+        self._ask(first, range(len(items)), views, verdicts)
+        if self.early_exit and len(self.judges) > self.quorum:
+            undecided = [i for i, votes in enumerate(verdicts) if not self._agreed(votes)]
+            if undecided:
+                self._ask(self.judges[self.quorum:], undecided, views, verdicts)
+        return [self._combine(votes) for votes in verdicts]
+
+    def _agreed(self, votes):
+        return len(votes) >= self.quorum and len({v["winner"] for v in votes}) == 1
+
+    def _ask(self, judges, indices, views, verdicts):
+        # every (judge, batch) is one request; all of them go out at once
+        found = {}
+        jobs = []
+        for j, judge in enumerate(judges):
+            pending = []
+            for i in indices:
+                cached = self._cache_get(judge, *views[i])
+                if cached is not None:
+                    found[(j, i)] = cached
+                else:
+                    pending.append(i)
+            jobs += [(j, judge, batch) for batch in self._batches(pending, views)]
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(jobs)))) as pool:
+            for results in pool.map(lambda job: self._judge_batch(*job, views), jobs):
+                found.update(results)
+
+        # judge order, so the votes come out the same however the threads finished
+        for j, judge in enumerate(judges):
+            for i in indices:
+                if (j, i) in found:
+                    verdicts[i].append({"judge": judge.name, **found[(j, i)]})
+
+    def _batches(self, indices, views):
+        # only matches with the same rubric share a request, and only while it stays small
+        by_rubric = {}
+        for i in indices:
+            by_rubric.setdefault(views[i][0], []).append(i)
+        for rubric, group in by_rubric.items():
+            batch, tokens = [], 0
+            for i in group:
+                size = estimate_tokens(views[i][1])
+                if batch and (len(batch) >= self.batch_size or tokens + size > self.max_batch_tokens):
+                    yield batch
+                    batch, tokens = [], 0
+                batch.append(i)
+                tokens += size
+            if batch:
+                yield batch
+
+    def _judge_batch(self, j, judge, batch, views):
+        rubric = views[batch[0]][0]
+        with self._lock:
+            self.calls += 1
+        reply = judge.act(judge_prompt(rubric, [views[i][1] for i in batch]))
+        if isinstance(reply, AgentFailure):
+            # that judge abstains on these; not cached, so a re-run asks again
+            return {}
+        parsed = parse_verdicts(reply, len(batch))
+        results = {}
+        for number, i in enumerate(batch, 1):
+            if number in parsed:
+                results[(j, i)] = parsed[number]
+                self._cache_put(judge, *views[i], parsed[number])
+            elif len(batch) > 1:
+                # the batch reply lost this one: ask about it on its own
+                results.update(self._judge_batch(j, judge, [i], views))
+        return results
+
+    def _cache_key(self, judge, rubric, view):
+        return cache_key("judge", judge.model, {"config": judge.model_config, "rubric": rubric}, view)
+
+    def _cache_get(self, judge, rubric, view):
+        if self.cache is None or not self.cache.applies_to(judge.model_config):
+            return None
+        cached = self.cache.get(self._cache_key(judge, rubric, view))
+        if cached is None:
+            return None
+        with self._lock:
+            self.cache_hits += 1
+        return json.loads(cached)
+
+    def _cache_put(self, judge, rubric, view, verdict):
+        if self.cache is not None and self.cache.applies_to(judge.model_config):
+            self.cache.put(self._cache_key(judge, rubric, view), json.dumps(verdict))
+
+    def _combine(self, votes):
+        if not votes:
+            return {"winner": None, "scores": None, "votes": [], "judges": 0, "agreement": None}
+        scores = {seat: round(sum(v["scores"][seat] for v in votes) / len(votes), 3) for seat in (0, 1)}
+        counts = Counter(v["winner"] for v in votes).most_common()
+        if self.aggregate == "majority":
+            tied = len(counts) > 1 and counts[0][1] == counts[1][1]
+            winner = None if tied else counts[0][0]
+        else:
+            winner = None if scores[0] == scores[1] else max((0, 1), key=scores.get)
+        return {
+            "winner": winner,
+            "scores": scores,
+            "votes": [v["winner"] for v in votes],
+            "judges": len(votes),
+            "agreement": round(counts[0][1] / len(votes), 3),
+        }
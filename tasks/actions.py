@@ -0,0 +1,175 @@
+"""
+Structured actions: a task declares an ActionSchema, agents reply with a JSON object
+(or a tool call, see ActionSchema.tool), and the engine validates every reply before
+it reaches task.step.
+
+The schema is compiled once into a list of field checks, so validating a reply is one
+json parse plus a few isinstance calls. A reply that doesn't validate gets one cheap
+repair request (the bad reply, the error and the format, not the whole observation)
+instead of silently wasting a round.
+"""
+import json
+import re
+
+# models like to wrap JSON in markdown fences
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_DECODER = json.JSONDecoder()
+
+_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+class InvalidAction(ValueError):
+    """A reply that doesn't match the task's action schema (or isn't a legal move)."""
+    pass
+
+
+def extract_json(reply):
+    """First JSON object in a reply, fenced or not."""
+    if isinstance(reply, dict):
+        return reply
+    fenced = _FENCE.search(reply)
+    text = fenced.group(1) if fenced else reply
+    start = text.find("{")
+    if start == -1:
+        raise InvalidAction("no JSON object found")
+    try:
+        obj, _ = _DECODER.raw_decode(text, start)
+    except json.JSONDecodeError as e:
+        raise InvalidAction(f"invalid JSON: {e.msg}")
+    if not isinstance(obj, dict):
+        raise InvalidAction("expected a JSON object")
+    return obj
+
+
+class ActionSchema:
+    def __init__(self, name, fields, discriminator=None, requires=None, description=""):
+        """
+        Args:
+            name: schema (and tool) name
+            fields: {field: {"type": "string" | "integer" | "number" | "boolean" | "array",
+                             "items": element type for arrays, "enum": [allowed values],
+                             "required": bool, "description": str}}
+            discriminator: field whose value picks extra required fields, e.g. "action"
+            requires: {discriminator value: [fields required for it]}
+            description: one line about what the action is
+        """
+        self.name = name
+        self.fields = fields
+        self.discriminator = discriminator
+        self.requires = requires or {}
+        self.description = description
+        self._checks = [self._compile(field, spec) for field, spec in fields.items()]
+
+    @staticmethod
+    def _compile(field, spec):
+        kind = spec.get("type", "string")
+        required = spec.get("required", False)
+        enum = {v.lower(): v for v in spec["enum"]} if "enum" in spec else None
+
+        if kind == "array":
+            item_type = _TYPES[spec.get("items", "string")]
+
+            def convert(value):
+                if isinstance(value, item_type):
+                    # a single item where a list was expected is an easy mistake to forgive
+                    value = [value]
+                if not isinstance(value, list) or not all(isinstance(v, item_type) for v in value):
+                    raise InvalidAction(f"'{field}' must be a list of {spec.get('items', 'string')}s")
+                return value
+        else:
+            expected = _TYPES[kind]
+
+            def convert(value):
+                if not isinstance(value, expected) or (kind != "boolean" and isinstance(value, bool)):
+                    raise InvalidAction(f"'{field}' must be a {kind}")
+                if enum is not None:
+                    if str(value).lower() not in enum:
+                        raise InvalidAction(f"'{field}' must be one of {', '.join(spec['enum'])}")
+                    return enum[str(value).lower()]
+                return value
+
+        return field, required, convert
+
+    def parse(self, reply):
+        """
+        Validate a reply (JSON text, possibly fenced, or an already decoded dict).
+
+        Returns:
+            the action as a dict with only the schema's fields
+
+        Raises:
+            InvalidAction
+        """
+        obj = extract_json(reply)
+        action = {}
+        for field, required, convert in self._checks:
+            value = obj.get(field)
+            if value is None:
+                if required:
+                    raise InvalidAction(f"missing '{field}'")
+                continue
+            action[field] = convert(value)
+        if self.discriminator is not None:
+            for field in self.requires.get(action.get(self.discriminator), ()):
+                if action.get(field) in (None, "", []):
+                    raise InvalidAction(f"'{field}' is required when {self.discriminator} is "
+                                        f"'{action[self.discriminator]}'")
+        return action
+
+    def json_schema(self):
+        properties = {}
+        for field, spec in self.fields.items():
+            prop = {"type": spec.get("type", "string")}
+            if prop["type"] == "array":
+                prop["items"] = {"type": spec.get("items", "string")}
+            for key in ("enum", "description"):
+                if key in spec:
+                    prop[key] = spec[key]
+            properties[field] = prop
+        required = [field for field, spec in self.fields.items() if spec.get("required")]
+        return {"type": "object", "properties": properties, "required": required}
+
+    def tool(self):
+        """
+        Anthropic tool definition for the action. To get tool calls instead of JSON text:
+
+            Agent(..., model_config={"tools": [schema.tool()],
+                                     "tool_choice": {"type": "tool", "name": schema.name}})
+        """
+        return {"name": self.name, "description": self.description, "input_schema": self.json_schema()}
+
+    def describe(self):
+        """Prompt text telling the agent how to format its action."""
+        lines = ["INSTRUCTIONS:", "Reply with a single JSON object and nothing else. Fields:"]
+        for field, spec in self.fields.items():
+            kind = spec.get("type", "string")
+            if kind == "array":
+                kind = f"list of {spec.get('items', 'string')}s"
+            if "enum" in spec:
+                kind = " | ".join(f'"{v}"' for v in spec["enum"])
+            need = "required" if spec.get("required") else "optional"
+            lines.append(f"- {field} ({kind}, {need}): {spec.get('description', '')}".rstrip(": "))
+        for value, fields in self.requires.items():
+            lines.append(f"- with {self.discriminator} \"{value}\", {' and '.join(fields)} must be given")
+        return "\n".join(lines) + "\n"
+
+    def repair_prompt(self, reply, error, illegal=False):
+        """
+        illegal: the reply parsed fine but the move itself isn't allowed (validate_move),
+        so ask for a corrected move instead of the same one reformatted
+        """
+        if illegal:
+            ask = "That move isn't allowed right now. Send a corrected move as a single valid JSON object, nothing else."
+        else:
+            ask = "Send the same move again as a single valid JSON object, nothing else."
+        return (
+            f"Your last reply could not be used: {error}.\n\n"
+            f"Your reply was:\n{reply}\n\n"
+            f"{self.describe()}\n"
+            f"{ask}"
+        )
@@ -1,10 +1,247 @@
+"""
+Coding battle: both agents solve the same programming problems, and their code is run
+against each problem's tests in a sandbox (tasks/sandbox.py).
+
+Started from Guojia La's note here: "running arbitrary code generated by LLMs is risky
+business ... Perhaps utilize a sandbox environment of some sort?" Every test case runs
+in its own forked, rlimited, network-less child of a warm worker process, and the
+expected outputs never reach the sandbox at all.
+
+A problem is a dict, LeetCode style (a function) or judge style (a script):
 
-# i wonder if we can use LeetCode problems to test our LLMs?
-# Is there an API we can call for rtht?
+    {"id": "two-sum", "prompt": "Return the indices of the two numbers ...",
+     "entry_point": "two_sum",
+     "tests": [{"args": [[2, 7, 11, 15], 9], "expected": [0, 1]}, ...]}
 
+    {"id": "a-plus-b", "prompt": "Read two integers, print their sum.",
+     "tests": [{"stdin": "1 2\\n", "stdout": "3\\n"}, ...]}
+
+The first `examples` tests (default 2) are shown in the prompt. A problem is worth one
+point, split evenly over its tests; with attempts > 1 an agent that failed some tests
+sees the first failing one and may resubmit.
 """
-I get the distinct impression that running arbitrary code generated by LLMs is risky business.
-I will have to contact project lead about how to proceed. Perhaps utilize a sandbox environment of some sort?
+import json
+import os
+import re
+
+from tasks.sandbox import SandboxPool
+from tasks.tasks import Task
+
+_shared_pool = None
+
+
+def shared_pool():
+    """One SandboxPool per process, started on first use and shared by every match."""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = SandboxPool()
+    return _shared_pool
+
+
+def _forget_shared_pool():
+    # a forked child gets the pool object but not the threads that run it
+    global _shared_pool
+    _shared_pool = None
+
+
+os.register_at_fork(after_in_child=_forget_shared_pool)
+
+
+_FENCE = re.compile(r"```[ \t]*(?:python|py)?[ \t]*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+def extract_code(reply):
+    """The last fenced code block of a reply, or the whole reply if it has none."""
+    blocks = _FENCE.findall(reply)
+    return blocks[-1] if blocks else reply
+
+
+def _normalize(value):
+    # compare the way the value came out of the sandbox (JSON: tuples are lists)
+    return json.loads(json.dumps(value))
+
+
+def _lines(text):
+    return [line.rstrip() for line in text.strip().splitlines()]
+
+
+def check_case(case, outcome):
+    """Whether a sandbox outcome passes a test case."""
+    if outcome["status"] != "ok":
+        return False
+    if "expected" in case:
+        return "value" in outcome and outcome["value"] == _normalize(case["expected"])
+    return _lines(outcome.get("stdout", "")) == _lines(case.get("stdout", ""))
+
+
+class CodingBattle(Task):
+    # for judges/judge.py: the tests already decide correctness, a judge looks at the rest
+    judge_rubric = (
+        "Both agents solved the same problems; the test results are given. Judge the code "
+        "itself: correctness beyond the tests, efficiency, clarity. Score each agent from 0 to 10."
+    )
+
+    def __init__(self, problems, attempts=1, examples=2, pool=None, timeout=None):
+        """
+        Args:
+            problems: list of problems (see above), or the path of a JSON file with one
+            attempts: submissions per agent per problem
+            examples: tests shown in the prompt
+            pool: SandboxPool to run the tests on (default: the process's shared pool)
+            timeout: wall clock seconds per test case (default: the pool's)
+        """
+        if isinstance(problems, str):
+            with open(problems) as f:
+                problems = json.load(f)
+        self.problems = problems
+        self.attempts = attempts
+        self.examples = examples
+        self.pool = pool
+        self.timeout = timeout
+
+    def config(self):
+        # the pool is how tests get run here, not part of the game
+        return {"problems": self.problems, "attempts": self.attempts, "examples": self.examples,
+                "timeout": self.timeout}
+
+    def init(self, seed=None):
+        return {
+            "round": 0,
+            "problem": 0,
+            # agent -> one result per problem so far: passed, total, attempts, solved,
+            # first failure and the code of the last submission
+            "results": {0: [], 1: []},
+            "done": False,
+        }
+
+    def _result(self, state, agentId):
+        results = state["results"][agentId]
+        return results[state["problem"]] if len(results) > state["problem"] else None
+
+    def _finished(self, state, agentId):
+        result = self._result(state, agentId)
+        return result is not None and (result["solved"] or result["attempts"] >= self.attempts)
+
+    def _points(self, state, agentId):
+        return round(sum(r["passed"] / r["total"] for r in state["results"][agentId] if r["total"]), 3)
+
+    def observe(self, state, agentId):
+        problem = self.problems[state["problem"]]
+        obs = f"=== CODING BATTLE - PROBLEM {state['problem'] + 1} / {len(self.problems)} ===\n\n"
+        obs += f"Current Score - You: {self._points(state, agentId)} | Opponent: {self._points(state, 1 - agentId)}\n\n"
+
+        result = self._result(state, agentId)
+        if self._finished(state, agentId):
+            return obs + "You are done with this problem; waiting for your opponent. Reply with anything.\n"
+
+        obs += f"{problem['prompt']}\n\n"
+        if problem.get("entry_point"):
+            obs += f"Write a Python function named `{problem['entry_point']}`.\n"
+        else:
+            obs += "Write a Python program that reads standard input and prints the answer.\n"
+        for case in problem["tests"][:self.examples]:
+            if "args" in case:
+                args = ", ".join(json.dumps(arg) for arg in case["args"])
+                obs += f"\nExample: {problem['entry_point']}({args}) == {json.dumps(case['expected'])}"
+            else:
+                obs += f"\nExample input:\n{case['stdin']}\nExpected output:\n{case['stdout']}"
+        obs += "\n\n"
+
+        if result is not None:
+            obs += f"Your last submission passed {result['passed']} / {result['total']} tests. "
+            obs += f"Attempts left: {self.attempts - result['attempts']}.\n"
+            if result.get("failure"):
+                obs += f"First failing test: {result['failure']}\n\n"
+        obs += "Reply with your solution in a single ```python code block."
+        return obs
+
+    def step(self, state, actions):
+        problem = self.problems[state["problem"]]
+        entry_point = problem.get("entry_point")
+        submitting = [agentId for agentId in sorted(actions) if not self._finished(state, agentId)]
+
+        # both agents' suites go to the pool together, so their tests run side by side
+        pool = self.pool or shared_pool()
+        outcomes = pool.run_many([(extract_code(actions[agentId]), problem["tests"], entry_point)
+                                  for agentId in submitting], timeout=self.timeout)
+
+        for agentId, results in zip(submitting, outcomes):
+            passed = [check_case(case, outcome) for case, outcome in zip(problem["tests"], results)]
+            previous = self._result(state, agentId)
+            result = {
+                "passed": sum(passed),
+                "total": len(passed),
+                "attempts": previous["attempts"] + 1 if previous else 1,
+                "solved": all(passed),
+                "failure": self._failure(problem, passed, results),
+                "code": extract_code(actions[agentId]),
+            }
+            if previous is None:
+                state["results"][agentId].append(result)
+            else:
+                state["results"][agentId][state["problem"]] = result
+
+        state["round"] += 1
+        if all(self._finished(state, agentId) for agentId in actions):
+            state["problem"] += 1
+            if state["problem"] >= len(self.problems):
+                state["done"] = True
+        return state
+
+    @staticmethod
+    def _failure(problem, passed, results):
+        # what the agent gets to see about its first failing test
+        for i, (case, ok, outcome) in enumerate(zip(problem["tests"], passed, results)):
+            if ok:
+                continue
+            shown = json.dumps(case["args"]) if "args" in case else repr(case["stdin"])
+            if outcome["status"] != "ok":
+                got = outcome["status"] + (f" ({outcome['error']})" if outcome.get("error") else "")
+            elif "expected" in case:
+                got = f"returned {json.dumps(outcome.get('value'))}"
+            else:
+                got = f"printed {outcome.get('stdout', '')!r}"
+            return f"test {i + 1}, input {shown}: {got}"[:500]
+        return None
+
+    def score(self, state):
+        return {
+            agentId: {
+                "score": self._points(state, agentId),
+                "solved": sum(r["solved"] for r in results),
+                "tests_passed": sum(r["passed"] for r in results),
+                "tests_total": sum(r["total"] for r in results),
+            }
+            for agentId, results in state["results"].items()
+        }
+
+    def judge_view(self, state):
+        """Every problem with both agents' test results and last submissions."""
+        output = ""
+        for index, problem in enumerate(self.problems[:state["problem"]]):
+            output += f"--- Problem {index + 1}: {problem['prompt']}\n"
+            for agentId, results in state["results"].items():
+                result = results[index]
+                output += (f"\nAgent {agentId} passed {result['passed']} / {result['total']} tests "
+                           f"in {result['attempts']} attempt(s):\n```python\n{result['code'].strip()}\n```\n")
+            output += "\n"
+        return output
+
+    def render(self, state):
+        output = f"=== Coding Battle - Problem {min(state['problem'] + 1, len(self.problems))} / {len(self.problems)} ===\n\n"
+        for agentId, results in state["results"].items():
+            output += f"Agent {agentId} Score: {self._points(state, agentId)}\n"
+            for problem, result in zip(self.problems, results):
+                output += (f"  {problem.get('id', '?')}: {result['passed']} / {result['total']} tests"
+                           f" in {result['attempts']} attempt(s)\n")
+
+        if state["done"]:
+            points = {agentId: self._points(state, agentId) for agentId in state["results"]}
+            if points[0] > points[1]:
+                output += "\nWinner: Agent 0\n"
+            elif points[1] > points[0]:
+                output += "\nWinner: Agent 1\n"
+            else:
+                output += "\nResult: TIE\n"
 
-- Guojia La
-"""
\ No newline at end of file
+        return output
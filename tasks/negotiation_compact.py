@@ -0,0 +1,271 @@
+"""
+Compact, array-backed NegotiationGame state and a batched self-play simulator.
+
+NegotiationGame keeps inventories as lists of item names and valuations as dicts,
+which is what the prompts and logs want but far too slow for simulating millions of
+games. Here a game is:
+
+    item ids:     index into the item pool (NegotiationGame().item_pool)
+    inventories:  one int64 bitmask per agent, bit i set = agent owns item i
+    valuations:   int array (2, pool size), valuations[agent, item]
+
+and a batch of G games is the same thing with a leading G axis.
+
+simulate() plays a batch of seeded games between scripted strategies, all games in
+lock step, to calibrate items_per_agent / value ranges / max_rounds before spending
+API budget:
+
+    python -m tasks.negotiation_compact --games 1000000 --items 2,3,4 --max-rounds 5,10 --values 3:10,1:20
+
+Scripted players take turns proposing (seat round % 2 proposes in each round) and
+the other seat accepts when the proposal is worth at least its accept margin to it.
+Batch games are dealt with NumPy's RNG, so seed s here is not the same deal as
+NegotiationGame.init(s); use to_compact() for that.
+"""
+import argparse
+from itertools import product
+
+import numpy as np
+
+POOL_SIZE = 15
+
+
+def item_bits(pool_size):
+    return np.arange(pool_size, dtype=np.int64)
+
+
+def mask_items(masks, pool_size):
+    """(...,) bitmasks -> (..., pool_size) 0/1 array."""
+    return (masks[..., None] >> item_bits(pool_size)) & 1
+
+
+def mask_value(values, masks):
+    """Total value of the items in masks: values (..., pool_size), masks (...,)."""
+    return (mask_items(masks, values.shape[-1]) * values).sum(-1)
+
+
+def one_hot(items):
+    return np.left_shift(np.int64(1), items.astype(np.int64))
+
+
+def to_compact(state, item_pool):
+    """
+    One NegotiationGame state -> (valuations (2, pool), inventories (2,), initial inventories (2,)).
+    """
+    index = {item: i for i, item in enumerate(item_pool)}
+    values = np.zeros((2, len(item_pool)), dtype=np.int32)
+    for agentId in (0, 1):
+        for item, value in state["valuations"][agentId].items():
+            values[agentId, index[item]] = value
+
+    def _mask(items):
+        return sum(1 << index[item] for item in items)
+
+    inventories = np.array([_mask(state["inventories"][a]) for a in (0, 1)], dtype=np.int64)
+    initial = np.array([_mask(state["initial_inventories"][a]) for a in (0, 1)], dtype=np.int64)
+    return values, inventories, initial
+
+
+def from_compact(inventories, item_pool):
+    """Bitmasks back to NegotiationGame inventories ({agent: [item names]}, in pool order)."""
+    return {agentId: [item for i, item in enumerate(item_pool) if int(inventories[agentId]) >> i & 1]
+            for agentId in (0, 1)}
+
+
+def compact_scores(values, initial, inventories):
+    """
+    NegotiationGame.score for a batch: values (..., 2, pool), initial/inventories (..., 2).
+
+    Returns:
+        (initial_value, final_value, gain), each (..., 2)
+    """
+    initial_value = mask_value(values, initial)
+    final_value = mask_value(values, inventories)
+    return initial_value, final_value, final_value - initial_value
+
+
+def deal(games, rng, items_per_agent=3, value_range=(3, 10), pool_size=POOL_SIZE):
+    """
+    Deal a batch of games like NegotiationGame.init: 2 * items_per_agent distinct
+    items split between the agents, and every agent values every item in play
+    uniformly in value_range (inclusive).
+
+    Returns:
+        valuations (games, 2, pool_size) int32 and inventories (games, 2) int64
+    """
+    if 2 * items_per_agent > pool_size:
+        raise ValueError(f"can't deal {2 * items_per_agent} items from a pool of {pool_size}")
+    low, high = value_range
+    items = np.argsort(rng.random((games, pool_size)), axis=1)[:, :2 * items_per_agent]
+    inventories = np.stack([one_hot(items[:, :items_per_agent]).sum(1),
+                            one_hot(items[:, items_per_agent:]).sum(1)], axis=1)
+    in_play = mask_items(inventories[:, 0] | inventories[:, 1], pool_size)
+    values = rng.integers(low, high + 1, size=(games, 2, pool_size), dtype=np.int32) * in_play[:, None, :]
+    return values, inventories
+
+
+def _pick(scores, allowed):
+    # argmax of scores over the allowed items, per game
+    return np.where(allowed == 1, scores, -np.inf).argmax(1)
+
+
+def greedy_strategy(values, mine, theirs, round_index, max_rounds, rng):
+    """Offer my least valuable item for the opponent's item I value most."""
+    pool_size = values.shape[1]
+    give = _pick(-values, mask_items(mine, pool_size))
+    get = _pick(values, mask_items(theirs, pool_size))
+    return one_hot(give), one_hot(get)
+
+
+def random_strategy(values, mine, theirs, round_index, max_rounds, rng):
+    """Offer a random item of mine for a random item of theirs."""
+    pool_size = values.shape[1]
+    noise = rng.random(values.shape)
+    give = _pick(noise, mask_items(mine, pool_size))
+    get = _pick(noise, mask_items(theirs, pool_size))
+    return one_hot(give), one_hot(get)
+
+
+def conceding_strategy(values, mine, theirs, round_index, max_rounds, rng):
+    """Start like greedy, then give away more valuable items as the rounds run out."""
+    pool_size = values.shape[1]
+    owned = mask_items(mine, pool_size)
+    # rank 0 = my least valuable item; concede up the ranking over the match
+    ranks = np.where(owned == 1, values, np.iinfo(np.int32).max).argsort(1).argsort(1)
+    target = np.minimum(round_index * owned.sum(1) // max(max_rounds, 1), owned.sum(1) - 1)
+    give = _pick(-np.abs(ranks - target[:, None]).astype(float), owned)
+    get = _pick(values, mask_items(theirs, pool_size))
+    return one_hot(give), one_hot(get)
+
+
+STRATEGIES = {
+    "greedy": greedy_strategy,
+    "random": random_strategy,
+    "conceding": conceding_strategy,
+}
+
+
+class BatchResult:
+    def __init__(self, values, initial, inventories, deal_completed, rounds):
+        self.values = values
+        self.initial = initial
+        self.inventories = inventories
+        self.deal_completed = deal_completed
+        self.rounds = rounds
+        self.initial_value, self.final_value, self.gain = compact_scores(values, initial, inventories)
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def summary(self):
+        return {
+            "games": len(self),
+            "deal_rate": float(self.deal_completed.mean()),
+            "mean_rounds": float(self.rounds.mean()),
+            "mean_gain": [float(g) for g in self.gain.mean(0)],
+            "mean_surplus": float(self.gain.sum(1).mean()),
+            # deals that left someone worse off
+            "bad_deal_rate": float((self.deal_completed & (self.gain.min(1) < 0)).mean()),
+        }
+
+
+def simulate(games, seed=0, items_per_agent=3, max_rounds=10, value_range=(3, 10),
+             strategies=("greedy", "greedy"), accept_margins=(1, 1), pool_size=POOL_SIZE):
+    """
+    Play a batch of games between two scripted strategies.
+
+    Args:
+        games: number of games
+        seed: seed for dealing and for the strategies' randomness
+        strategies: names from STRATEGIES, or callables
+                    (values, mine, theirs, round_index, max_rounds, rng) -> (gives, gets)
+                    working on the proposer's side of the still running games
+        accept_margins: minimum gain (own valuation) at which each seat accepts
+
+    Returns:
+        BatchResult
+    """
+    rng = np.random.default_rng(seed)
+    values, inventories = deal(games, rng, items_per_agent, value_range, pool_size)
+    initial = inventories.copy()
+    players = [STRATEGIES[s] if isinstance(s, str) else s for s in strategies]
+
+    deal_completed = np.zeros(games, dtype=bool)
+    rounds = np.full(games, max_rounds, dtype=np.int32)
+    active = np.arange(games)
+    for round_index in range(max_rounds):
+        if active.size == 0:
+            break
+        proposer = round_index % 2
+        accepter = 1 - proposer
+        mine, theirs = inventories[active, proposer], inventories[active, accepter]
+        gives, gets = players[proposer](values[active, proposer], mine, theirs, round_index, max_rounds, rng)
+
+        their_values = values[active, accepter]
+        accepted = mask_value(their_values, gives) - mask_value(their_values, gets) >= accept_margins[accepter]
+
+        done = active[accepted]
+        inventories[done, proposer] = (mine[accepted] & ~gives[accepted]) | gets[accepted]
+        inventories[done, accepter] = (theirs[accepted] & ~gets[accepted]) | gives[accepted]
+        deal_completed[done] = True
+        rounds[done] = round_index + 1
+        active = active[~accepted]
+
+    return BatchResult(values, initial, inventories, deal_completed, rounds)
+
+
+def sweep(games, seed=0, items_per_agent=(3,), max_rounds=(10,), value_ranges=((3, 10),),
+          strategies=("greedy", "greedy"), accept_margins=(1, 1), chunk_size=250_000):
+    """
+    simulate() over every combination of parameters, in chunks so memory stays flat.
+
+    Returns:
+        list of summary dicts (see BatchResult.summary) with the parameters added
+    """
+    rows = []
+    for items, rounds, values in product(items_per_agent, max_rounds, value_ranges):
+        seeds = np.random.SeedSequence([seed, items, rounds, *values]).spawn(-(-games // chunk_size))
+        totals = {}
+        for start, chunk_seed in zip(range(0, games, chunk_size), seeds):
+            size = min(chunk_size, games - start)
+            result = simulate(size, seed=chunk_seed, items_per_agent=items, max_rounds=rounds,
+                              value_range=values, strategies=strategies, accept_margins=accept_margins)
+            for key, value in result.summary().items():
+                if key == "games":
+                    continue
+                value = np.asarray(value) * size
+                totals[key] = totals[key] + value if key in totals else value
+        row = {"items_per_agent": items, "max_rounds": rounds, "value_range": list(values), "games": games}
+        row.update({key: (total / games).tolist() for key, total in totals.items()})
+        rows.append(row)
+    return rows
+
+
+def _ints(text):
+    return [int(v) for v in text.split(",")]
+
+
+def _ranges(text):
+    return [tuple(int(v) for v in part.split(":")) for part in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched NegotiationGame self-play with scripted strategies")
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--items", type=_ints, default=[3], help="items_per_agent values, e.g. 2,3,4")
+    parser.add_argument("--max-rounds", type=_ints, default=[10])
+    parser.add_argument("--values", type=_ranges, default=[(3, 10)], help="value ranges, e.g. 3:10,1:20")
+    parser.add_argument("--strategies", default="greedy,greedy", help=f"two of {', '.join(STRATEGIES)}")
+    parser.add_argument("--accept-margins", type=_ints, default=[1, 1])
+    args = parser.parse_args()
+
+    rows = sweep(args.games, seed=args.seed, items_per_agent=args.items, max_rounds=args.max_rounds,
+                 value_ranges=args.values, strategies=tuple(args.strategies.split(",")),
+                 accept_margins=tuple(args.accept_margins))
+    for row in rows:
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
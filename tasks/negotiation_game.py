@@ -39,18 +39,106 @@ Notes:
     - May have to limit conversation lengths to the context windows of the agents
     - Maybe we don't even want them to know the opposing trader's inventory stock? Perhaps giving the LLMs the option to disclose their inventories will be fruitful.
 """
-import random
 import re
-
-from tasks.tasks import Task
+from bisect import bisect_left
+
+from tasks.actions import ActionSchema, InvalidAction
+from tasks.negotiation_solver import SolutionCache, efficiency, get_solution, solution_key
+from tasks.tasks import MatchRandom, Task, estimate_tokens
+
+INSTRUCTIONS = (
+    "INSTRUCTIONS:\n"
+    "1. Trade proposal: 'PROPOSE: I give [items] for your [items]'\n"
+    "2. Accept their proposal: 'ACCEPT'\n"
+    "3. Reject: 'REJECT'\n"
+    "4. General message/question: Any other text\n"
+)
+
+NEGOTIATION_ACTIONS = ActionSchema(
+    "negotiation_move",
+    {
+        "action": {"type": "string", "enum": ["propose", "accept", "reject", "message"], "required": True,
+                   "description": "propose a trade, accept or reject the opponent's current proposal, or just talk"},
+        "give": {"type": "array", "items": "string", "description": "items from your inventory you would give"},
+        "get": {"type": "array", "items": "string", "description": "items from their inventory you want"},
+        "message": {"type": "string", "description": "anything you want to say to the other party"},
+    },
+    discriminator="action",
+    requires={"propose": ["give", "get"], "message": ["message"]},
+    description="Your move in the negotiation",
+)
+STRUCTURED_INSTRUCTIONS = NEGOTIATION_ACTIONS.describe()
+
+# free text mode: a reply accepts only if it starts with ACCEPT ("I don't ACCEPT" doesn't)
+_ACCEPT = re.compile(r"^\W*ACCEPT\b", re.IGNORECASE)
+
+# how many per-agent history views we keep around before dropping the oldest ones
+MAX_HISTORY_VIEWS = 1024
+
+
+class _HistoryView:
+    """
+    One agent's rendered view of the conversation. Only messages added since the
+    last observe() get rendered, instead of the whole history every turn.
+    """
+
+    def __init__(self, conversation, agentId):
+        self.conversation = conversation
+        self.agentId = agentId
+        self.lines = []
+        # cum_tokens[i] = estimated tokens in lines[:i]
+        self.cum_tokens = [0]
+
+    def update(self):
+        for msg in self.conversation[len(self.lines):]:
+            speaker = "You" if msg["agent"] == self.agentId else "Opponent"
+            line = f"{speaker}: {msg['message']}\n"
+            self.lines.append(line)
+            self.cum_tokens.append(self.cum_tokens[-1] + estimate_tokens(line))
+
+    def render(self, token_budget=None):
+        self.update()
+        start = 0
+        if token_budget is not None:
+            # first line from which the rest of the history fits in the budget
+            start = bisect_left(self.cum_tokens, self.cum_tokens[-1] - token_budget)
+        if start == 0:
+            return "".join(self.lines)
+        first_round = self.conversation[0]["round"]
+        last_round = self.conversation[start - 1]["round"]
+        note = f"[{start} earlier messages from rounds {first_round}-{last_round} omitted]\n"
+        return note + "".join(self.lines[start:])
 
 
 class NegotiationGame(Task):
+    supports_sessions = True
 
-    def __init__(self, items_per_agent=3, max_rounds=10, hidden_inventory=False):
+    def __init__(self, items_per_agent=3, max_rounds=10, hidden_inventory=False, history_token_budget=None,
+                 value_range=(3, 10), solution_cache=None, structured_actions=False):
+        """
+        structured_actions: agents reply with JSON moves (NEGOTIATION_ACTIONS) that the
+        engine validates, instead of free text.
+        value_range: (low, high) inclusive range every item's value is drawn from.
+        solution_cache: SolutionCache (or its path) for the best-trade solutions that
+        score() compares deals against. Solutions are memoized per process either way.
+        history_token_budget: max (estimated) tokens of conversation history shown to an
+        agent. Older messages are dropped, oldest first, and replaced by a one line note.
+        None shows the whole conversation.
+        """
         self.items_per_agent = items_per_agent
         self.max_rounds = max_rounds
         self.hidden_inventory = hidden_inventory
+        self.history_token_budget = history_token_budget
+        self.value_range = tuple(value_range)
+        if isinstance(solution_cache, str):
+            solution_cache = SolutionCache(solution_cache)
+        self.solution_cache = solution_cache
+        self.structured_actions = structured_actions
+        if structured_actions:
+            self.action_schema = NEGOTIATION_ACTIONS
+        self.instructions = STRUCTURED_INSTRUCTIONS if structured_actions else INSTRUCTIONS
+        # (id(conversation), agentId) -> _HistoryView
+        self._history_views = {}
 
         self.item_pool = [
             "Apple", "Banana", "Orange", "Grape", "Mango",
@@ -58,10 +146,18 @@ class NegotiationGame(Task):
             "Bread", "Cheese", "Milk", "Eggs", "Butter"
         ]
 
+    def config(self):
+        # the solution cache is a per-machine speedup, not part of the game
+        return {"items_per_agent": self.items_per_agent, "max_rounds": self.max_rounds,
+                "hidden_inventory": self.hidden_inventory, "history_token_budget": self.history_token_budget,
+                "value_range": list(self.value_range), "structured_actions": self.structured_actions}
+
     def init(self, seed=None):
-        random.seed(seed)
+        # the match's own RNG, never the global one (see MatchRandom). Only the deal is
+        # random, so it isn't kept in the state (and checkpointed every round)
+        rng = MatchRandom(seed)
 
-        all_items = random.sample(self.item_pool, self.items_per_agent * 2)
+        all_items = rng.sample(self.item_pool, self.items_per_agent * 2)
         agent0_items = all_items[:self.items_per_agent]
         agent1_items = all_items[self.items_per_agent:]
 
@@ -75,21 +171,27 @@ class NegotiationGame(Task):
         dictionary approach. 
         - Guojia La
         """
+        low, high = self.value_range
         state = {
+            "seed": seed,
             "round": 0,
             "done": False,
             "inventories": {
                 0: agent0_items.copy(),
                 1: agent1_items.copy()
             },
+            "initial_inventories": {
+                0: agent0_items.copy(),
+                1: agent1_items.copy()
+            },
             "valuations": {
                 0: {
-                    **{item: random.randint(3,10) for item in agent0_items},
-                    **{item: random.randint(3,10) for item in agent1_items}
+                    **{item: rng.randint(low, high) for item in agent0_items},
+                    **{item: rng.randint(low, high) for item in agent1_items}
                 },
                 1: {
-                    **{item: random.randint(3,10) for item in agent1_items},
-                    **{item: random.randint(3,10) for item in agent0_items}
+                    **{item: rng.randint(low, high) for item in agent1_items},
+                    **{item: rng.randint(low, high) for item in agent0_items}
                 }
             },
             "conversation": [],
@@ -108,73 +210,180 @@ class NegotiationGame(Task):
 
 
         # here we are building out prompt for the LLM agent, so they knwo what is going on.
-        # obs is a VERY long string.
-        obs = f"== NEGOTIATION ROUND {state['round']} / {self.max_rounds} ==== \n \n"
-        obs += "You are a trader negotiating with another party.\n\n"
-        obs += "YOUR INVENTORY:\n"
+        # obs is a VERY long string, so collect the pieces and join them once at the end.
+        parts = [
+            f"== NEGOTIATION ROUND {state['round']} / {self.max_rounds} ==== \n \n",
+            "You are a trader negotiating with another party.\n\n",
+            "YOUR INVENTORY:\n",
+        ]
         for item in my_inventory:
-            obs += f"- {item}: worth ${my_valuations[item]} to you\n"
+            parts.append(f"- {item}: worth ${my_valuations[item]} to you\n")
 
         # we can omit the sum of the inventory value if we want to test  LLM's ability to calculate it themselves
-        obs += f"Total value: ${sum(my_valuations[item] for item in my_inventory)}\n\n"
+        parts.append(f"Total value: ${sum(my_valuations[item] for item in my_inventory)}\n\n")
 
 
         if self.hidden_inventory:
-            obs += "OPPONENT'S INVENTORY: Unknown (discover through conversation)\n\n"
+            parts.append("OPPONENT'S INVENTORY: Unknown (discover through conversation)\n\n")
         else:
-            obs += "OPPONENT'S INVENTORY:\n"
+            parts.append("OPPONENT'S INVENTORY:\n")
             for item in opponent_inventory:
-                obs += f"- {item}: worth ${my_valuations[item]} to you (they value it differently)\n"
-            obs += f"Potential value: ${sum(my_valuations[item] for item in opponent_inventory)}\n\n"
+                parts.append(f"- {item}: worth ${my_valuations[item]} to you (they value it differently)\n")
+            parts.append(f"Potential value: ${sum(my_valuations[item] for item in opponent_inventory)}\n\n")
 
 
         # get teh agent up to speed on the conversation thus far, if the converssation exists.
         # otherwise, tell the LLM that this is the beginning of the conversation
         if state["conversation"]:
-            obs += "CONVERSATION HISTORY:\n"
-            for msg in state["conversation"]:
-                speaker = "You" if msg["agent"] == agentId else "Opponent"
-                obs += f"{speaker}: {msg['message']}\n"
-            obs += "\n"
+            parts.append("CONVERSATION HISTORY:\n")
+            parts.append(self._history_view(state, agentId).render(self.history_token_budget))
+            parts.append("\n")
         else:
-            obs += "No messages yet. Start the negotiation.\n\n"
+            parts.append("No messages yet. Start the negotiation.\n\n")
+
+        parts.append(self.instructions)
+        parts.append("\nYour response:")
+
+        return "".join(parts)
+
+    def observe_prefix(self, state, agentId):
+        # inventories and valuations only change when a deal closes, which ends the game,
+        # so all of this is the same for the whole match
+        opponent_id = 1 - agentId
+        my_inventory = state["inventories"][agentId]
+        opponent_inventory = state["inventories"][opponent_id]
+        my_valuations = state["valuations"][agentId]
 
-        obs += "INSTRUCTIONS:\n"
-        obs += "1. Trade proposal: 'PROPOSE: I give [items] for your [items]'\n"
-        obs += "2. Accept their proposal: 'ACCEPT'\n"
-        obs += "3. Reject: 'REJECT'\n"
-        obs += "4. General message/question: Any other text\n"
-        obs += "\nYour response:"
+        parts = [
+            "You are a trader negotiating with another party.\n",
+            f"The negotiation lasts at most {self.max_rounds} rounds. Each round you will see what the other party said.\n\n",
+            "YOUR INVENTORY:\n",
+        ]
+        for item in my_inventory:
+            parts.append(f"- {item}: worth ${my_valuations[item]} to you\n")
+        parts.append(f"Total value: ${sum(my_valuations[item] for item in my_inventory)}\n\n")
 
-        return obs
+        if self.hidden_inventory:
+            parts.append("OPPONENT'S INVENTORY: Unknown (discover through conversation)\n\n")
+        else:
+            parts.append("OPPONENT'S INVENTORY:\n")
+            for item in opponent_inventory:
+                parts.append(f"- {item}: worth ${my_valuations[item]} to you (they value it differently)\n")
+            parts.append(f"Potential value: ${sum(my_valuations[item] for item in opponent_inventory)}\n\n")
+
+        parts.append(self.instructions)
+        return "".join(parts)
+
+    def observe_delta(self, state, agentId):
+        # the agent's own messages are already in its session as its replies,
+        # so only the opponent's messages from the last round are new
+        parts = [f"== NEGOTIATION ROUND {state['round']} / {self.max_rounds} ==== \n \n"]
+        new_messages = [msg for msg in state["conversation"]
+                        if msg["round"] == state["round"] - 1 and msg["agent"] != agentId]
+        if new_messages:
+            for msg in new_messages:
+                parts.append(f"Opponent: {msg['message']}\n")
+        elif not state["conversation"]:
+            parts.append("No messages yet. Start the negotiation.\n")
+        parts.append("\nYour response:")
+        return "".join(parts)
+
+    def _history_view(self, state, agentId):
+        conversation = state["conversation"]
+        key = (id(conversation), agentId)
+        view = self._history_views.get(key)
+        # a different list that happens to reuse the id, or a history that was rewritten: start over
+        if view is None or view.conversation is not conversation or len(view.lines) > len(conversation):
+            if len(self._history_views) >= MAX_HISTORY_VIEWS:
+                # another thread may have evicted it first
+                self._history_views.pop(next(iter(self._history_views)), None)
+            view = _HistoryView(conversation, agentId)
+            self._history_views[key] = view
+        return view
+
+    def _drop_history_views(self, state):
+        conversation_id = id(state["conversation"])
+        for agentId in (0, 1):
+            self._history_views.pop((conversation_id, agentId), None)
 
     def step(self, state, actions):
-        for agentID,action in actions.items():
+        moves = {agentID: self._move(action, agentID, state) for agentID, action in actions.items()}
+        for agentID, move in moves.items():
             state["conversation"].append({
                 "round": state["round"],
                 "agent": agentID,
-                "message": action
+                "message": move["text"]
             })
-            #check for acceptance
-            for agentID, action in actions.items():
-                if "ACCEPT" in action.upper():
-                    if state["current_proposal"]:
-                        state["deal_completed"] = True
-                        state["final_trade"] = state["current_proposal"]
-                        state["done"] = True
-                        self.execute_trade(state,state["current_proposal"])
-                        return state
-            # check for proposals:
-            for agentID, action in actions.items():
-                proposal = self._parse_proposal(action,agentID, state)
-                if proposal:
-                    state["current_proposal"] = proposal
-            state["round"] += 1
-
-            if state["round"] >= self.max_rounds:
+        #check for acceptance of the other agent's proposal
+        for agentID, move in moves.items():
+            proposal = state["current_proposal"]
+            if move["action"] == "accept" and proposal and proposal["proposer"] != agentID:
+                state["deal_completed"] = True
+                state["final_trade"] = proposal
                 state["done"] = True
+                self.execute_trade(state, proposal)
+                self._drop_history_views(state)
+                return state
+        # check for proposals:
+        for agentID, move in moves.items():
+            if move["proposal"]:
+                state["current_proposal"] = move["proposal"]
+        state["round"] += 1
+
+        if state["round"] >= self.max_rounds:
+            state["done"] = True
+            self._drop_history_views(state)
 
-            return state
+        return state
+
+    def _move(self, action, agentID, state):
+        """Free text or a parsed structured action -> {"action", "proposal", "text"}"""
+        if isinstance(action, dict):
+            kind = action["action"]
+            proposal = None
+            if kind == "propose":
+                proposal = {
+                    "proposer": agentID,
+                    "proposer_gives": [item.strip().title() for item in action["give"]],
+                    "proposer_gets": [item.strip().title() for item in action["get"]]
+                }
+            return {"action": kind, "proposal": proposal, "text": self._move_text(action, proposal)}
+
+        if _ACCEPT.match(action):
+            return {"action": "accept", "proposal": None, "text": action}
+        proposal = self._parse_proposal(action, agentID, state)
+        return {"action": "propose" if proposal else "message", "proposal": proposal, "text": action}
+
+    @staticmethod
+    def _move_text(action, proposal):
+        # what the other agent sees in the conversation, in the same words as free text mode
+        if proposal:
+            text = f"PROPOSE: I give {', '.join(proposal['proposer_gives'])} for your {', '.join(proposal['proposer_gets'])}"
+        elif action["action"] in ("accept", "reject"):
+            text = action["action"].upper()
+        else:
+            text = ""
+        message = action.get("message", "")
+        return f"{text} - {message}" if text and message else text or message
+
+    def validate_move(self, state, agentId, action):
+        kind = action["action"]
+        if kind == "accept":
+            proposal = state["current_proposal"]
+            if not proposal or proposal["proposer"] == agentId:
+                raise InvalidAction("there is no proposal from the other party to accept")
+        elif kind == "propose":
+            mine = {item.title() for item in state["inventories"][agentId]}
+            theirs = {item.title() for item in state["inventories"][1 - agentId]}
+            bad_give = [item for item in action["give"] if item.strip().title() not in mine]
+            if bad_give:
+                raise InvalidAction(f"you don't have {', '.join(bad_give)} "
+                                    f"(your items: {', '.join(state['inventories'][agentId])})")
+            if not self.hidden_inventory:
+                bad_get = [item for item in action["get"] if item.strip().title() not in theirs]
+                if bad_get:
+                    raise InvalidAction(f"they don't have {', '.join(bad_get)} "
+                                        f"(their items: {', '.join(state['inventories'][1 - agentId])})")
 
     def _parse_proposal(self, message, proposer_id, state):
         if "PROPOSE" not in message.upper():
@@ -220,6 +429,13 @@ class NegotiationGame(Task):
                 state["inventories"][accepter].remove(item)
                 state["inventories"][proposer].append(item)
 
+    def solution(self, state):
+        """Pareto frontier, max surplus and Nash trades for this state's deal (see negotiation_solver)."""
+        key = None
+        if state.get("seed") is not None:
+            key = solution_key(state["seed"], self.items_per_agent, self.item_pool, self.value_range)
+        return get_solution(state, key, self.solution_cache)
+
     def score(self, state):
         scores = {}
 
@@ -240,6 +456,11 @@ class NegotiationGame(Task):
                 "deal_completed": state["deal_completed"]
             }
 
+        # how close the outcome came to the best trades available for this deal
+        result = efficiency(self.solution(state), (scores[0]["gain"], scores[1]["gain"]))
+        for agentId in [0, 1]:
+            scores[agentId].update(result)
+
         return scores
     def render(self, state):
         output = f"=== Negotiation Game - Round {state['round']} ===\n\n"
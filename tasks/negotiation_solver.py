@@ -0,0 +1,228 @@
+"""
+Best achievable trades for a NegotiationGame deal.
+
+A trade can move any subset of the items in play either way, so the possible
+outcomes are all 2^n ways of splitting the n = 2 * items_per_agent items between
+the two agents. We enumerate them as bitmasks (bit i set = agent 0 ends up with item
+i) in NumPy chunks and keep:
+
+    frontier      Pareto frontier of (gain 0, gain 1) over all splits
+    max_surplus   the split with the largest gain 0 + gain 1 that leaves nobody worse off
+    nash          the split maximizing gain 0 * gain 1 (Nash bargaining point, with
+                  "no deal" as the disagreement point)
+
+Solutions are memoized per process and optionally stored in a SQLite file, keyed by
+(seed, items_per_agent, item pool, value range): the deal is a function of those, so
+a seed only has to be solved once, ever.
+
+    python -m tasks.negotiation_solver --seeds 0:10000 --items 3 --cache solutions.db
+"""
+import argparse
+import json
+import sqlite3
+import threading
+
+import numpy as np
+
+# splits enumerated per chunk: 2^20 masks is a few tens of MB of temporaries
+CHUNK_BITS = 20
+# solutions kept in memory per process before dropping the oldest ones
+MAX_MEMO = 100_000
+
+
+def _subset_sums(values):
+    """sums[m] = total of values[i] for every bit i set in m, for all 2^len(values) masks."""
+    sums = np.zeros(1, dtype=np.int64)
+    for v in values:
+        sums = np.concatenate([sums, sums + v])
+    return sums
+
+
+def pareto_frontier(gains, masks=None):
+    """
+    Non-dominated (gain 0, gain 1) points, sorted by gain 0 descending.
+
+    Args:
+        gains: (N, 2) array
+        masks: optional (N,) array carried along with the points
+
+    Returns:
+        (frontier gains, frontier masks or None)
+    """
+    order = np.lexsort((-gains[:, 1], -gains[:, 0]))
+    g = gains[order]
+    best_before = np.maximum.accumulate(np.concatenate([[np.iinfo(np.int64).min], g[:-1, 1]]))
+    keep = g[:, 1] > best_before
+    return g[keep], None if masks is None else masks[order][keep]
+
+
+def solve_state(state):
+    """
+    Solve the deal in a NegotiationGame state (its initial inventories and valuations).
+
+    Returns:
+        dict with "items", "frontier", "max_surplus", "nash"; splits are given as
+        {"gains": [g0, g1], "allocation": {0: [items], 1: [items]}}
+    """
+    items = list(state["initial_inventories"][0]) + list(state["initial_inventories"][1])
+    n = len(items)
+    v0 = np.array([state["valuations"][0][item] for item in items], dtype=np.int64)
+    v1 = np.array([state["valuations"][1][item] for item in items], dtype=np.int64)
+    # agent 0 starts with the first len(inventory 0) items
+    split = len(state["initial_inventories"][0])
+    init0 = int(v0[:split].sum())
+    init1 = int(v1[split:].sum())
+    total1 = int(v1.sum())
+
+    low_bits = min(n, CHUNK_BITS)
+    low0, low1 = _subset_sums(v0[:low_bits]), _subset_sums(v1[:low_bits])
+    high0, high1 = _subset_sums(v0[low_bits:]), _subset_sums(v1[low_bits:])
+    low_masks = np.arange(1 << low_bits, dtype=np.int64)
+
+    candidates, candidate_masks = [], []
+    best_surplus, best_nash = None, None
+    for high in range(1 << (n - low_bits)):
+        masks = low_masks | (high << low_bits)
+        gains = np.stack([low0 + high0[high] - init0,
+                          total1 - (low1 + high1[high]) - init1], axis=1)
+        frontier, frontier_masks = pareto_frontier(gains, masks)
+        candidates.append(frontier)
+        candidate_masks.append(frontier_masks)
+
+        rational = (gains >= 0).all(1)
+        surplus = np.where(rational, gains.sum(1), -1)
+        i = int(surplus.argmax())
+        if best_surplus is None or surplus[i] > best_surplus[0]:
+            best_surplus = (int(surplus[i]), int(masks[i]), gains[i])
+        product = np.where(rational, gains[:, 0] * gains[:, 1], -1)
+        # ties on the product go to the bigger surplus
+        i = int(np.lexsort((surplus, product))[-1])
+        key = (int(product[i]), int(surplus[i]))
+        if best_nash is None or key > best_nash[0]:
+            best_nash = (key, int(masks[i]), gains[i])
+
+    frontier, frontier_masks = pareto_frontier(np.concatenate(candidates), np.concatenate(candidate_masks))
+
+    def _split(mask, gains):
+        return {
+            "gains": [int(gains[0]), int(gains[1])],
+            "allocation": {0: [item for i, item in enumerate(items) if mask >> i & 1],
+                           1: [item for i, item in enumerate(items) if not mask >> i & 1]},
+        }
+
+    return {
+        "items": items,
+        "frontier": frontier.tolist(),
+        "frontier_allocations": [_split(int(m), g)["allocation"] for m, g in zip(frontier_masks, frontier)],
+        "max_surplus": _split(best_surplus[1], best_surplus[2]),
+        "nash": _split(best_nash[1], best_nash[2]),
+    }
+
+
+def efficiency(solution, gains):
+    """
+    How good a result with the given (gain 0, gain 1) is compared to the best trades.
+
+    Returns:
+        {"surplus_efficiency": joint gain / best joint gain (None if no trade helps anyone),
+         "nash_efficiency": gain product / Nash product (None if the Nash product is 0),
+         "pareto_optimal": no split makes one agent better off without hurting the other}
+    """
+    g0, g1 = gains
+    best = sum(solution["max_surplus"]["gains"])
+    nash = solution["nash"]["gains"][0] * solution["nash"]["gains"][1]
+    dominated = any(f0 >= g0 and f1 >= g1 and (f0 > g0 or f1 > g1) for f0, f1 in solution["frontier"])
+    return {
+        "surplus_efficiency": (g0 + g1) / best if best > 0 else None,
+        "nash_efficiency": (g0 * g1 / nash if g0 >= 0 and g1 >= 0 else 0.0) if nash > 0 else None,
+        "pareto_optimal": not dominated,
+    }
+
+
+def solution_key(seed, items_per_agent, item_pool, value_range):
+    return json.dumps([seed, items_per_agent, list(item_pool), list(value_range)], separators=(",", ":"))
+
+
+class SolutionCache:
+    """Solutions in a SQLite file, shared by every process that points at it."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS solutions (key TEXT PRIMARY KEY, solution TEXT NOT NULL)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT solution FROM solutions WHERE key = ?", (key,)).fetchone()
+        return None if row is None else _decode(json.loads(row[0]))
+
+    def put(self, key, solution):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO solutions (key, solution) VALUES (?, ?)",
+                               (key, json.dumps(solution)))
+
+    def close(self):
+        self._conn.close()
+
+
+def _decode(solution):
+    # JSON turned the allocations' agent ids into strings
+    for split in [solution["max_surplus"], solution["nash"]]:
+        split["allocation"] = {int(k): v for k, v in split["allocation"].items()}
+    solution["frontier_allocations"] = [{int(k): v for k, v in a.items()} for a in solution["frontier_allocations"]]
+    return solution
+
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def get_solution(state, key=None, cache=None):
+    """
+    Solution for a state's deal, from memory, then the on-disk cache, then the solver.
+
+    Args:
+        key: solution_key(...) for the deal; None solves without caching
+        cache: optional SolutionCache
+    """
+    if key is None:
+        return solve_state(state)
+    with _memo_lock:
+        solution = _memo.get(key)
+    if solution is None and cache is not None:
+        solution = cache.get(key)
+    if solution is None:
+        solution = solve_state(state)
+        if cache is not None:
+            cache.put(key, solution)
+    with _memo_lock:
+        if len(_memo) >= MAX_MEMO:
+            _memo.pop(next(iter(_memo)))
+        _memo[key] = solution
+    return solution
+
+
+def main():
+    from tasks.negotiation_game import NegotiationGame
+
+    parser = argparse.ArgumentParser(description="Precompute negotiation solutions for a range of seeds")
+    parser.add_argument("--seeds", default="0:1000", help="low:high (high exclusive)")
+    parser.add_argument("--items", type=int, default=3, help="items_per_agent")
+    parser.add_argument("--values", default="3:10", help="value range low:high")
+    parser.add_argument("--cache", default="negotiation_solutions.db")
+    args = parser.parse_args()
+
+    low, high = (int(v) for v in args.seeds.split(":"))
+    value_range = tuple(int(v) for v in args.values.split(":"))
+    cache = SolutionCache(args.cache)
+    game = NegotiationGame(items_per_agent=args.items, value_range=value_range, solution_cache=cache)
+    for seed in range(low, high):
+        game.solution(game.init(seed))
+    print(f"Solved seeds {low}-{high - 1} into {args.cache}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Question bank for TriviaDuel that doesn't load the corpus into memory.
+
+The corpus is a JSONL file, one question per line:
+
+    {"question": "...", "answer": "...", "category": "history", "difficulty": "hard"}
+
+Next to it we keep a small binary index (<corpus>.idx), built once:
+
+    header:  magic (8s) | count (Q) | metadata length (Q)
+    metadata: JSON {"categories": [...], "difficulties": [...]}
+    records: count x (offset Q, length I, category H, difficulty H)
+
+Both files are mmap'd, so every worker process shares the OS page cache instead of
+holding its own parsed copy, and a question is only parsed when it is used.
+
+A question's id is its line number in the corpus.
+
+    bank = QuestionBank("questions.jsonl")
+    questions = bank.sample(20, seed=42, category="science")
+    task = TriviaDuel(questions)
+"""
+import json
+import mmap
+import os
+import random
+import struct
+from collections.abc import Sequence
+
+MAGIC = b"QBANK01\0"
+HEADER = struct.Struct("<8sQQ")
+RECORD = struct.Struct("<QIHH")
+MISSING = 0xFFFF
+
+
+def build_index(corpus_path, index_path=None):
+    """Scan the corpus once and write its index. Returns the index path."""
+    index_path = index_path or f"{corpus_path}.idx"
+    categories, difficulties = {}, {}
+    records = bytearray()
+    count = 0
+
+    with open(corpus_path, "rb") as f:
+        offset = 0
+        for line in f:
+            length = len(line)
+            stripped = line.strip()
+            if stripped:
+                question = json.loads(stripped)
+                category = _code(categories, question.get("category"))
+                difficulty = _code(difficulties, question.get("difficulty"))
+                records += RECORD.pack(offset, len(stripped), category, difficulty)
+                count += 1
+            offset += length
+
+    metadata = json.dumps({"categories": list(categories), "difficulties": list(difficulties)}).encode("utf-8")
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, len(metadata)))
+        f.write(metadata)
+        f.write(records)
+    # readers never see a half-written index
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def _code(codes, value):
+    if value is None:
+        return MISSING
+    value = str(value)
+    if value not in codes:
+        codes[value] = len(codes)
+    return codes[value]
+
+
+class QuestionBank:
+    def __init__(self, corpus_path, index_path=None):
+        self.corpus_path = str(corpus_path)
+        self.index_path = index_path or f"{self.corpus_path}.idx"
+        if (not os.path.exists(self.index_path)
+                or os.path.getmtime(self.index_path) < os.path.getmtime(self.corpus_path)):
+            build_index(self.corpus_path, self.index_path)
+
+        with open(self.corpus_path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.index_path, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count, meta_length = HEADER.unpack_from(self._index, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.index_path} is not a question bank index")
+        metadata = json.loads(self._index[HEADER.size:HEADER.size + meta_length])
+        self.categories = metadata["categories"]
+        self.difficulties = metadata["difficulties"]
+        self._records_start = HEADER.size + meta_length
+        # filtered id lists, so repeated sampling doesn't rescan the index
+        self._filtered = {}
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, question_id):
+        if not 0 <= question_id < self._count:
+            raise IndexError(question_id)
+        return RECORD.unpack_from(self._index, self._records_start + question_id * RECORD.size)
+
+    def __getitem__(self, question_id):
+        offset, length, _, _ = self._record(question_id)
+        question = json.loads(self._data[offset:offset + length])
+        question.setdefault("id", question_id)
+        return question
+
+    def ids(self, category=None, difficulty=None):
+        """Ids of every question matching the filters, without parsing any question."""
+        key = (category, difficulty)
+        if key not in self._filtered:
+            if category is None and difficulty is None:
+                self._filtered[key] = range(self._count)
+            else:
+                category_code = self._lookup(self.categories, category)
+                difficulty_code = self._lookup(self.difficulties, difficulty)
+                records = memoryview(self._index)[self._records_start:self._records_start + self._count * RECORD.size]
+                self._filtered[key] = [
+                    question_id
+                    for question_id, (_, _, cat, diff) in enumerate(RECORD.iter_unpack(records))
+                    if (category_code is None or cat == category_code)
+                    and (difficulty_code is None or diff == difficulty_code)
+                ]
+                records.release()
+        return self._filtered[key]
+
+    @staticmethod
+    def _lookup(names, value):
+        if value is None:
+            return None
+        try:
+            return names.index(str(value))
+        except ValueError:
+            # nothing in the corpus has this value, so the filter matches nothing
+            return -1
+
+    def shard(self, worker_index, num_workers, category=None, difficulty=None):
+        """The slice of (filtered) ids this worker is responsible for: every num_workers-th id."""
+        return self.ids(category, difficulty)[worker_index::num_workers]
+
+    def sample(self, k, seed, category=None, difficulty=None, shard=None):
+        """
+        Deterministically pick k questions: the same seed and filters always give
+        the same questions, in the same order, in every process.
+
+        Args:
+            shard: optional (worker_index, num_workers) to only draw from that shard
+        """
+        ids = self.ids(category, difficulty) if shard is None else self.shard(*shard, category, difficulty)
+        chosen = random.Random(seed).sample(ids, min(k, len(ids)))
+        return QuestionSet(self, chosen)
+
+
+class QuestionSet(Sequence):
+    """A handful of questions from a bank, parsed on access. Drop-in for TriviaDuel's questions list."""
+
+    def __init__(self, bank, ids):
+        self.bank = bank
+        self.ids = list(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return QuestionSet(self.bank, self.ids[i])
+        return self.bank[self.ids[i]]
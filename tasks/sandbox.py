@@ -0,0 +1,286 @@
+"""
+Pool of warm worker processes for running untrusted (LLM-written) code.
+
+Starting a fresh interpreter per submission costs tens of milliseconds, which adds up
+to hours over thousands of submissions with hundreds of test cases each. Instead the
+pool starts its workers once (spawned, so they are clean single-threaded interpreters,
+with the usual standard library imports already done), and every test case runs in a
+child that a worker os.fork()s for it: a millisecond or so, and every case still
+starts from the same clean state.
+
+The child, before it runs anything:
+
+    - gets its own process group, a private temp dir as cwd, /dev/null for fds 0-2
+      and no other inherited fds (so it can't talk to the pool's pipes)
+    - moves into new user + network namespaces where the kernel allows it: no
+      network at all; otherwise, if running as root, drops to nobody
+    - gets rlimits: CPU seconds, address space on top of what the worker already
+      uses, file size, open files, no core dumps
+
+and the worker SIGKILLs its process group when the case's wall clock timeout runs out.
+
+This is resource isolation, not a security boundary (the child can still see the
+filesystem and signal its worker). For code you really don't trust, run the workers
+in a container as well.
+
+Submissions are either a function (entry_point, every case gives "args") or a script
+(no entry_point, every case gives "stdin"). Only the inputs ever reach the sandbox;
+comparing against expected outputs is the caller's job (see tasks/coding_battle.py),
+so a submission can't read the answers out of its own memory.
+"""
+import ctypes
+import io
+import json
+import math
+import multiprocessing
+import os
+import resource
+import select
+import signal
+import sys
+import tempfile
+import time
+
+# from linux/sched.h
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+NOBODY = 65534
+
+# what LeetCode-style solutions usually import, loaded once per worker instead of per case
+WARM_MODULES = ("bisect", "collections", "functools", "heapq", "itertools", "math", "re", "string", "typing")
+
+
+def _warm():
+    for name in WARM_MODULES:
+        __import__(name)
+    # the pool's Ctrl-C handling belongs to the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _isolate_network():
+    """Move into new user + network namespaces. Returns whether that worked."""
+    flags = CLONE_NEWUSER | CLONE_NEWNET
+    try:
+        if hasattr(os, "unshare"):
+            os.unshare(flags)
+        else:
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.unshare(flags) != 0:
+                raise OSError(ctypes.get_errno(), "unshare failed")
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def _vm_bytes():
+    # current address space of this process, so the memory limit is on top of it
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        return 0
+
+
+def _set_limit(kind, value):
+    try:
+        resource.setrlimit(kind, (value, value))
+    except (ValueError, OSError):
+        pass
+
+
+def _apply_limits(limits):
+    _set_limit(resource.RLIMIT_CPU, max(1, math.ceil(limits["cpu_seconds"])))
+    _set_limit(resource.RLIMIT_AS, _vm_bytes() + limits["memory_mb"] * 1024 * 1024)
+    _set_limit(resource.RLIMIT_FSIZE, limits["file_size_mb"] * 1024 * 1024)
+    _set_limit(resource.RLIMIT_NOFILE, 64)
+    _set_limit(resource.RLIMIT_CORE, 0)
+
+
+def _child(code, entry_point, case, limits, out_fd, workdir):
+    """Runs in the forked child. Never returns."""
+    os.setpgid(0, 0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.closerange(3, out_fd)
+    os.closerange(out_fd + 1, 4096)
+    os.chdir(workdir)
+    isolated = _isolate_network()
+    if not isolated and os.geteuid() == 0:
+        os.setgid(NOBODY)
+        os.setuid(NOBODY)
+    _apply_limits(limits)
+
+    sys.stdin = io.StringIO(case.get("stdin", ""))
+    sys.stdout = stdout = io.StringIO()
+    sys.stderr = io.StringIO()
+    result = {"status": "ok", "isolated": isolated}
+    try:
+        namespace = {"__name__": "__main__" if entry_point is None else "submission"}
+        exec(compile(code, "<submission>", "exec"), namespace)
+        if entry_point is not None:
+            if not callable(namespace.get(entry_point)):
+                raise NameError(f"no function named {entry_point}")
+            result["value"] = namespace[entry_point](*case.get("args", []))
+    except MemoryError:
+        result = {"status": "memory", "isolated": isolated}
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            result = {"status": "error", "error": f"exit status {e.code}", "isolated": isolated}
+    except BaseException as e:
+        result = {"status": "error", "error": f"{type(e).__name__}: {e}"[:1000], "isolated": isolated}
+    result["stdout"] = stdout.getvalue()[:limits["max_output"]]
+
+    try:
+        payload = json.dumps(result)
+    except (TypeError, ValueError):
+        payload = json.dumps({"status": "error", "error": "return value is not JSON serializable",
+                              "stdout": result["stdout"], "isolated": isolated})
+    data = payload.encode()
+    while data:
+        data = data[os.write(out_fd, data):]
+    os._exit(0)
+
+
+def _read(fd, deadline, max_bytes):
+    """Read a pipe to EOF. Returns (data, why it stopped: None, "timeout" or "output")."""
+    chunks, size = [], 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return b"".join(chunks), "timeout"
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            continue
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return b"".join(chunks), None
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            return b"".join(chunks), "output"
+
+
+def run_case(code, entry_point, case, limits):
+    """
+    Run one test case in a forked, limited child (called in a pool worker).
+
+    Returns:
+        {"status": "ok" | "error" | "timeout" | "memory" | "killed" | "output",
+         "value": the function's return value, "stdout", "error", "time_ms", "isolated"}
+    """
+    read_fd, write_fd = os.pipe()
+    with tempfile.TemporaryDirectory(prefix="sandbox_") as workdir:
+        os.chmod(workdir, 0o777)
+        start = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                _child(code, entry_point, case, limits, write_fd, workdir)
+            finally:
+                os._exit(70)
+        os.close(write_fd)
+        try:
+            data, stopped = _read(read_fd, start + limits["timeout"], limits["max_output"] + 4096)
+        finally:
+            os.close(read_fd)
+        if stopped is not None:
+            _kill(pid)
+        _, status = os.waitpid(pid, 0)
+        elapsed = round((time.monotonic() - start) * 1000, 1)
+
+    if stopped is not None:
+        return {"status": stopped, "time_ms": elapsed}
+    if os.WIFSIGNALED(status):
+        # SIGXCPU / SIGKILL from the CPU limit, or the code killing itself
+        sig = os.WTERMSIG(status)
+        kind = "timeout" if sig in (signal.SIGXCPU, signal.SIGKILL) else "killed"
+        return {"status": kind, "error": f"signal {signal.Signals(sig).name}", "time_ms": elapsed}
+    try:
+        result = json.loads(data)
+    except ValueError:
+        return {"status": "killed", "error": f"exit status {os.WEXITSTATUS(status)}", "time_ms": elapsed}
+    result["time_ms"] = elapsed
+    return result
+
+
+def _kill(pid):
+    for target in (lambda: os.killpg(pid, signal.SIGKILL), lambda: os.kill(pid, signal.SIGKILL)):
+        try:
+            target()
+            return
+        except ProcessLookupError:
+            return
+        except PermissionError:
+            continue
+
+
+class SandboxPool:
+    def __init__(self, workers=None, cpu_seconds=2.0, memory_mb=256, file_size_mb=1, timeout=5.0,
+                 max_output=64 * 1024):
+        """
+        Args:
+            workers: worker processes (default: one per CPU)
+            cpu_seconds: CPU time per test case
+            memory_mb: memory a test case may allocate
+            file_size_mb: largest file a test case may write
+            timeout: wall clock seconds per test case
+            max_output: characters of stdout kept (a case printing more than that is stopped)
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.limits = {"cpu_seconds": cpu_seconds, "memory_mb": memory_mb, "file_size_mb": file_size_mb,
+                       "timeout": timeout, "max_output": max_output}
+        # spawn: clean interpreters even if this process has threads (fork + threads don't mix)
+        self._pool = multiprocessing.get_context("spawn").Pool(self.workers, initializer=_warm)
+        self.network_isolated = None
+
+    def run(self, code, cases, entry_point=None, timeout=None):
+        """Run one submission against its cases, spread over the workers. Results are in case order."""
+        return self.run_many([(code, cases, entry_point)], timeout=timeout)[0]
+
+    def run_many(self, submissions, timeout=None):
+        """
+        Run several submissions at once (e.g. both agents' code for a problem).
+
+        Args:
+            submissions: [(code, cases, entry_point)]; cases only need "args" or "stdin"
+            timeout: per case wall clock override
+
+        Returns:
+            one list of run_case results per submission
+        """
+        limits = dict(self.limits)
+        if timeout is not None:
+            limits["timeout"] = timeout
+        pending = []
+        for code, cases, entry_point in submissions:
+            inputs = [{k: case[k] for k in ("args", "stdin") if k in case} for case in cases]
+            pending.append([self._pool.apply_async(run_case, (code, entry_point, case, limits)) for case in inputs])
+
+        # cases queue behind each other, so the deadline is for the whole batch. A worker
+        # that died (the child can signal it) loses its case; the pool replaces the worker
+        total = sum(len(results) for results in pending)
+        deadline = time.monotonic() + math.ceil(total / self.workers) * (limits["timeout"] + 1) + 5
+        outcomes = []
+        for results in pending:
+            outcome = []
+            for result in results:
+                try:
+                    outcome.append(result.get(timeout=max(deadline - time.monotonic(), 0.1)))
+                except multiprocessing.TimeoutError:
+                    outcome.append({"status": "lost", "error": "worker died"})
+                if "isolated" in outcome[-1]:
+                    self.network_isolated = outcome[-1].pop("isolated")
+            outcomes.append(outcome)
+        return outcomes
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
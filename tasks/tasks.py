@@ -1,7 +1,37 @@
+import random
 from abc import ABC, abstractmethod
 
 
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token). Deterministic, no tokenizer needed."""
+    return len(text) // 4 + 1
+
+
+class MatchRandom(random.Random):
+    """
+    A match's own RNG. Tasks create it in init(seed) and draw from it instead of the
+    global random module, so matches running side by side in threads can't disturb
+    each other's streams. Same algorithm as random.seed, so seeds give the same games
+    as before. A task that keeps drawing after init keeps it in state["rng"], where it
+    is checkpointed with the rest of the state (about 7 KB per checkpoint), so don't
+    put it there if only init uses it.
+    """
+
+    def __eq__(self, other):
+        # two states are equal if they'll draw the same numbers from here on
+        return isinstance(other, random.Random) and self.getstate() == other.getstate()
+
+    __hash__ = None
+
+
 class Task(ABC):
+    # tasks that can split their observation into a stable prefix and per-turn deltas
+    # (observe_prefix / observe_delta) set this, and can then be played in session mode
+    supports_sessions = False
+    # structured action mode: an ActionSchema (tasks/actions.py) the engine validates
+    # every reply against before calling step; None means free text actions
+    action_schema = None
+
     @abstractmethod
     def init(self, seed):
         """Initialize game state"""
@@ -22,6 +52,22 @@ class Task(ABC):
         """Return final scores"""
         pass
 
+    def observe_prefix(self, state, agentId):
+        """Session mode: the part of the observation that stays the same all game"""
+        raise NotImplementedError
+
+    def observe_delta(self, state, agentId):
+        """Session mode: what is new for this agent since its last turn"""
+        raise NotImplementedError
+
+    def validate_move(self, state, agentId, action):
+        """Structured mode: raise InvalidAction if a parsed action isn't a legal move right now"""
+        pass
+
+    def config(self):
+        """Constructor arguments (JSON), so the match can be replayed offline (engine/rescore.py)"""
+        return None
+
     def render(self, state):
         """Optional: render state for replay"""
         return str(state)
\ No newline at end of file
@@ -1,14 +1,32 @@
-import random
 from tasks.tasks import Task
 
 
 class TriviaDuel(Task):
-
-    def __init__(self, questions):
+    supports_sessions = True
+
+    def __init__(self, questions, blind=False):
+        """
+        blind: don't show the score (or anything else about the opponent) in the
+        observation. Every model then sees exactly question_prompt(question), whoever
+        it plays, so answers can be collected once and reused for every pairing
+        (see tournament/answer_table.py).
+        """
         self.questions = questions
+        self.blind = blind
+
+    def config(self):
+        # questions may be a QuestionSet drawn from a bank: log the questions themselves
+        return {"questions": list(self.questions), "blind": self.blind}
+
+    @staticmethod
+    def question_prompt(question):
+        return f"Question: {question}\n\nYour answer:"
+
+    @staticmethod
+    def check_answer(answer, correct):
+        return answer.strip().lower() == correct.strip().lower()
 
     def init(self, seed=None):
-        random.seed(seed)
         state = {
             "round": 0,
             "scores": {0: 0, 1: 0},
@@ -19,20 +37,31 @@ class TriviaDuel(Task):
     def observe(self, state, agentId):
         q_idx = state["round"]
         question = self.questions[q_idx]["question"]
+        if self.blind:
+            return self.question_prompt(question)
 
         obs = f"=== TRIVIA ROUND {state['round'] + 1} / {len(self.questions)} ===\n\n"
         obs += f"Current Score - You: {state['scores'][agentId]} | Opponent: {state['scores'][1 - agentId]}\n\n"
-        obs += f"Question: {question}\n\n"
-        obs += "Your answer:"
+        obs += self.question_prompt(question)
 
         return obs
 
+    def observe_prefix(self, state, agentId):
+        return (
+            f"You are playing a trivia duel against an opponent: {len(self.questions)} questions, "
+            "one point per correct answer. Reply with just the answer."
+        )
+
+    def observe_delta(self, state, agentId):
+        # same as observe(), the question is the only thing in it and it changes every round
+        return self.observe(state, agentId)
+
     def step(self, state, actions):
         q_idx = state["round"]
         correct = self.questions[q_idx]["answer"]
 
         for agentId, action in actions.items():
-            if action.strip().lower() == correct.strip().lower():
+            if self.check_answer(action, correct):
                 state["scores"][agentId] += 1
 
         state["round"] += 1
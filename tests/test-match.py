@@ -14,8 +14,9 @@ agent1 = Agent("Claude", model="claude-3-5-sonnet-20241022")
 agent2 = Agent("Gemini", model="gemini-pro")
 
 result = run_match(task, [agent1, agent2], seed=42, log_dir="logs")
-# Creates logs/20241108_143022_TriviaDuel_Claude_vs_Gemini.json
-# Creates logs/20241108_143022_TriviaDuel_Claude_vs_Gemini_readable.txt
+# Creates logs/20241108_143022_TriviaDuel_Claude_vs_Gemini.jsonl
+# Read it with: python -m engine.render_log logs/20241108_143022_TriviaDuel_Claude_vs_Gemini.jsonl
+# (or pass readable=True to also get ..._readable.txt)
 
 task2 = NegotiationGame()
 result2 = run_match(task2, [agent1, agent2], seed=42, log_dir="logs")
\ No newline at end of file
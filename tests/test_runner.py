@@ -1,14 +1,88 @@
+import asyncio
+import itertools
+import json
+import random
 import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from tasks.tasks import Task
+from tasks.tasks import MatchRandom, Task
 from tasks.trivia_duel import TriviaDuel
-from tasks.negotiation_game import NegotiationGame
-from agents.agents import Agent
-from engine.orchestration_engine import run_match
+from tasks.negotiation_game import NegotiationGame, NEGOTIATION_ACTIONS
+from tasks.actions import InvalidAction
+from tasks.question_bank import QuestionBank
+from tasks.negotiation_solver import SolutionCache, get_solution, solution_key, solve_state
+from tasks.coding_battle import CodingBattle
+from tasks.sandbox import SandboxPool
+from tasks.negotiation_compact import to_compact, from_compact, compact_scores, simulate, sweep
+from types import SimpleNamespace
+
+from agents.agents import Agent, AgentFailure, AgentResponse
+from agents import ratelimit
+from agents.cache import ResponseCache, CacheMiss
+from agents import clients
+from agents.registry import create_agent
+from agents.scripted import GreedyNegotiator, Negotiator, TriviaOracle
+from engine.orchestration_engine import run_match, arun_match, arun_matches, resume_match, AgentCallFailed
+from engine.match_log import read_events, decode_state, encode_state
+from engine.log_index import LogIndex
+from engine.telemetry import metrics_from_logs
+from engine.render_log import render
+from engine.rescore import load_scores, rescore_log, rescore_logs, rescored_results, save_version
+from judges.judge import Judge, LLMJudge, RuleBasedJudge
+from benchmarks.engine_bench import METRICS, compare, run_benchmarks
+from tournament.scheduler import build_task, expand_spec, schedule, swiss_pairings
+from tournament.work_queue import JobQueue
+from tournament.worker import run_worker
+from tournament.ratings import Elo, Glicko2, bradley_terry, bootstrap_bradley_terry, outcomes_from_results
+from tournament.answer_table import AnswerTable, collect_answers, duel_from_table, standings
+
+
+def _text(content):
+    return content if isinstance(content, str) else "".join(block["text"] for block in content)
+
+
+class FakeAnthropic:
+    """
+    Stands in for the Anthropic client: echoes the prompt and counts calls.
+    Like the real prompt cache, input shared with the previous request is billed
+    as cache_read_input_tokens instead of input_tokens.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.usage = []
+        self._previous = ""
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, **kwargs):
+        self.calls.append(kwargs)
+        full = _text(kwargs.get("system", "")) + "".join(_text(m["content"]) for m in kwargs["messages"])
+        shared = 0
+        while shared < min(len(full), len(self._previous)) and full[shared] == self._previous[shared]:
+            shared += 1
+        self._previous = full
+        usage = SimpleNamespace(input_tokens=(len(full) - shared) // 4, cache_read_input_tokens=shared // 4,
+                                output_tokens=5)
+        self.usage.append(usage)
+        prompt = _text(kwargs["messages"][-1]["content"])
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=f"reply #{len(self.calls)} to: {prompt[:20]}")],
+            usage=usage
+        )
+
+
+def fake_anthropic_agent(name, model_config=None, **kwargs):
+    agent = Agent(name, model="dummy", model_config=model_config, **kwargs)
+    agent.provider = "anthropic"
+    agent.model = "claude-fake"
+    agent.client = FakeAnthropic()
+    return agent
 
 
 def test_task_interface():
@@ -190,6 +264,1420 @@ def test_orchestration():
     return True
 
 
+def test_async_orchestration():
+    print("\n=== Async Orchestration ===")
+
+    questions = [
+        {"question": "What is 2+2?", "answer": "4"},
+        {"question": "Capital of France?", "answer": "Paris"}
+    ]
+
+    # slow async agents, so we can tell whether a round waits for the sum or the max
+    class SlowAgent(Agent):
+        def __init__(self, name, answers, delay):
+            super().__init__(name, model="mock")
+            self.answers = answers
+            self.delay = delay
+
+        async def aact(self, observation):
+            await asyncio.sleep(self.delay)
+            return self.answers[0] if "2+2" in observation else self.answers[1]
+
+    agent0 = SlowAgent("SmartAgent", ["4", "Paris"], 0.2)
+    agent1 = SlowAgent("DumbAgent", ["5", "London"], 0.2)
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        start = time.perf_counter()
+        result = asyncio.run(arun_match(TriviaDuel(questions), [agent0, agent1], seed=42, log_dir=log_dir))
+        elapsed = time.perf_counter() - start
+
+        assert result["scores"][0] == 2
+        assert result["scores"][1] == 0
+        assert len(result["transcript"]) == 4
+        # 2 rounds of 0.2s each, agents in parallel; serial would be 0.8s
+        assert elapsed < 0.7
+        print("agents in a round run concurrently")
+
+        # plain agents that only implement act() still work through aact()
+        start = time.perf_counter()
+        matches = [(TriviaDuel(questions), [agent0, agent1], seed) for seed in range(10)]
+        results = asyncio.run(arun_matches(matches, log_dir=log_dir))
+        elapsed = time.perf_counter() - start
+
+        assert len(results) == 10
+        assert len({r["match_id"] for r in results}) == 10
+        assert elapsed < 2.0
+        print("many matches share one event loop")
+
+        matches = [(TriviaDuel(questions), [agent0, agent1], seed) for seed in range(2)]
+        results = asyncio.run(arun_matches(matches, log_dir=Path(log_dir) / "compact", compact=True,
+                                           compression="gzip", readable=True))
+        assert all(str(r.log_path).endswith(".jsonl.gz") and next(iter(read_events(r.log_path, expand=False)))["compact"]
+                   for r in results)
+        assert len(list((Path(log_dir) / "compact").glob("*_readable.txt"))) == 2
+        print("batch runs take the same log options as single matches")
+
+        dummy = Agent("Dummy", model="dummy")
+        assert asyncio.run(dummy.aact("anything")) == "dummy_action"
+        print("dummy agents work through aact()")
+
+    return True
+
+
+def test_tournament():
+    print("\n=== Tournament Scheduler ===")
+
+    questions = [
+        {"question": "What is 2+2?", "answer": "4"},
+        {"question": "Capital of France?", "answer": "Paris"}
+    ]
+    spec = {
+        "name": "smoke",
+        "agents": [{"name": f"Bot{i}", "model": "dummy"} for i in range(3)],
+        "tasks": [{"task": "TriviaDuel", "params": {"questions": questions}}],
+        "seeds": [1, 2],
+        "swap_seats": True,
+    }
+
+    jobs = expand_spec(spec)
+    # 3 pairings x 2 seats x 2 seeds
+    assert len(jobs) == 12
+    assert {(j["agents"][0]["name"], j["agents"][1]["name"]) for j in jobs} >= {("Bot0", "Bot1"), ("Bot1", "Bot0")}
+    print("round robin + seat swap expansion works")
+
+    pairs = swiss_pairings(["A", "B", "C", "D"], {"A": 2, "B": 2, "C": 1, "D": 0}, {frozenset(("A", "B"))})
+    assert pairs == [("A", "C"), ("B", "D")]
+    print("swiss pairing avoids rematches")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = JobQueue(Path(tmp) / "queue.db")
+        ids = schedule(spec, queue)
+        assert len(ids) == 12
+        assert queue.counts() == {"pending": 12}
+        try:
+            schedule(spec, queue)
+            assert False, "a round can only be queued once"
+        except ValueError:
+            assert queue.counts() == {"pending": 12}
+
+        swiss = {**spec, "name": "swiss", "pairing": "swiss", "rounds": 1}
+        swiss_queue = JobQueue(Path(tmp) / "swiss.db")
+        assert len(schedule(swiss, swiss_queue, round_index=0)) > 0
+        try:
+            schedule(swiss, swiss_queue, round_index=1)
+            assert False, "past the last swiss round"
+        except ValueError:
+            pass
+        swiss_queue.close()
+        print("rounds are queued once, and swiss stops after its last round")
+
+        # an expired lease goes back to the queue
+        job_id, job = queue.claim("w1", lease_seconds=-1)
+        assert queue.requeue_expired() == 1
+        assert queue.counts()["pending"] == 12
+
+        # failures are retried until the job runs out of attempts
+        job_id, job = queue.claim("w1")
+        assert queue.complete(job_id, "someone-else", {}) == False
+        queue.fail(job_id, "w1", "boom")
+        assert queue.counts()["pending"] == 12
+        assert queue.claim("w2")[0] == job_id
+        queue.fail(job_id, "w2", "boom again")
+        assert queue.counts() == {"pending": 11, "failed": 1}
+        print("leases, expiry and retries work")
+
+        finished = run_worker(Path(tmp) / "queue.db", log_dir=Path(tmp) / "logs", exit_when_idle=True)
+        assert finished == 11
+        assert queue.counts() == {"done": 11, "failed": 1}
+        assert len(queue.results("smoke")) == 11
+        print("worker drains the queue")
+        queue.close()
+
+    return True
+
+
+def test_response_cache():
+    print("\n=== Response Cache ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = Path(tmp) / "responses.db"
+        cache = ResponseCache(cache_path, max_entries=2)
+
+        agent = fake_anthropic_agent("Cached", model_config={"temperature": 0}, cache=cache)
+        first = agent.act("What is 2+2?")
+        assert agent.act("What is 2+2?") == first
+        assert len(agent.client.calls) == 1
+        print("identical prompts are served from the cache")
+
+        # sampled configs bypass the cache unless explicitly allowed
+        sampled = fake_anthropic_agent("Sampled", model_config={"temperature": 0.7}, cache=cache)
+        sampled.act("What is 2+2?")
+        sampled.act("What is 2+2?")
+        assert len(sampled.client.calls) == 2
+        print("temperature > 0 bypasses the cache")
+
+        agent.act("Capital of France?")
+        agent.act("Who wrote Hamlet?")
+        assert len(cache) == 2
+        agent.act("What is 2+2?")
+        assert len(agent.client.calls) == 4
+        print("least recently used entries are evicted")
+        cache.close()
+
+        replay = ResponseCache(cache_path, replay=True)
+        replayer = fake_anthropic_agent("Replay", model_config={"temperature": 0}, cache=replay)
+        assert replayer.act("Who wrote Hamlet?").startswith("reply #3")
+        assert len(replayer.client.calls) == 0
+        try:
+            replayer.act("Something new")
+            assert False, "replay mode should not call the provider"
+        except CacheMiss:
+            pass
+        replay.close()
+        print("replay mode is read-only")
+
+        cache = ResponseCache(Path(tmp) / "session.db")
+        puts = []
+        put = cache.put
+        cache.put = lambda key, response: puts.append(key) or put(key, response)
+        for _ in range(2):
+            agent = fake_anthropic_agent("Session", model_config={"temperature": 0}, cache=cache)
+            agent.start_session("You are playing trivia.")
+            agent.act_session("What is 2+2?")
+        assert len(agent.client.calls) == 0 and len(puts) == 1
+        cache.close()
+        print("session turns served from the cache aren't written back")
+
+    return True
+
+
+def test_client_registry():
+    print("\n=== Client Registry ===")
+
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+
+    old_key = os.environ.get("ANTHROPIC_API_KEY")
+    os.environ["ANTHROPIC_API_KEY"] = "test-key"
+    try:
+        a = Agent("A", model="claude-3-5-sonnet-20241022")
+        b = Agent("B", model="claude-3-haiku-20240307")
+        assert a.client is b.client
+        assert clients.get_anthropic_client("other-key") is not a.client
+        print("agents with the same credentials share a client")
+
+        with ThreadPoolExecutor(8) as pool:
+            shared = set(map(id, pool.map(lambda _: clients.get_anthropic_client("test-key"), range(32))))
+        assert shared == {id(a.client)}
+        print("registry is thread safe")
+
+        async def _two_lookups():
+            return clients.get_async_anthropic_client("test-key"), a._async_client()
+
+        first, second = asyncio.run(_two_lookups())
+        assert first is second
+        third, _ = asyncio.run(_two_lookups())
+        assert third is not first
+        print("async clients are shared per event loop")
+    finally:
+        clients.close_clients()
+        if old_key is None:
+            del os.environ["ANTHROPIC_API_KEY"]
+        else:
+            os.environ["ANTHROPIC_API_KEY"] = old_key
+
+    return True
+
+
+def test_streaming_log():
+    print("\n=== Streaming Match Log ===")
+
+    questions = [
+        {"question": "What is 2+2?", "answer": "4"},
+        {"question": "Capital of France?", "answer": "Paris"},
+        {"question": "Who wrote Hamlet?", "answer": "Shakespeare"}
+    ]
+
+    class CrashingAgent(Agent):
+        def __init__(self, name, crash_on):
+            super().__init__(name, model="mock")
+            self.calls = 0
+            self.crash_on = crash_on
+
+        def act(self, observation):
+            self.calls += 1
+            if self.calls == self.crash_on:
+                raise RuntimeError("process died")
+            return "4"
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        try:
+            run_match(TriviaDuel(questions), [CrashingAgent("A", 99), CrashingAgent("B", 2)], log_dir=log_dir)
+            assert False, "match should have crashed"
+        except RuntimeError:
+            pass
+
+        log_path = next(Path(log_dir).glob("*.jsonl"))
+        events = list(read_events(log_path))
+        assert [e["type"] for e in events] == ["match", "turn", "turn", "checkpoint", "turn"]
+        assert events[1]["action"] == "4"
+        print("turns are on disk before the match finishes")
+
+        result = run_match(TriviaDuel(questions), [CrashingAgent("A", 99), CrashingAgent("B", 99)], log_dir=log_dir)
+        events = list(read_events(result.log_path))
+        assert events[-1]["type"] == "end"
+        assert decode_state(events[-1]["scores"]) == {0: 1, 1: 1}
+        assert Path(result.log_path).read_text().startswith('{"type":"match","match_id":')
+        assert result._transcript is None
+        assert len(result["transcript"]) == 6
+        print("scores are the closing record and the transcript loads lazily")
+
+    return True
+
+
+def test_checkpoint_resume():
+    print("\n=== Checkpoint and Resume ===")
+
+    import re
+
+    # answers depend only on the round in the observation, so a resumed match
+    # should end up exactly where an uninterrupted one does
+    class RoundAgent(Agent):
+        def __init__(self, name, script, crash_on_round=None):
+            super().__init__(name, model="mock")
+            self.script = script
+            self.crash_on_round = crash_on_round
+            self.rounds_seen = []
+
+        def act(self, observation):
+            rnd = int(re.search(r"ROUND (\d+)", observation).group(1))
+            if rnd == self.crash_on_round:
+                raise RuntimeError("preempted")
+            self.rounds_seen.append(rnd)
+            return self.script[rnd]
+
+    script0 = ["Hello!", "PROPOSE: I give Apple for your Carrot", "Waiting...", "Still here"]
+    script1 = ["Hi!", "Interesting...", "Hmm", "ACCEPT"]
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        expected = run_match(NegotiationGame(max_rounds=5), [RoundAgent("A", script0), RoundAgent("B", script1)],
+                             seed=7, log_dir=log_dir)
+
+        # agent B dies in round 2, after agent A already answered
+        try:
+            run_match(NegotiationGame(max_rounds=5), [RoundAgent("A", script0), RoundAgent("B", script1, 2)],
+                      seed=7, log_dir=log_dir)
+            assert False, "match should have crashed"
+        except RuntimeError:
+            pass
+        crashed_log = max(Path(log_dir).glob("*.jsonl"), key=lambda p: p.stat().st_mtime_ns)
+        # simulate a torn write at the moment of the crash
+        with open(crashed_log, "a") as f:
+            f.write('{"type":"turn","rou')
+
+        a, b = RoundAgent("A", script0), RoundAgent("B", script1)
+        resumed = resume_match(crashed_log, NegotiationGame(max_rounds=5), [a, b])
+        assert a.rounds_seen == [3]
+        assert b.rounds_seen == [2, 3]
+        print("resume only asks for turns that were never logged")
+
+        assert resumed["scores"] == expected["scores"]
+        assert resumed["final_state"] == expected["final_state"]
+        assert len(resumed["transcript"]) == len(expected["transcript"])
+        print("resumed match matches an uninterrupted one")
+
+        again = resume_match(crashed_log, NegotiationGame(max_rounds=5), [a, b])
+        assert again["scores"] == expected["scores"]
+        assert a.rounds_seen == [3]
+        print("resuming a finished match is a no-op")
+
+    return True
+
+
+def test_negotiation_history_budget():
+    print("\n=== Negotiation History Budget ===")
+
+    full = NegotiationGame(max_rounds=100)
+    budgeted = NegotiationGame(max_rounds=100, history_token_budget=50)
+    state = full.init(seed=1)
+    state_b = budgeted.init(seed=1)
+
+    for rnd in range(40):
+        actions = {0: f"round {rnd}: what about the cheese?", 1: f"round {rnd}: not yet"}
+        full.observe(state, 0)
+        budgeted.observe(state_b, 0)
+        state = full.step(state, dict(actions))
+        state_b = budgeted.step(state_b, dict(actions))
+
+    obs = full.observe(state, 0)
+    assert "You: round 0: what about the cheese?" in obs
+    assert "Opponent: round 39: not yet" in obs
+    print("unlimited history shows every message")
+
+    obs_b = budgeted.observe(state_b, 0)
+    assert "Opponent: round 39: not yet" in obs_b
+    assert "round 0:" not in obs_b
+    assert "earlier messages from rounds 0-" in obs_b
+    assert len(obs_b) < len(obs) / 3
+    assert obs_b == NegotiationGame(max_rounds=100, history_token_budget=50).observe(state_b, 0)
+    print("budget keeps the newest messages, deterministically")
+
+    view = budgeted._history_view(state_b, 0)
+    assert len(view.lines) == 80
+    assert budgeted._history_view(state_b, 0) is view
+    print("history is rendered incrementally")
+
+    return True
+
+
+def test_session_mode():
+    print("\n=== Session Mode ===")
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        plain_agents = [fake_anthropic_agent("A"), fake_anthropic_agent("B")]
+        plain = run_match(NegotiationGame(max_rounds=8), plain_agents, seed=5, log_dir=log_dir)
+
+        session_agents = [fake_anthropic_agent("A"), fake_anthropic_agent("B")]
+        session = run_match(NegotiationGame(max_rounds=8), session_agents, seed=5, log_dir=log_dir, session=True)
+
+        assert len(session["final_state"]["conversation"]) == len(plain["final_state"]["conversation"])
+        assert session["scores"] == plain["scores"]
+        print("session mode plays the same game")
+
+        request = session_agents[0].client.calls[-1]
+        assert request["system"][0]["cache_control"] == {"type": "ephemeral"}
+        assert "YOUR INVENTORY" in request["system"][0]["text"]
+        assert len(request["messages"]) == 2 * 8 - 1
+        assert "YOUR INVENTORY" not in _text(request["messages"][-1]["content"])
+        print("stable prefix is sent as a cacheable system block")
+
+        plain_tokens = [u.input_tokens for u in plain_agents[0].client.usage]
+        session_tokens = [u.input_tokens for u in session_agents[0].client.usage[1:]]
+        # without sessions every turn pays for the whole (growing) history again
+        assert plain_tokens[-1] > plain_tokens[1] + 50
+        assert max(session_tokens) < min(plain_tokens)
+        assert max(session_tokens) - min(session_tokens) < 20
+        print(f"uncached input tokens per turn: plain {plain_tokens}, session {session_tokens}")
+
+    return True
+
+
+def test_rate_limit_and_retries():
+    print("\n=== Rate Limiting and Retries ===")
+
+    class FakeAPIError(Exception):
+        def __init__(self, status_code):
+            super().__init__(f"HTTP {status_code}")
+            self.status_code = status_code
+
+    class FlakyAnthropic(FakeAnthropic):
+        """Fails with the given status codes first, then behaves."""
+
+        def __init__(self, errors):
+            super().__init__()
+            self.errors = list(errors)
+
+        def _create(self, **kwargs):
+            if self.errors:
+                self.calls.append(kwargs)
+                raise FakeAPIError(self.errors.pop(0))
+            return super()._create(**kwargs)
+
+    old_delay = ratelimit.RETRY_BASE_DELAY
+    ratelimit.RETRY_BASE_DELAY = 0.001
+    try:
+        limiter = ratelimit.configure_limiter("anthropic", max_concurrency=8)
+
+        agent = fake_anthropic_agent("Flaky")
+        agent.client = FlakyAnthropic([429, 529, 503])
+        reply = agent.act("What is 2+2?")
+        assert isinstance(reply, str) and reply.startswith("reply #4")
+        assert limiter.throttled == 2
+        assert limiter.concurrency < 8
+        print("throttles and 5xx errors are retried, and concurrency backs off")
+
+        agent.client = FlakyAnthropic([400])
+        concurrency = limiter.concurrency
+        failure = agent.act("What is 2+2?")
+        assert isinstance(failure, AgentFailure)
+        assert failure.attempts == 1 and not failure.retryable
+        assert limiter.concurrency == concurrency
+        print("non-retryable errors fail fast, and don't grow concurrency")
+
+        agent.max_retries = 2
+        agent.client = FlakyAnthropic([429] * 5)
+        failure = agent.act("What is 2+2?")
+        assert isinstance(failure, AgentFailure) and failure.attempts == 3
+        print("retries give up after max_retries")
+
+        class Blocked(FakeAnthropic):
+            """A reply with no content, like one a safety filter blocked."""
+
+            def _create(self, **kwargs):
+                return SimpleNamespace(content=[], usage=super()._create(**kwargs).usage)
+
+        agent.client = Blocked()
+        for _ in range(3):
+            failure = agent.act("What is 2+2?")
+            assert isinstance(failure, AgentFailure) and failure.attempts == 1 and not failure.retryable
+        assert limiter.in_flight == 0
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        async def cancel_call():
+            call = asyncio.create_task(agent._awith_retries(hang, Agent._anthropic_result, 0))
+            await asyncio.sleep(0.05)
+            assert limiter.in_flight == 1
+            call.cancel()
+            try:
+                await call
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(cancel_call())
+        assert limiter.in_flight == 0
+        print("unreadable replies fail without retrying, and no call keeps its slot")
+
+        questions = [{"question": "What is 2+2?", "answer": "4"}]
+        good = fake_anthropic_agent("Good")
+        agent.client = FlakyAnthropic([400])
+        with tempfile.TemporaryDirectory() as log_dir:
+            try:
+                run_match(TriviaDuel(questions), [good, agent], log_dir=log_dir)
+                assert False, "failure should stop the match"
+            except AgentCallFailed as e:
+                assert e.agentId == 1
+            events = list(read_events(next(Path(log_dir).glob("*.jsonl"))))
+            assert [e["type"] for e in events] == ["match", "turn", "failure"]
+        print("a failed call stops the match instead of becoming a move")
+
+        class Failing(Agent):
+            def act(self, observation):
+                return AgentFailure("mock", "mock", "bad request", attempts=1, retryable=False)
+
+        class Answers(Agent):
+            def act(self, observation):
+                return "4"
+
+        with tempfile.TemporaryDirectory() as log_dir:
+            try:
+                asyncio.run(arun_match(TriviaDuel(questions), [Failing("Bad", model="mock"), Answers("Good", model="mock")],
+                                       log_dir=log_dir))
+                assert False, "failure should stop the match"
+            except AgentCallFailed as e:
+                assert e.agentId == 0
+            events = list(read_events(next(Path(log_dir).glob("*.jsonl"))))
+            assert [e["type"] for e in events] == ["match", "turn", "failure"] and events[1]["agent"] == 1
+        print("async matches log the replies that came back before reporting the failure")
+
+        bucket = ratelimit.TokenBucket(60, capacity=2)
+        assert bucket.reserve(1) == 0 and bucket.reserve(1) == 0
+        assert 0.9 < bucket.reserve(1) <= 1.0
+        print("token bucket enforces the rate")
+    finally:
+        ratelimit.RETRY_BASE_DELAY = old_delay
+        ratelimit.configure_limiter("anthropic")
+
+    return True
+
+
+def test_answer_once_trivia():
+    print("\n=== Answer-Once Trivia ===")
+
+    questions = [
+        {"id": "q1", "question": "What is 2+2?", "answer": "4"},
+        {"id": "q2", "question": "Capital of France?", "answer": "Paris"},
+        {"id": "q3", "question": "Who wrote Hamlet?", "answer": "Shakespeare"}
+    ]
+    known = {"What is 2+2?": "4", "Capital of France?": "Paris", "Who wrote Hamlet?": "Shakespeare"}
+
+    class KnowsSome(Agent):
+        def __init__(self, name, knows):
+            super().__init__(name, model="mock")
+            self.knows = knows
+            self.calls = 0
+
+        def act(self, observation):
+            self.calls += 1
+            question = observation.split("Question: ")[1].split("\n")[0]
+            return known[question] if question in self.knows else "no idea"
+
+    class FakeBatches:
+        """Message Batches API that answers every request right away."""
+
+        def __init__(self):
+            self.requests = []
+
+        def create(self, requests):
+            self.requests = requests
+            return SimpleNamespace(id="batch_1", processing_status="ended")
+
+        def results(self, batch_id):
+            for request in self.requests:
+                prompt = request["params"]["messages"][0]["content"]
+                question = prompt.split("Question: ")[1].split("\n")[0]
+                message = SimpleNamespace(content=[SimpleNamespace(text=f" {known[question]} ")])
+                yield SimpleNamespace(custom_id=request["custom_id"],
+                                      result=SimpleNamespace(type="succeeded", message=message))
+
+    alice = KnowsSome("Alice", ["What is 2+2?", "Capital of France?"])
+    bob = KnowsSome("Bob", ["What is 2+2?"])
+    oracle = fake_anthropic_agent("Oracle")
+    oracle.client.messages.batches = FakeBatches()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        table = AnswerTable(Path(tmp) / "answers.db")
+        collect_answers([alice, bob, oracle], questions, table, concurrency=4)
+        collect_answers([alice, bob, oracle], questions, table, concurrency=4)
+        assert alice.calls == 3 and bob.calls == 3
+        assert len(oracle.client.calls) == 0 and len(oracle.client.messages.batches.requests) == 3
+        print("each question goes to each model once, in bulk")
+
+        ids = ["q1", "q2", "q3"]
+        duel = duel_from_table(table, "Alice", "Bob", ids)
+        played = run_match(TriviaDuel(questions, blind=True), [alice, bob], log_dir=Path(tmp) / "logs")
+        assert duel == played["scores"] == {0: 2, 1: 1}
+        print("duels from the table match played blind duels")
+
+        rows = standings(table, ["Alice", "Bob", "Oracle"], ids)
+        assert rows["Oracle"]["wins"] == 2 and rows["Bob"]["losses"] == 2
+        assert rows["Alice"]["points"] == 1.0
+        print("standings come straight from the answer table")
+        table.close()
+
+    return True
+
+
+def test_question_bank():
+    print("\n=== Question Bank ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = Path(tmp) / "questions.jsonl"
+        with open(corpus, "w") as f:
+            for i in range(100):
+                category = ["science", "history"][i % 2]
+                difficulty = ["easy", "medium", "hard"][i % 3]
+                f.write(json.dumps({"question": f"Question {i}?", "answer": str(i),
+                                    "category": category, "difficulty": difficulty}) + "\n")
+            f.write("\n")
+
+        bank = QuestionBank(corpus)
+        assert Path(f"{corpus}.idx").exists()
+        assert len(bank) == 100
+        assert bank[42]["question"] == "Question 42?" and bank[42]["id"] == 42
+        print("index built, questions read lazily by id")
+
+        science = bank.ids(category="science")
+        assert len(science) == 50 and all(i % 2 == 0 for i in science)
+        hard_history = bank.ids(category="history", difficulty="hard")
+        assert hard_history and all(i % 2 == 1 and i % 3 == 2 for i in hard_history)
+        assert bank.ids(category="geography") == []
+        print("category/difficulty filters work from the index alone")
+
+        first = bank.sample(10, seed=7, category="science")
+        again = QuestionBank(corpus).sample(10, seed=7, category="science")
+        assert first.ids == again.ids and len(first) == 10
+        assert bank.sample(10, seed=8, category="science").ids != first.ids
+        print("sampling is deterministic per seed")
+
+        shards = [set(bank.shard(w, 3)) for w in range(3)]
+        assert not (shards[0] & shards[1]) and set().union(*shards) == set(range(100))
+        assert set(bank.sample(5, seed=1, shard=(1, 3)).ids) <= shards[1]
+        print("shards are disjoint and cover the bank")
+
+        task_spec = {"task": "TriviaDuel", "question_bank": str(corpus), "questions_per_match": 3}
+        task = build_task(task_spec, seed=5)
+        assert [q["id"] for q in task.questions] == build_task(task_spec, seed=5).questions.ids
+        agents = [Agent("A", model="mock"), Agent("B", model="mock")]
+        result = run_match(task, agents, log_dir=Path(tmp) / "logs")
+        assert result["final_state"]["round"] == 3
+        print("TriviaDuel plays straight from the bank")
+        bank.close()
+
+    return True
+
+
+def test_ratings():
+    print("\n=== Ratings ===")
+
+    rng = random.Random(0)
+    strengths = {"Weak": 0, "Mid": 200, "Strong": 400}
+    outcomes = []
+    for _ in range(3000):
+        a, b = rng.sample(sorted(strengths), 2)
+        p = 1 / (1 + 10 ** ((strengths[b] - strengths[a]) / 400))
+        outcomes.append((a, b, 1.0 if rng.random() < p else 0.0))
+
+    bt = bradley_terry(outcomes)
+    assert bt["Strong"] > bt["Mid"] > bt["Weak"]
+    assert abs((bt["Strong"] - bt["Weak"]) - 400) < 60
+    assert abs(sum(bt.values()) / 3 - 1500) < 1e-6
+    print("Bradley-Terry recovers the rating gaps")
+
+    boot = bootstrap_bradley_terry(outcomes, samples=200)
+    for name, row in boot.items():
+        assert row["low"] < row["rating"] < row["high"]
+        assert abs(row["rating"] - bt[name]) < 1e-3
+    assert boot["Mid"]["high"] < boot["Strong"]["low"]
+    print("bootstrap intervals bracket the fit")
+
+    elo = Elo()
+    elo.update_many(outcomes)
+    assert elo.ratings["Strong"] > elo.ratings["Mid"] > elo.ratings["Weak"]
+    assert sum(elo.games.values()) == 2 * len(outcomes)
+    print("online Elo orders the agents")
+
+    # the example from Glickman's Glicko-2 paper
+    glicko = Glicko2()
+    for name, rating, rd in [("P", 1500, 200), ("A", 1400, 30), ("B", 1550, 100), ("C", 1700, 300)]:
+        i = glicko._player(name)
+        glicko.mu[i] = (rating - 1500) / 173.7178
+        glicko.phi[i] = rd / 173.7178
+    for opponent, score in [("A", 1), ("B", 0), ("C", 0)]:
+        glicko.add("P", opponent, score)
+    glicko.end_period()
+    p = glicko.ratings()["P"]
+    assert abs(p["rating"] - 1464.06) < 0.05 and abs(p["rd"] - 151.52) < 0.05
+    assert abs(p["volatility"] - 0.05999) < 1e-5
+    print("Glicko-2 matches the paper's worked example")
+
+    results = [({"agents": [{"name": "A"}, {"name": "B"}]}, {"scores": {"0": 2, "1": 1}}),
+               ({"agents": [{"name": "B"}, {"name": "A"}]}, {"scores": {"0": {"gain": 1}, "1": {"gain": 1}}})]
+    assert outcomes_from_results(results) == [("A", "B", 1.0), ("B", "A", 0.5)]
+    print("queue results turn into outcomes")
+
+    return True
+
+
+def test_log_index():
+    print("\n=== Log Index ===")
+
+    questions = [
+        {"question": "What is 2+2?", "answer": "4"},
+        {"question": "Capital of France?", "answer": "Paris"}
+    ]
+
+    class Scripted(Agent):
+        def __init__(self, name, reply):
+            super().__init__(name, model=f"mock-{name.lower()}")
+            self.reply = reply
+
+        def act(self, observation):
+            return self.reply
+
+    smart, dull = Scripted("Smart", "4"), Scripted("Dull", "no idea")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = Path(tmp) / "logs"
+        for seed in (1, 2, 3):
+            run_match(TriviaDuel(questions), [smart, dull], seed=seed, log_dir=log_dir)
+        run_match(TriviaDuel(questions), [dull, dull], seed=4, log_dir=log_dir)
+
+        index = LogIndex(log_dir)
+        assert index.update() == 4
+        assert index.update() == 0
+        print("only new logs are read")
+
+        assert index.win_rate(model="mock-smart")["win_rate"] == 1.0
+        dull_record = index.win_rate(model="mock-dull")
+        assert (dull_record["matches"], dull_record["losses"], dull_record["ties"]) == (5, 3, 2)
+        assert index.win_rate(model="mock-smart", seeds=(2, 3))["matches"] == 2
+        assert index.win_rate(task="NegotiationGame")["matches"] == 0
+        assert len(index.matches(agent="Smart")) == 3
+        stats = index.turn_stats(model="mock-smart")
+        assert stats["turns"] == 6 and stats["mean_latency_ms"] is not None
+        print("win rates, filters and turn stats come from the index")
+
+        run_match(TriviaDuel(questions), [smart, dull], seed=5, log_dir=log_dir)
+        first = sorted(log_dir.glob("*.jsonl"))[0]
+        first.unlink()
+        assert index.update() == 1
+        assert index.query("SELECT COUNT(*) FROM matches")[0][0] == 4
+        print("new logs are added and deleted ones dropped")
+        index.close()
+
+    return True
+
+
+def test_negotiation_compact():
+    print("\n=== Compact Negotiation ===")
+
+    game = NegotiationGame()
+    state = game.init(seed=11)
+    values, inventories, initial = to_compact(state, game.item_pool)
+    assert from_compact(inventories, game.item_pool) == {a: sorted(state["inventories"][a], key=game.item_pool.index)
+                                                        for a in (0, 1)}
+    game.execute_trade(state, {"proposer": 0, "proposer_gives": [state["inventories"][0][0]],
+                               "proposer_gets": [state["inventories"][1][0]]})
+    _, inventories, _ = to_compact(state, game.item_pool)
+    _, final_value, gain = compact_scores(values, initial, inventories)
+    scores = game.score(state)
+    assert [int(g) for g in gain] == [scores[0]["gain"], scores[1]["gain"]]
+    assert [int(v) for v in final_value] == [scores[0]["final_value"], scores[1]["final_value"]]
+    print("compact state scores like the dict state")
+
+    result = simulate(5000, seed=3, strategies=("greedy", "random"))
+    again = simulate(5000, seed=3, strategies=("greedy", "random"))
+    assert (result.gain == again.gain).all() and (result.rounds == again.rounds).all()
+    assert len(result) == 5000
+    # items only change hands, never appear or vanish
+    assert ((result.inventories[:, 0] | result.inventories[:, 1]) == (result.initial[:, 0] | result.initial[:, 1])).all()
+    assert ((result.inventories[:, 0] & result.inventories[:, 1]) == 0).all()
+    # with a margin of 1 the accepting seat never loses
+    accepted_by_1 = result.deal_completed & (result.rounds % 2 == 1)
+    assert (result.gain[accepted_by_1, 1] >= 1).all()
+    print("batched self-play is deterministic and conserves items")
+
+    rows = sweep(2000, items_per_agent=(2, 3), max_rounds=(4,), value_ranges=((3, 10), (1, 20)), chunk_size=700)
+    assert len(rows) == 4 and all(0 <= row["deal_rate"] <= 1 and row["mean_rounds"] <= 4 for row in rows)
+    print("parameter sweeps run in chunks")
+
+    return True
+
+
+def test_negotiation_solver():
+    print("\n=== Negotiation Solver ===")
+
+    game = NegotiationGame()
+    for seed in range(5):
+        state = game.init(seed)
+        solution = solve_state(state)
+        items = solution["items"]
+        # brute force over every split of the items
+        points = []
+        for owners in itertools.product((0, 1), repeat=len(items)):
+            final = {a: [item for item, o in zip(items, owners) if o == a] for a in (0, 1)}
+            gains = tuple(sum(state["valuations"][a][i] for i in final[a])
+                          - sum(state["valuations"][a][i] for i in state["initial_inventories"][a]) for a in (0, 1))
+            points.append(gains)
+        frontier = sorted({p for p in points
+                           if not any(q[0] >= p[0] and q[1] >= p[1] and q != p for q in points)}, reverse=True)
+        assert [tuple(p) for p in solution["frontier"]] == frontier
+        rational = [p for p in points if min(p) >= 0]
+        assert sum(solution["max_surplus"]["gains"]) == max(sum(p) for p in rational)
+        nash = solution["nash"]["gains"]
+        assert nash[0] * nash[1] == max(p[0] * p[1] for p in rational)
+    print("frontier, max surplus and Nash point match brute force")
+
+    state = game.init(3)
+    best = game.solution(state)["max_surplus"]
+    state["inventories"] = {a: list(best["allocation"][a]) for a in (0, 1)}
+    state["deal_completed"] = True
+    scores = game.score(state)
+    assert [scores[a]["gain"] for a in (0, 1)] == best["gains"]
+    if sum(best["gains"]) > 0:
+        assert scores[0]["surplus_efficiency"] == 1.0
+    assert scores[0]["pareto_optimal"] and scores[1]["pareto_optimal"]
+    no_deal = game.score(game.init(3))
+    assert no_deal[0]["gain"] == 0 and no_deal[0]["surplus_efficiency"] in (0.0, None)
+    print("scores report efficiency against the best trades")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SolutionCache(Path(tmp) / "solutions.db")
+        key = solution_key(987654, 3, game.item_pool, (3, 10))
+        assert cache.get(key) is None
+        solved = get_solution(game.init(987654), key, cache)
+        assert cache.get(key) == solved == game.solution(game.init(987654))
+        cache.close()
+    print("solutions are cached on disk by seed and game settings")
+
+    return True
+
+
+def test_structured_actions():
+    print("\n=== Structured Actions ===")
+
+    schema = NEGOTIATION_ACTIONS
+    assert schema.parse('```json\n{"action": "Propose", "give": "Apple", "get": ["Corn"]}\n```') == \
+        {"action": "propose", "give": ["Apple"], "get": ["Corn"]}
+    for bad in ["ACCEPT", '{"action": "dance"}', '{"action": "propose", "give": ["Apple"]}', '{"give": 3}']:
+        try:
+            schema.parse(bad)
+            assert False, bad
+        except InvalidAction:
+            pass
+    assert schema.tool()["input_schema"]["required"] == ["action"]
+    print("replies are validated against the schema")
+
+    # free text: only a reply that starts with ACCEPT accepts
+    game = NegotiationGame(max_rounds=3)
+    state = game.init(seed=5)
+    mine, theirs = state["inventories"][0][0], state["inventories"][1][0]
+    state = game.step(state, {0: f"PROPOSE: I give {mine} for your {theirs}", 1: "Hmm"})
+    state = game.step(state, {0: "Waiting", 1: "I don't ACCEPT that"})
+    assert not state["deal_completed"]
+    state = game.step(state, {0: "Waiting", 1: "Accept."})
+    assert state["deal_completed"]
+    print("free text acceptance is no longer a substring match")
+
+    class Scripted(Agent):
+        def __init__(self, name, replies):
+            super().__init__(name, model="mock")
+            self.replies = replies
+            self.prompts = []
+
+        def act(self, observation):
+            self.prompts.append(observation)
+            return self.replies[len(self.prompts) - 1]
+
+    def play(run):
+        alice = Scripted("Alice", [
+            f'```json\n{{"action": "propose", "give": ["Unicorn"], "get": ["{theirs}"]}}\n```',
+            f'{{"action": "propose", "give": ["{mine}"], "get": ["{theirs}"]}}',
+            '{"action": "message", "message": "your move"}',
+        ])
+        bob = Scripted("Bob", ['{"action": "message", "message": "hi"}', "ACCEPT!", '{"action": "accept"}'])
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run(NegotiationGame(max_rounds=3, structured_actions=True), [alice, bob], Path(tmp))
+            turns = [e for e in read_events(result.log_path) if e["type"] == "turn"]
+        return result, turns, alice, bob
+
+    def sync_run(task, agents, tmp):
+        return run_match(task, agents, seed=5, log_dir=tmp)
+
+    def async_run(task, agents, tmp):
+        return asyncio.run(arun_match(task, agents, seed=5, log_dir=tmp))
+
+    for run in (sync_run, async_run):
+        result, turns, alice, bob = play(run)
+        assert result["scores"][0]["deal_completed"] == True
+        # two rounds, each malformed or illegal reply repaired once instead of wasting a round
+        assert result["final_state"]["round"] == 1 and len(turns) == 4
+        assert "Unicorn" in turns[0]["repair"]["error"] and turns[0]["parsed"]["give"] == [mine]
+        assert turns[3]["repair"]["reply"] == '{"action": "accept"}' and turns[3]["parsed"] == {"action": "accept"}
+        assert "INSTRUCTIONS:\nReply with a single JSON object" in alice.prompts[0]
+        assert "Your last reply could not be used" in bob.prompts[2] and len(bob.prompts) == 3
+        assert "Send the same move again" in bob.prompts[2]
+        assert "Send a corrected move" in alice.prompts[1]
+    print("malformed moves get one repair request, sync and async")
+
+    class SessionScripted(Agent):
+        # goes through the real session bookkeeping, only the provider call is scripted
+        def __init__(self, name, replies):
+            super().__init__(name, model="mock")
+            self.replies = iter(replies)
+
+        def _call(self, messages, system=None):
+            return next(self.replies)
+
+        async def _acall(self, messages, system=None):
+            return next(self.replies)
+
+    for play_async in (False, True):
+        alice = SessionScripted("Alice", [
+            f'{{"action": "propose", "give": ["Unicorn"], "get": ["{theirs}"]}}',
+            f'{{"action": "propose", "give": ["{mine}"], "get": ["{theirs}"]}}',
+            '{"action": "message", "message": "your move"}',
+        ])
+        bob = SessionScripted("Bob", ['{"action": "message", "message": "hi"}', '{"action": "accept"}'])
+        task = NegotiationGame(max_rounds=3, structured_actions=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            if play_async:
+                result = asyncio.run(arun_match(task, [alice, bob], seed=5, log_dir=tmp, session=True))
+            else:
+                result = run_match(task, [alice, bob], seed=5, log_dir=tmp, session=True)
+        assert result["scores"][0]["deal_completed"] == True
+        history = [m["content"] for m in alice.session["messages"]]
+        assert "Send a corrected move" in history[2] and f'"give": ["{mine}"]' in history[3]
+    print("in session mode the repair is part of the agent's conversation")
+
+    return True
+
+
+def test_scripted_agents():
+    print("\n=== Scripted Agents ===")
+
+    questions = [{"question": f"Question {i}?", "answer": str(i)} for i in range(20)]
+    oracle = create_agent("Oracle", "scripted/trivia-oracle", {"questions": questions})
+    noisy = create_agent("Noisy", "scripted/trivia-oracle", {"questions": questions, "accuracy": 0.5, "seed": 3})
+    assert isinstance(oracle, TriviaOracle) and oracle.provider == "scripted"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run_match(TriviaDuel(questions), [oracle, noisy], log_dir=Path(tmp))
+        assert result["scores"][0] == 20 and 0 < result["scores"][1] < 20
+        # a miss is some other question's answer, not a give-away
+        guesses = [t["action"] for t in result.iter_transcript() if t["agent"] == 1]
+        assert len(guesses) == 20 and all(g in {q["answer"] for q in questions} for g in guesses)
+        print("trivia oracle answers with the configured accuracy, and guesses wrong otherwise")
+
+        replayed = run_match(TriviaDuel(questions), [
+            create_agent("Oracle", "scripted/replay", {"log": str(result.log_path), "seat": 0}),
+            create_agent("Noisy", "scripted/replay", {"log": str(result.log_path), "seat": 1}),
+        ], log_dir=Path(tmp))
+        assert replayed["scores"] == result["scores"]
+        assert [t["action"] for t in replayed.iter_transcript()] == [t["action"] for t in result.iter_transcript()]
+        print("replay agents reproduce a logged match")
+
+        for structured in (False, True):
+            for kinds in [("greedy-negotiator", "tit-for-tat"), ("reservation", "greedy-negotiator")]:
+                agents = [create_agent(kind, f"scripted/{kind}") for kind in kinds]
+                result = run_match(NegotiationGame(structured_actions=structured), agents, seed=8, log_dir=Path(tmp))
+                if result["scores"][0]["deal_completed"]:
+                    # every scripted deal leaves the accepting side no worse off
+                    accepter = 1 - result["final_state"]["final_trade"]["proposer"]
+                    assert result["scores"][accepter]["gain"] >= 0
+        print("heuristic negotiators play both action modes")
+
+        spec = {
+            "name": "scripted",
+            "agents": [{"name": "Greedy", "model": "scripted/greedy-negotiator"},
+                       {"name": "TitForTat", "model": "scripted/tit-for-tat"},
+                       {"name": "Reservation", "model": "scripted/reservation", "model_config": {"reservation": 3}}],
+            "tasks": [{"task": "NegotiationGame", "params": {"max_rounds": 6}}],
+            "seeds": list(range(5)),
+            "swap_seats": True,
+        }
+        queue = JobQueue(Path(tmp) / "queue.db")
+        schedule(spec, queue)
+        assert run_worker(Path(tmp) / "queue.db", log_dir=Path(tmp) / "logs", exit_when_idle=True) == 30
+        assert queue.counts() == {"done": 30}
+        queue.close()
+        print("the scheduler builds scripted agents from the registry")
+
+    try:
+        create_agent("X", "scripted/nope")
+        assert False
+    except ValueError:
+        pass
+
+    class Undecided(Negotiator):
+        pass
+
+    try:
+        Undecided("Undecided", "scripted/undecided")
+        assert False, "a negotiator without decide can't be built"
+    except TypeError:
+        pass
+    print("a negotiator has to implement decide")
+
+    return True
+
+
+def test_engine_bench():
+    print("\n=== Engine Benchmarks ===")
+
+    run = run_benchmarks(repeat=1, quick=True)
+    assert "negotiation/max_rounds=10" in run["results"] and "trivia/questions=100" in run["results"]
+    for row in run["results"].values():
+        assert all(row[metric] >= 0 for metric in METRICS)
+        assert row["turns"] > 0 and row["log_bytes"] > 0
+    # more rounds, more turns, more log
+    short, long = run["results"]["negotiation/max_rounds=5"], run["results"]["negotiation/max_rounds=10"]
+    assert long["turns"] > short["turns"] and long["log_bytes"] > short["log_bytes"]
+    print("benchmarks run against scripted agents")
+
+    assert compare(run, run) == []
+    slower = json.loads(json.dumps(run))
+    slower["results"]["trivia/questions=10"]["match_ms"] *= 2
+    regressions = compare(run, slower, tolerance=0.2)
+    assert [(name, metric) for name, metric, *_ in regressions] == [("trivia/questions=10", "match_ms")]
+    print("comparison flags regressions beyond the tolerance")
+
+    return True
+
+
+def test_call_telemetry():
+    print("\n=== Call Telemetry ===")
+
+    class Streamed:
+        def __init__(self, stream):
+            self.stream = stream
+
+        def __enter__(self):
+            return self.stream
+
+        def __exit__(self, *exc):
+            return False
+
+    class StreamingAnthropic(FakeAnthropic):
+        """Serves messages.stream too: two text chunks, then the final message."""
+
+        def __init__(self):
+            super().__init__()
+            self.messages.stream = self._stream
+
+        def _stream(self, **kwargs):
+            message = self._create(**kwargs)
+            return Streamed(SimpleNamespace(text_stream=iter(["rep", "ly"]), get_final_message=lambda: message))
+
+    price = [3.0, 15.0]
+    agent = fake_anthropic_agent("Priced", model_config={"price": price})
+    reply = agent.act("What is 2+2?")
+    assert isinstance(reply, AgentResponse) and reply.startswith("reply #1")
+    usage = agent.client.usage[-1]
+    assert (reply.input_tokens, reply.output_tokens, reply.retries) == (usage.input_tokens, 5, 0)
+    assert abs(reply.cost_usd - (usage.input_tokens * 3.0 + 5 * 15.0) / 1e6) < 1e-12
+    assert reply.ttft_ms is None and reply.latency_ms >= 0
+    assert "price" not in agent.client.calls[-1]
+    print("replies carry latency, tokens and an estimated cost")
+
+    old_delay = ratelimit.RETRY_BASE_DELAY
+    ratelimit.RETRY_BASE_DELAY = 0.001
+    try:
+        class OnceThrottled(FakeAnthropic):
+            def _create(self, **kwargs):
+                if not self.calls:
+                    self.calls.append(kwargs)
+                    error = Exception("HTTP 429")
+                    error.status_code = 429
+                    raise error
+                return super()._create(**kwargs)
+
+        agent.client = OnceThrottled()
+        assert agent.act("What is 2+2?").retries == 1
+    finally:
+        ratelimit.RETRY_BASE_DELAY = old_delay
+
+    streaming = fake_anthropic_agent("Streaming", model_config={"stream": True})
+    streaming.client = StreamingAnthropic()
+    reply = streaming.act("Hello")
+    assert reply.ttft_ms is not None and reply.ttft_ms <= reply.latency_ms
+    assert reply.cost_usd is None and "stream" not in streaming.client.calls[-1]
+    print("streamed calls record time to first token")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(Path(tmp) / "cache.db")
+        cached_agent = fake_anthropic_agent("Cached", model_config={"temperature": 0, "price": price}, cache=cache)
+        cached_agent.act("Same prompt")
+        again = cached_agent.act("Same prompt")
+        assert again.cached and again.cost_usd == 0.0 and len(cached_agent.client.calls) == 1
+        cache.close()
+        print("cache hits are marked and cost nothing")
+
+        questions = [{"question": "What is 2+2?", "answer": "4"}, {"question": "Capital of France?", "answer": "Paris"}]
+        agents = [fake_anthropic_agent("A", model_config={"price": price}), fake_anthropic_agent("B")]
+        result = run_match(TriviaDuel(questions), agents, log_dir=Path(tmp) / "logs")
+        turns = list(result.iter_transcript())
+        seat = result["telemetry"][0]
+        assert seat["calls"] == 2 and seat["latency_ms"]["count"] == 2
+        assert seat["input_tokens"] == sum(t["input_tokens"] for t in turns if t["agent"] == 0)
+        assert seat["cost_usd"] > 0 and result["telemetry"][1]["unpriced"] == 2
+        end = list(read_events(result.log_path))[-1]
+        assert end["telemetry"] == result["telemetry"]
+        print("the engine adds up telemetry per match")
+
+        text = metrics_from_logs(Path(tmp) / "logs").render()
+        assert 'llm_tournament_calls_total{task="TriviaDuel",agent="A",model="claude-fake",provider="anthropic"} 2' in text
+        assert 'llm_tournament_call_latency_seconds_count{task="TriviaDuel",agent="B"' in text
+        assert text.endswith("# EOF\n")
+        print("match telemetry exports as OpenMetrics")
+
+    return True
+
+
+def test_match_rng():
+    print("\n=== Per-Match RNG ===")
+
+    game = NegotiationGame()
+    state = game.init(5)
+    random.seed(0)
+    random.random()
+    again = game.init(5)
+    assert again["valuations"] == state["valuations"] and again["inventories"] == state["inventories"]
+    print("deals don't depend on the global random module")
+
+    # only the deal is random: no RNG state in every checkpoint
+    assert "rng" not in state and "rng" not in TriviaDuel([]).init(5)
+    drawing = {"round": 3, "rng": MatchRandom(5)}
+    drawing["rng"].random()
+    restored = decode_state(json.loads(json.dumps(encode_state(drawing))))
+    assert restored == drawing
+    assert [restored["rng"].random() for _ in range(3)] == [drawing["rng"].random() for _ in range(3)]
+    print("a match RNG kept in the state survives a checkpoint")
+
+    def play(seed):
+        agents = [create_agent(kind, f"scripted/{kind}") for kind in ("tit-for-tat", "reservation")]
+        result = run_match(game, agents, seed=seed, log_dir=log_dir)
+        return result["scores"], result["final_state"], [t["action"] for t in result.iter_transcript()]
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        seeds = list(range(16))
+        serial = [play(seed) for seed in seeds]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            threaded = list(pool.map(play, seeds))
+        assert threaded == serial
+    print("matches in a thread pool play exactly like serial ones")
+
+    return True
+
+
+def test_compact_logs():
+    print("\n=== Compact Logs ===")
+
+    class CrashingNegotiator(GreedyNegotiator):
+        def act(self, observation):
+            if "ROUND 12 /" in observation:
+                raise RuntimeError("preempted")
+            return super().act(observation)
+
+    def negotiators(crash=False):
+        return [create_agent("A", "scripted/greedy-negotiator", {"margin": 10 ** 6}),
+                (CrashingNegotiator if crash else GreedyNegotiator)("B", "scripted/greedy-negotiator", {"margin": 10 ** 6})]
+
+    def comparable(events):
+        skip = ("latency_ms", "match_id", "timestamp", "log_dir", "compact", "telemetry")
+        return [{k: v for k, v in e.items() if k not in skip} for e in events]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = run_match(NegotiationGame(max_rounds=30), negotiators(), seed=4, log_dir=Path(tmp) / "plain")
+        compact = run_match(NegotiationGame(max_rounds=30), negotiators(), seed=4, log_dir=Path(tmp) / "compact",
+                            compact=True)
+        assert compact.log_path.stat().st_size * 5 < plain.log_path.stat().st_size
+        assert comparable(read_events(compact.log_path)) == comparable(read_events(plain.log_path))
+        raw = list(read_events(compact.log_path, expand=False))
+        assert any("obs_delta" in e for e in raw) and any("state_delta" in e for e in raw)
+        print("compact logs read back exactly like plain ones")
+
+        gz_dir = Path(tmp) / "gz"
+        try:
+            run_match(NegotiationGame(max_rounds=30), negotiators(crash=True), seed=4, log_dir=gz_dir,
+                      compact=True, compression="gzip")
+            assert False, "match should have crashed"
+        except RuntimeError:
+            pass
+        crashed = next(gz_dir.glob("*.jsonl.gz"))
+        # cut the compressed stream short, like a crash in the middle of a write
+        data = crashed.read_bytes()
+        crashed.write_bytes(data[:-12])
+        resumed = resume_match(crashed, NegotiationGame(max_rounds=30), negotiators())
+        assert resumed["final_state"] == plain["final_state"]
+        assert [t["observation"] for t in resumed.iter_transcript()] == [t["observation"] for t in plain.iter_transcript()]
+        print("compressed compact logs survive a crash and resume")
+
+        index = LogIndex(gz_dir, db_path=Path(tmp) / "index.db")
+        assert index.update() == 1 and index.turn_stats()["turns"] == 60
+        index.close()
+
+    return True
+
+
+def test_render_log():
+    print("\n=== Readable Log Rendering ===")
+
+    agents = [create_agent("Greedy", "scripted/greedy-negotiator", {"margin": 10 ** 6}),
+              create_agent("Stubborn", "scripted/reservation", {"reservation": 10 ** 6})]
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run_match(NegotiationGame(max_rounds=10), agents, seed=2, log_dir=tmp, compact=True)
+        assert list(Path(tmp).glob("*_readable.txt")) == []
+        print("no readable file unless asked for")
+
+        text = "".join(render(read_events(result.log_path), task=NegotiationGame()))
+        assert text.count("--- Round ") == 20 and "FINAL SCORES" in text and "Deal Completed: False" in text
+        assert text.count("Observation:") == 20
+        print("renders the whole match from the structured log")
+
+        text = "".join(render(read_events(result.log_path), rounds=(3, 4), agents=["Stubborn"], observations=False))
+        assert text.count("--- Round ") == 2 and "--- Round 3 | Agent 1 (Stubborn) ---" in text
+        assert "Observation:" not in text
+        print("filters by round and agent")
+
+        pages = ["".join(render(read_events(result.log_path), page=page, page_size=6)) for page in (1, 4)]
+        assert pages[0].count("--- Round ") == 6 and "FINAL SCORES" not in pages[0]
+        assert "[page 1 of 4: 6 of 20 turns]" in pages[0]
+        assert pages[1].count("--- Round ") == 2 and "FINAL SCORES" in pages[1]
+        print("pages through long matches")
+
+        agents = [create_agent("Greedy", "scripted/greedy-negotiator"), create_agent("TitForTat", "scripted/tit-for-tat")]
+        result = run_match(NegotiationGame(max_rounds=4), agents, seed=2, log_dir=tmp, readable=True)
+        readable = Path(tmp) / f"{result['match_id']}_readable.txt"
+        assert readable.read_text().startswith("=" * 80 + "\nMATCH: ")
+
+    return True
+
+
+def test_coding_battle():
+    print("\n=== Coding Battle ===")
+
+    problems = [
+        {"id": "add", "prompt": "Add two numbers.", "entry_point": "add",
+         "tests": [{"args": [1, 2], "expected": 3}, {"args": [-1, 1], "expected": 0}, {"args": [5, 5], "expected": 10}]},
+        {"id": "sum-line", "prompt": "Print the sum of the integers on the first line.",
+         "tests": [{"stdin": "1 2 3\n", "stdout": "6\n"}, {"stdin": "10\n", "stdout": "10\n"}]},
+    ]
+
+    class CoderAgent(Agent):
+        def __init__(self, name, replies):
+            super().__init__(name, model="mock")
+            self.replies = replies
+            self.observations = []
+
+        def act(self, observation):
+            self.observations.append(observation)
+            return self.replies[min(len(self.observations), len(self.replies)) - 1]
+
+    solid = CoderAgent("Solid", [
+        "Here you go:\n```python\ndef add(a, b):\n    return a + b\n```",
+        "```python\nprint(sum(map(int, input().split())))\n```",
+    ])
+    sloppy = CoderAgent("Sloppy", [
+        "```python\ndef add(a, b):\n    return a + b if a > 0 else 1\n```",
+        "```python\ndef add(a, b):\n    return a + b\n```",
+        "```python\nwhile True:\n    pass\n```",
+    ])
+
+    with SandboxPool(workers=2, timeout=1.0) as pool, tempfile.TemporaryDirectory() as tmp:
+        result = run_match(CodingBattle(problems, attempts=2, pool=pool, timeout=1.0), [solid, sloppy], seed=1, log_dir=tmp)
+        scores = result["scores"]
+        assert scores[0] == {"score": 2.0, "solved": 2, "tests_passed": 5, "tests_total": 5}
+        assert scores[1] == {"score": 1.0, "solved": 1, "tests_passed": 3, "tests_total": 5}
+        assert "First failing test: test 2, input [-1, 1]: returned 1" in sloppy.observations[1]
+        assert "Example: add(1, 2) == 3" in solid.observations[0]
+        print(f"both agents' suites judged in the sandbox: {scores}")
+
+        outcomes = pool.run_many([
+            ("def f():\n    while True:\n        pass", [{"args": []}], "f"),
+            ("def f():\n    return bytearray(512 * 1024 * 1024)", [{"args": []}], "f"),
+            ("def f(x):\n    return {'x': x}", [{"args": [1], "expected": "secret"}], "f"),
+            ("import sys\nsys.exit(3)", [{"stdin": ""}], None),
+        ])
+        assert [o[0]["status"] for o in outcomes] == ["timeout", "memory", "ok", "error"]
+        assert outcomes[2][0]["value"] == {"x": 1}
+        print("timeouts, memory limits and exit codes are reported per case")
+
+        # the log's task has no pool: replays run on the shared one, in this process
+        # (which starts it) and then in worker processes
+        assert rescore_logs(tmp, "here", processes=1)["ok"] == 1
+        summary = rescore_logs(tmp, "workers", processes=2)
+        assert summary["ok"] == 1 and summary["changed"] == 0, summary
+        assert load_scores(result.log_path, "workers") == scores
+        print("coding battles re-score in worker processes")
+
+    return True
+
+
+def test_llm_judge():
+    print("\n=== LLM Judge ===")
+
+    class PanelAgent(Agent):
+        """Judges by the 'better: <seat>' line of every match; contrarian on the listed matches."""
+
+        def __init__(self, name, contrarian=(), broken_batches=False):
+            super().__init__(name, model=f"mock-judge-{name}", model_config={"temperature": 0})
+            self.contrarian = set(contrarian)
+            self.broken_batches = broken_batches
+            self.prompts = []
+
+        def act(self, observation):
+            self.prompts.append(observation)
+            matches = observation.split("=== MATCH ")[1:]
+            if self.broken_batches and len(matches) > 1:
+                return "Sorry, too many at once."
+            verdicts = []
+            for number, text in enumerate(matches, 1):
+                match_id = int(text.split("match ")[1].split()[0])
+                better = int(text.split("better: ")[1][0])
+                if match_id in self.contrarian:
+                    better = 1 - better
+                verdicts.append({"match": number, "scores": [8, 3] if better == 0 else [2, 9], "winner": better})
+            return json.dumps({"verdicts": verdicts})
+
+    task = SimpleNamespace(render=lambda state: f"match {state['id']}\nbetter: {state['better']}")
+    items = [(task, {"id": i, "better": i % 2}) for i in range(5)]
+
+    panel = [PanelAgent("J1"), PanelAgent("J2", contrarian={3}), PanelAgent("J3")]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(Path(tmp) / "judge.db")
+        judge = LLMJudge(panel, cache=cache, batch_size=3)
+        verdicts = judge.evaluate_many(items)
+        assert [v["winner"] for v in verdicts] == [0, 1, 0, 1, 0]
+        assert [v["judges"] for v in verdicts] == [2, 2, 2, 3, 2]
+        assert verdicts[3]["votes"] == [1, 0, 1] and verdicts[3]["agreement"] == 0.667
+        assert verdicts[0]["scores"] == {0: 8.0, 1: 3.0}
+        # quorum of two judges, 5 matches in batches of 3 and 2; the third judge only sees match 3
+        assert (len(panel[0].prompts), len(panel[1].prompts), len(panel[2].prompts)) == (2, 2, 1)
+        assert panel[0].prompts[0].count("=== MATCH ") == 3 and panel[2].prompts[0].count("=== MATCH ") == 1
+        print(f"panel with early exit: {judge.calls} requests for 5 matches x 3 judges")
+
+        calls = judge.calls
+        assert judge.evaluate_many(items) == verdicts
+        assert judge.calls == calls and judge.cache_hits == 11
+        print("re-judging is served from the verdict cache")
+        cache.close()
+
+    broken = PanelAgent("Broken", broken_batches=True)
+    verdicts = LLMJudge([broken], batch_size=4).evaluate_many(items[:4])
+    assert [v["winner"] for v in verdicts] == [0, 1, 0, 1]
+    assert [p.count("=== MATCH ") for p in broken.prompts] == [4, 1, 1, 1, 1]
+    print("a batch reply that doesn't parse is retried one match at a time")
+
+    mean_judge = LLMJudge([PanelAgent("J1"), PanelAgent("J2", contrarian={0})], aggregate="mean", early_exit=False)
+    verdict = mean_judge.evaluate(items[0][1], task)
+    assert verdict["scores"] == {0: 5.0, 1: 6.0} and verdict["winner"] == 1
+    assert RuleBasedJudge().evaluate(TriviaDuel([]).init(1), TriviaDuel([])) == {0: 0, 1: 0}
+
+    class Incomplete(Judge):
+        pass
+
+    try:
+        Incomplete()
+        assert False, "a judge without evaluate_many can't be built"
+    except TypeError:
+        pass
+    print("a judge has to implement evaluate_many")
+
+    return True
+
+
+def test_rescore():
+    print("\n=== Offline Re-scoring ===")
+
+    questions = [{"question": "Capital of France?", "answer": "Paris"},
+                 {"question": "2 + 2?", "answer": "4"}]
+
+    class Answerer(Agent):
+        def __init__(self, name, answers):
+            super().__init__(name, model="mock")
+            self.answers = iter(answers)
+
+        def act(self, observation):
+            return next(self.answers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trivia = run_match(TriviaDuel(questions), [Answerer("Chatty", ["Paris.", "4."]), Answerer("Terse", ["Paris", "5"])],
+                           seed=3, log_dir=tmp)
+        assert trivia["scores"] == {0: 0, 1: 1}
+        negotiators = [create_agent("Greedy", "scripted/greedy-negotiator"), create_agent("TitForTat", "scripted/tit-for-tat")]
+        negotiation = run_match(NegotiationGame(max_rounds=6), negotiators, seed=5, log_dir=tmp, compact=True)
+
+        summary = rescore_logs(tmp, "same-rules", processes=2)
+        assert summary["ok"] == 2 and summary["changed"] == 0
+        assert load_scores(negotiation.log_path, "same-rules") == negotiation["scores"]
+        print("replaying the logged actions reproduces the original scores")
+
+        # a scoring fix: trailing punctuation shouldn't cost the point
+        original = TriviaDuel.__dict__["check_answer"]
+        TriviaDuel.check_answer = staticmethod(lambda answer, correct: original(answer.strip().rstrip("."), correct))
+        try:
+            entry = rescore_log(trivia.log_path, "punctuation-fix")
+        finally:
+            TriviaDuel.check_answer = original
+        assert entry["status"] == "ok" and entry["changed"] and entry["winner_changed"]
+        save_version(trivia.log_path, trivia["match_id"], entry)
+
+        assert load_scores(trivia.log_path) == {0: 0, 1: 1}
+        assert load_scores(trivia.log_path, "latest") == {0: 2, 1: 1}
+        assert load_scores(trivia.log_path, "same-rules") == {0: 0, 1: 1}
+        sidecar = json.loads((Path(tmp) / f"{trivia['match_id']}.scores.json").read_text())
+        assert [v["version"] for v in sidecar["versions"]] == ["same-rules", "punctuation-fix"]
+        outcomes = outcomes_from_results(r for r in rescored_results(tmp, "punctuation-fix"))
+        assert outcomes == [("Chatty", "Terse", 1.0)]
+        print("new score versions sit next to the old ones, and feed the ratings")
+
+        corpus = Path(tmp) / "questions.jsonl"
+        corpus.write_text("".join(json.dumps({"question": f"Question {i}?", "answer": str(i)}) + "\n"
+                                  for i in range(20)))
+        task = build_task({"task": "TriviaDuel", "question_bank": str(corpus), "questions_per_match": 3}, seed=4)
+        oracles = [create_agent(f"O{i}", "scripted/trivia-oracle", {"questions": list(task.questions), "seed": i})
+                   for i in (0, 1)]
+        banked = run_match(task, oracles, seed=4, log_dir=tmp)
+        entry = rescore_log(banked.log_path, "bank")
+        assert entry["status"] == "ok" and not entry["changed"], entry
+        print("matches drawing from a question bank replay too")
+
+    return True
+
+
 def run_all():
     print("=" * 60)
     print("MILESTONE 1: Agent/Task API + Runner Logic")
@@ -201,6 +1689,31 @@ def run_all():
         ("NegotiationGame Mechanics", test_negotiation_mechanics),
         ("Agent", test_agent),
         ("Orchestration Engine", test_orchestration),
+        ("Async Orchestration", test_async_orchestration),
+        ("Tournament Scheduler", test_tournament),
+        ("Response Cache", test_response_cache),
+        ("Client Registry", test_client_registry),
+        ("Streaming Match Log", test_streaming_log),
+        ("Checkpoint and Resume", test_checkpoint_resume),
+        ("Negotiation History Budget", test_negotiation_history_budget),
+        ("Session Mode", test_session_mode),
+        ("Rate Limiting and Retries", test_rate_limit_and_retries),
+        ("Answer-Once Trivia", test_answer_once_trivia),
+        ("Question Bank", test_question_bank),
+        ("Ratings", test_ratings),
+        ("Log Index", test_log_index),
+        ("Compact Negotiation", test_negotiation_compact),
+        ("Negotiation Solver", test_negotiation_solver),
+        ("Structured Actions", test_structured_actions),
+        ("Scripted Agents", test_scripted_agents),
+        ("Engine Benchmarks", test_engine_bench),
+        ("Call Telemetry", test_call_telemetry),
+        ("Per-Match RNG", test_match_rng),
+        ("Compact Logs", test_compact_logs),
+        ("Readable Log Rendering", test_render_log),
+        ("Coding Battle", test_coding_battle),
+        ("LLM Judge", test_llm_judge),
+        ("Offline Re-scoring", test_rescore),
     ]
     
     passed = 0
@@ -0,0 +1,182 @@
+"""
+Answer-once evaluation for blind TriviaDuel tournaments.
+
+In a blind TriviaDuel (TriviaDuel(questions, blind=True)) a model's prompt for a
+question doesn't depend on who it is playing, so there is no reason to ask it again
+in every pairing. Instead:
+
+    1. collect_answers() sends every question to every model once, through the
+       provider's batch API where there is one and a thread pool otherwise,
+       and stores the graded answers in an AnswerTable (SQLite).
+    2. duel_from_table() / standings() assemble duels and a round robin from the table.
+
+That's N*Q calls for N models and Q questions instead of about N^2*Q.
+
+    python -m tournament.answer_table spec.json --db answers.db
+"""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
+from agents.agents import AgentFailure
+from tasks.trivia_duel import TriviaDuel
+
+
+def question_id(question, index):
+    return str(question.get("id", index))
+
+
+class AnswerTable:
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "agent TEXT NOT NULL, question_id TEXT NOT NULL, answer TEXT NOT NULL, correct INTEGER NOT NULL, "
+            "PRIMARY KEY (agent, question_id))"
+        )
+
+    def close(self):
+        self._conn.close()
+
+    def record(self, agent_name, rows):
+        """rows: iterable of (question_id, answer, correct)"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO answers (agent, question_id, answer, correct) VALUES (?, ?, ?, ?)",
+                [(agent_name, qid, answer, int(correct)) for qid, answer, correct in rows]
+            )
+
+    def answered(self, agent_name):
+        with self._lock:
+            rows = self._conn.execute("SELECT question_id FROM answers WHERE agent = ?", (agent_name,)).fetchall()
+        return {row[0] for row in rows}
+
+    def correct(self, agent_name, question_ids=None):
+        """Set of question ids the agent got right."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question_id FROM answers WHERE agent = ? AND correct = 1", (agent_name,)
+            ).fetchall()
+        right = {row[0] for row in rows}
+        return right if question_ids is None else right & set(question_ids)
+
+
+def collect_answers(agents, questions, table, concurrency=32, use_batch_api=True, poll_interval=30.0):
+    """
+    Ask every agent every question it hasn't answered yet, grade and store the answers.
+    Safe to re-run: questions already in the table are skipped, failed calls are left
+    out so the next run picks them up.
+    """
+    for agent in agents:
+        done = table.answered(agent.name)
+        pending = [(question_id(q, i), q) for i, q in enumerate(questions)
+                   if question_id(q, i) not in done]
+        if not pending:
+            continue
+
+        if use_batch_api and agent.provider == "anthropic" and hasattr(agent.client.messages, "batches"):
+            answers = _anthropic_batch(agent, pending, poll_interval)
+        else:
+            answers = _thread_pool(agent, pending, concurrency)
+
+        rows = []
+        for qid, q in pending:
+            answer = answers.get(qid)
+            if answer is not None:
+                rows.append((qid, answer, TriviaDuel.check_answer(answer, q["answer"])))
+        table.record(agent.name, rows)
+
+
+def _thread_pool(agent, pending, concurrency):
+    # the provider's shared rate limiter keeps this pool under quota
+    def _ask(item):
+        qid, q = item
+        reply = agent.act(TriviaDuel.question_prompt(q["question"]))
+        return qid, None if isinstance(reply, AgentFailure) else reply
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return dict(pool.map(_ask, pending))
+
+
+def _anthropic_batch(agent, pending, poll_interval):
+    """Message Batches API: half price, no rate limit pressure, results within a day."""
+    batches = agent.client.messages.batches
+    requests = [
+        {"custom_id": qid,
+         "params": agent._anthropic_request([{"role": "user", "content": TriviaDuel.question_prompt(q["question"])}])}
+        for qid, q in pending
+    ]
+    batch = batches.create(requests=requests)
+    while batch.processing_status != "ended":
+        time.sleep(poll_interval)
+        batch = batches.retrieve(batch.id)
+
+    answers = {}
+    for entry in batches.results(batch.id):
+        if entry.result.type == "succeeded":
+            answers[entry.custom_id] = entry.result.message.content[0].text.strip()
+    return answers
+
+
+def duel_from_table(table, agent_a, agent_b, question_ids):
+    """Scores of a blind TriviaDuel between two agents, in TriviaDuel.score format."""
+    return {0: len(table.correct(agent_a, question_ids)), 1: len(table.correct(agent_b, question_ids))}
+
+
+def standings(table, agent_names, question_ids):
+    """
+    Round robin over the given questions without any API calls.
+
+    Returns:
+        {name: {"wins", "ties", "losses", "points", "correct"}} with points 1/0.5/0 per duel
+    """
+    correct = {name: len(table.correct(name, question_ids)) for name in agent_names}
+    results = {name: {"wins": 0, "ties": 0, "losses": 0, "points": 0.0, "correct": correct[name]}
+               for name in agent_names}
+    for a, b in combinations(agent_names, 2):
+        if correct[a] == correct[b]:
+            results[a]["ties"] += 1
+            results[b]["ties"] += 1
+            results[a]["points"] += 0.5
+            results[b]["points"] += 0.5
+        else:
+            winner, loser = (a, b) if correct[a] > correct[b] else (b, a)
+            results[winner]["wins"] += 1
+            results[winner]["points"] += 1
+            results[loser]["losses"] += 1
+    return results
+
+
+def main():
+    from tournament.scheduler import build_agents
+
+    parser = argparse.ArgumentParser(description="Answer-once evaluation of a blind TriviaDuel tournament")
+    parser.add_argument("spec", help="tournament spec JSON (uses its agents and its TriviaDuel questions)")
+    parser.add_argument("--db", default="answers.db", help="answer table SQLite file")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--no-batch-api", action="store_true", help="use the thread pool for every provider")
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    questions = next(t["params"]["questions"] for t in spec["tasks"] if t["task"] == "TriviaDuel")
+
+    agents = build_agents(spec["agents"])
+    table = AnswerTable(args.db)
+    collect_answers(agents, questions, table, concurrency=args.concurrency, use_batch_api=not args.no_batch_api)
+
+    ids = [question_id(q, i) for i, q in enumerate(questions)]
+    rows = standings(table, [a.name for a in agents], ids)
+    for name, row in sorted(rows.items(), key=lambda item: -item[1]["points"]):
+        print(f"{name}: {row['points']} pts ({row['wins']}W {row['ties']}T {row['losses']}L), "
+              f"{row['correct']}/{len(ids)} correct")
+
+
+if __name__ == "__main__":
+    main()
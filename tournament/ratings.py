@@ -0,0 +1,314 @@
+"""
+Ratings from match results.
+
+- Elo and Glicko2 are online: feed them matches as they finish (Elo) or one rating
+  period at a time (Glicko-2), so nothing gets refit from scratch.
+- bradley_terry() fits all results at once and bootstrap_bradley_terry() adds
+  confidence intervals by resampling matches.
+
+An outcome is (name_a, name_b, score_a) with score_a 1 / 0.5 / 0 for a win / tie / loss.
+outcomes_from_results() turns JobQueue results into outcomes through match_points
+(trivia: more correct answers wins, negotiation: bigger gain wins).
+
+The batch fits aggregate results per pair of agents first, so after one pass over the
+matches their cost depends on the number of agents, not the number of matches.
+
+    python -m tournament.ratings --db tournament.db --tournament release-1
+"""
+import argparse
+import math
+
+import numpy as np
+
+from tournament.scheduler import match_points
+
+BASE_RATING = 1500.0
+# natural log strength -> Elo points
+ELO_SCALE = 400 / math.log(10)
+# Glicko-2 works on its own scale: mu = (rating - 1500) / GLICKO_SCALE
+GLICKO_SCALE = 173.7178
+
+
+def outcomes_from_results(results):
+    """(job, result) pairs from JobQueue.results() -> list of (name_a, name_b, score_a)."""
+    outcomes = []
+    for job, result in results:
+        a, b = (agent["name"] for agent in job["agents"])
+        outcomes.append((a, b, match_points(result["scores"])[0]))
+    return outcomes
+
+
+def encode_outcomes(outcomes, names=None):
+    """
+    Outcomes -> (names, a, b, s) with a/b index arrays into names and s the scores of a.
+    """
+    outcomes = list(outcomes)
+    if names is None:
+        names = sorted({o[0] for o in outcomes} | {o[1] for o in outcomes})
+    index = {name: i for i, name in enumerate(names)}
+    count = len(outcomes)
+    a = np.fromiter((index[o[0]] for o in outcomes), dtype=np.intp, count=count)
+    b = np.fromiter((index[o[1]] for o in outcomes), dtype=np.intp, count=count)
+    s = np.fromiter((o[2] for o in outcomes), dtype=float, count=count)
+    return list(names), a, b, s
+
+
+def _outcome_cells(n, a, b, s):
+    # how often each (a, b, result) happened: shape (n, n, 3) for win / tie / loss of a
+    result = np.where(s > 0.5, 0, np.where(s < 0.5, 2, 1))
+    return np.bincount((a * n + b) * 3 + result, minlength=n * n * 3).reshape(n, n, 3)
+
+
+def _pair_totals(cells):
+    """(..., n, n, 3) outcome counts -> points[i, j] scored by i against j, games[i, j] between them."""
+    cells = cells.astype(float)
+    points = cells[..., 0] + 0.5 * cells[..., 1]
+    lost = cells[..., 2] + 0.5 * cells[..., 1]
+    games = cells.sum(-1)
+    return points + np.swapaxes(lost, -1, -2), games + np.swapaxes(games, -1, -2)
+
+
+def _bradley_terry_mm(points, games, prior, max_iter, tol):
+    """
+    Hunter's MM algorithm, batched over any leading dimensions.
+
+    prior is a number of virtual tied games every agent plays against an average
+    opponent, which keeps unbeaten / winless agents finite.
+    """
+    strength = np.ones(points.shape[:-1])
+    wins = points.sum(-1) + prior / 2
+    for _ in range(max_iter):
+        denom = (games / (strength[..., :, None] + strength[..., None, :])).sum(-1) + prior / (strength + 1)
+        new = wins / denom
+        # pin the geometric mean to 1 (-> average rating BASE_RATING)
+        new /= np.exp(np.log(new).mean(-1, keepdims=True))
+        converged = np.max(np.abs(new - strength)) < tol
+        strength = new
+        if converged:
+            break
+    return BASE_RATING + ELO_SCALE * np.log(strength)
+
+
+def bradley_terry(outcomes, prior=1.0, max_iter=1000, tol=1e-9):
+    """
+    Maximum likelihood Bradley-Terry ratings on the Elo scale (ties count as half a win).
+
+    Returns:
+        {name: rating}, averaging BASE_RATING
+    """
+    names, a, b, s = encode_outcomes(outcomes)
+    points, games = _pair_totals(_outcome_cells(len(names), a, b, s))
+    ratings = _bradley_terry_mm(points, games, prior, max_iter, tol)
+    return dict(zip(names, ratings.tolist()))
+
+
+def bootstrap_bradley_terry(outcomes, samples=1000, confidence=0.95, seed=0, prior=1.0,
+                            max_iter=1000, tol=1e-6, chunk_size=100):
+    """
+    Bradley-Terry ratings with bootstrap confidence intervals.
+
+    Resampling matches with replacement is the same as drawing a multinomial over the
+    distinct (a, b, result) cells, so each bootstrap sample is one row of counts and
+    all samples in a chunk are fitted together.
+
+    Returns:
+        {name: {"rating", "low", "high"}}
+    """
+    names, a, b, s = encode_outcomes(outcomes)
+    n = len(names)
+    cells = _outcome_cells(n, a, b, s)
+    points, games = _pair_totals(cells)
+    ratings = _bradley_terry_mm(points, games, prior, max_iter, tol)
+
+    rng = np.random.default_rng(seed)
+    flat = cells.ravel()
+    total = int(flat.sum())
+    boot = []
+    for start in range(0, samples, chunk_size):
+        size = min(chunk_size, samples - start)
+        resampled = rng.multinomial(total, flat / total, size=size).reshape(size, n, n, 3)
+        boot.append(_bradley_terry_mm(*_pair_totals(resampled), prior, max_iter, tol))
+    boot = np.concatenate(boot)
+
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(boot, [tail, 100 - tail], axis=0)
+    return {name: {"rating": float(ratings[i]), "low": float(low[i]), "high": float(high[i])}
+            for i, name in enumerate(names)}
+
+
+class Elo:
+    """Classic Elo, updated one match at a time as results come in."""
+
+    def __init__(self, k=32.0, initial=BASE_RATING):
+        self.k = k
+        self.initial = initial
+        self.ratings = {}
+        self.games = {}
+
+    def expected(self, a, b):
+        ra = self.ratings.get(a, self.initial)
+        rb = self.ratings.get(b, self.initial)
+        return 1 / (1 + 10 ** ((rb - ra) / 400))
+
+    def update(self, a, b, score_a):
+        delta = self.k * (score_a - self.expected(a, b))
+        self.ratings[a] = self.ratings.get(a, self.initial) + delta
+        self.ratings[b] = self.ratings.get(b, self.initial) - delta
+        self.games[a] = self.games.get(a, 0) + 1
+        self.games[b] = self.games.get(b, 0) + 1
+
+    def update_many(self, outcomes):
+        for a, b, score_a in outcomes:
+            self.update(a, b, score_a)
+
+
+class Glicko2:
+    """
+    Glicko-2 (Glickman, 2012). Matches are collected with add() and applied together
+    by end_period(); a rating period is e.g. one tournament round.
+
+    All players are updated at once with array operations, including the iterative
+    volatility step.
+    """
+
+    def __init__(self, tau=0.5, initial_rating=BASE_RATING, initial_rd=350.0, initial_volatility=0.06):
+        self.tau = tau
+        self.initial_rd = initial_rd
+        self.initial_volatility = initial_volatility
+        self.initial_mu = (initial_rating - BASE_RATING) / GLICKO_SCALE
+        self.names = []
+        self._index = {}
+        self.mu = np.zeros(0)
+        self.phi = np.zeros(0)
+        self.sigma = np.zeros(0)
+        self._pending = []
+
+    def _player(self, name):
+        if name not in self._index:
+            self._index[name] = len(self.names)
+            self.names.append(name)
+            self.mu = np.append(self.mu, self.initial_mu)
+            self.phi = np.append(self.phi, self.initial_rd / GLICKO_SCALE)
+            self.sigma = np.append(self.sigma, self.initial_volatility)
+        return self._index[name]
+
+    def add(self, a, b, score_a):
+        self._pending.append((a, b, score_a))
+
+    def end_period(self):
+        """Apply every match added since the last period."""
+        for a, b, _ in self._pending:
+            self._player(a)
+            self._player(b)
+        _, a, b, s = encode_outcomes(self._pending, names=self.names)
+        self._pending = []
+        self._rate(a, b, s)
+
+    def _rate(self, a, b, s):
+        n = len(self.names)
+        mu, phi, sigma = self.mu, self.phi, self.sigma
+
+        # every match seen from both sides
+        player = np.concatenate([a, b])
+        opponent = np.concatenate([b, a])
+        score = np.concatenate([s, 1 - s])
+        g = 1 / np.sqrt(1 + 3 * phi[opponent] ** 2 / math.pi ** 2)
+        expected = 1 / (1 + np.exp(-g * (mu[player] - mu[opponent])))
+
+        played = np.bincount(player, minlength=n) > 0
+        info = np.bincount(player, weights=g ** 2 * expected * (1 - expected), minlength=n)
+        improvement = np.bincount(player, weights=g * (score - expected), minlength=n)
+        v = np.divide(1, info, out=np.full(n, np.inf), where=info > 0)
+        delta = v * improvement
+
+        new_sigma = np.where(played, self._volatility(phi, sigma, v, delta, played), sigma)
+        phi_star = np.sqrt(phi ** 2 + new_sigma ** 2)
+        new_phi = np.where(played, 1 / np.sqrt(1 / phi_star ** 2 + info), phi_star)
+        self.mu = np.where(played, mu + new_phi ** 2 * improvement, mu)
+        self.phi = new_phi
+        self.sigma = new_sigma
+
+    def _volatility(self, phi, sigma, v, delta, played, eps=1e-6, max_iter=100):
+        # Illinois regula falsi from step 5 of the paper, for all players at once;
+        # players who sat the period out get placeholder values that are thrown away
+        v = np.where(played, v, 1.0)
+        delta = np.where(played, delta, 0.0)
+        tau = self.tau
+        alpha = np.log(sigma ** 2)
+
+        def f(x):
+            ex = np.exp(x)
+            return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - alpha) / tau ** 2
+
+        big = delta ** 2 > phi ** 2 + v
+        lower = np.log(np.where(big, delta ** 2 - phi ** 2 - v, 1.0))
+        k = np.ones_like(alpha)
+        while True:
+            stuck = ~big & (f(alpha - k * tau) < 0)
+            if not stuck.any():
+                break
+            k += stuck
+        upper_a = alpha
+        upper_b = np.where(big, lower, alpha - k * tau)
+
+        A, B = upper_a, upper_b
+        fA, fB = f(A), f(B)
+        for _ in range(max_iter):
+            active = np.abs(B - A) > eps
+            if not active.any():
+                break
+            C = A + (A - B) * fA / (fB - fA)
+            fC = f(C)
+            swap = fC * fB <= 0
+            A = np.where(active & swap, B, A)
+            fA = np.where(active & swap, fB, np.where(active, fA / 2, fA))
+            B = np.where(active, C, B)
+            fB = np.where(active, fC, fB)
+        return np.exp(A / 2)
+
+    def ratings(self):
+        """{name: {"rating", "rd", "volatility"}} on the usual Glicko scale."""
+        rating = BASE_RATING + GLICKO_SCALE * self.mu
+        rd = GLICKO_SCALE * self.phi
+        return {name: {"rating": float(rating[i]), "rd": float(rd[i]), "volatility": float(self.sigma[i])}
+                for i, name in enumerate(self.names)}
+
+
+def main():
+    from tournament.work_queue import JobQueue
+
+    parser = argparse.ArgumentParser(description="Rate the agents of a tournament from the job queue")
+    parser.add_argument("--db", default="tournament.db", help="job queue SQLite file")
+    parser.add_argument("--tournament", default="default")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="bootstrap samples for the intervals")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db)
+    results = queue.results(args.tournament)
+    queue.close()
+    if not results:
+        print(f"No finished matches for {args.tournament}")
+        return
+
+    outcomes = outcomes_from_results(results)
+    bt = bootstrap_bradley_terry(outcomes, samples=args.bootstrap)
+    elo = Elo()
+    elo.update_many(outcomes)
+    glicko = Glicko2()
+    # one rating period per tournament round
+    for round_index in sorted({job.get("round", 0) for job, _ in results}):
+        for (job, _), outcome in zip(results, outcomes):
+            if job.get("round", 0) == round_index:
+                glicko.add(*outcome)
+        glicko.end_period()
+    glicko_ratings = glicko.ratings()
+
+    print(f"{len(outcomes)} matches")
+    for name, row in sorted(bt.items(), key=lambda item: -item[1]["rating"]):
+        print(f"{name}: BT {row['rating']:.0f} [{row['low']:.0f}, {row['high']:.0f}]  "
+              f"Elo {elo.ratings[name]:.0f}  "
+              f"Glicko-2 {glicko_ratings[name]['rating']:.0f} +/- {2 * glicko_ratings[name]['rd']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
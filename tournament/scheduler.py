@@ -0,0 +1,224 @@
+"""
+Tournament scheduler.
+
+A tournament spec is a plain dict (so it can live in a JSON file):
+
+    {
+        "name": "release-1",
+        "agents": [
+            {"name": "Claude", "model": "claude-3-5-sonnet-20241022"},
+            {"name": "Gemini", "model": "gemini-pro", "model_config": {"temperature": 0}}
+        ],
+        "tasks": [
+            {"task": "TriviaDuel", "params": {"questions": [...]}},
+            {"task": "NegotiationGame", "params": {"max_rounds": 10}},
+            {"task": "CodingBattle", "params": {"problems": "problems.json", "attempts": 2}},
+            {"task": "TriviaDuel", "question_bank": "questions.jsonl",
+             "questions_per_match": 20, "category": "science"}
+        ],
+        "seeds": [1, 2, 3],
+        "pairing": "round_robin",     # or "swiss"
+        "swap_seats": true,           # also play every pairing with the seats reversed
+        "rounds": 3                   # swiss only
+    }
+
+A TriviaDuel can draw its questions from a QuestionBank instead of listing them:
+every match samples questions_per_match questions with the match's seed.
+
+expand_spec() turns that into a flat list of jobs (agents x tasks x seeds), which
+schedule() pushes into a JobQueue for workers to pick up. Swiss tournaments are
+scheduled one round at a time, since each round's pairings depend on the standings;
+"rounds" caps how many. Scheduling a round that is already in the queue is refused.
+"""
+import argparse
+import json
+from functools import lru_cache
+from itertools import combinations
+
+from tasks.coding_battle import CodingBattle
+from tasks.negotiation_game import NegotiationGame
+from tasks.question_bank import QuestionBank
+from tasks.trivia_duel import TriviaDuel
+from tournament.work_queue import JobQueue
+
+TASK_REGISTRY = {
+    "TriviaDuel": TriviaDuel,
+    "NegotiationGame": NegotiationGame,
+    "CodingBattle": CodingBattle,
+}
+
+
+@lru_cache(maxsize=None)
+def _question_bank(path):
+    # one open (mmap'd) bank per corpus per process
+    return QuestionBank(path)
+
+
+def build_task(task_spec, seed=None):
+    task_cls = TASK_REGISTRY[task_spec["task"]]
+    params = dict(task_spec.get("params", {}))
+    if "question_bank" in task_spec:
+        bank = _question_bank(task_spec["question_bank"])
+        params["questions"] = bank.sample(task_spec.get("questions_per_match", 10), seed,
+                                          category=task_spec.get("category"),
+                                          difficulty=task_spec.get("difficulty"))
+    return task_cls(**params)
+
+
+def build_agents(agent_specs):
+    from agents.registry import create_agent
+    return [create_agent(spec["name"], spec["model"], spec.get("model_config"))
+            for spec in agent_specs]
+
+
+def round_robin_pairings(names):
+    """Every agent plays every other agent once."""
+    return list(combinations(names, 2))
+
+
+def swiss_pairings(names, standings, played):
+    """
+    Pair agents with similar scores who haven't met yet.
+
+    Args:
+        names: agent names
+        standings: {name: points so far}
+        played: set of frozenset({a, b}) pairs that already met
+
+    Returns:
+        list of (a, b) pairs. With an odd number of agents the lowest ranked
+        unpaired agent sits the round out.
+    """
+    ranked = sorted(names, key=lambda n: (-standings.get(n, 0), n))
+    pairs = []
+    unpaired = list(ranked)
+    while len(unpaired) > 1:
+        a = unpaired.pop(0)
+        # highest ranked opponent we haven't played yet, otherwise just the next one down
+        opponent = next((b for b in unpaired if frozenset((a, b)) not in played), unpaired[0])
+        unpaired.remove(opponent)
+        pairs.append((a, opponent))
+    return pairs
+
+
+def swap_seats(pairs):
+    """Add the reversed version of every pairing so seat 0 has no advantage."""
+    return [p for pair in pairs for p in (pair, pair[::-1])]
+
+
+def match_points(scores):
+    """
+    Turn a match's per-agent scores into (points for seat 0, points for seat 1):
+    1 for a win, 0.5 for a tie, 0 for a loss.
+
+    Trivia scores are plain numbers; negotiation and coding battle scores are dicts and
+    we compare gain / score.
+    Works on scores that went through JSON too (string keys).
+    """
+    values = []
+    for seat in (0, 1):
+        score = scores[seat] if seat in scores else scores[str(seat)]
+        if isinstance(score, dict):
+            score = score.get("gain", score.get("score", 0))
+        values.append(score)
+    if values[0] > values[1]:
+        return 1.0, 0.0
+    if values[1] > values[0]:
+        return 0.0, 1.0
+    return 0.5, 0.5
+
+
+def expand_spec(spec, pairs=None, round_index=0):
+    """
+    Expand a tournament spec into a list of jobs.
+
+    Args:
+        spec: tournament spec dict (see module docstring)
+        pairs: explicit (name, name) pairings to use. Defaults to round robin.
+        round_index: which round these jobs belong to (swiss)
+
+    Returns:
+        list of job dicts: {"task", "agents", "seed", "round"}
+    """
+    agents_by_name = {a["name"]: a for a in spec["agents"]}
+    if pairs is None:
+        pairs = round_robin_pairings(list(agents_by_name))
+    if spec.get("swap_seats", False):
+        pairs = swap_seats(pairs)
+
+    jobs = []
+    for task_spec in spec["tasks"]:
+        for seed in spec.get("seeds", [42]):
+            for a, b in pairs:
+                jobs.append({
+                    "task": task_spec,
+                    "agents": [agents_by_name[a], agents_by_name[b]],
+                    "seed": seed,
+                    "round": round_index,
+                })
+    return jobs
+
+
+def standings_from_results(results):
+    """Sum up match points per agent name and collect who has played whom."""
+    standings = {}
+    played = set()
+    for job, result in results:
+        a, b = (agent["name"] for agent in job["agents"])
+        pts_a, pts_b = match_points(result["scores"])
+        standings[a] = standings.get(a, 0) + pts_a
+        standings[b] = standings.get(b, 0) + pts_b
+        played.add(frozenset((a, b)))
+    return standings, played
+
+
+def schedule(spec, queue, round_index=0):
+    """
+    Push a tournament's jobs into the queue.
+
+    Round robin tournaments are scheduled in one go. Swiss tournaments get one
+    round per call; call again with the next round_index once the previous round
+    has finished, up to spec["rounds"].
+
+    Returns:
+        list of job ids that were enqueued
+
+    Raises:
+        ValueError: the round is already queued, or past the spec's last swiss round
+    """
+    name = spec.get("name", "default")
+    if spec.get("pairing", "round_robin") == "swiss":
+        if "rounds" in spec and round_index >= spec["rounds"]:
+            raise ValueError(f"{name} has {spec['rounds']} swiss rounds (0 to {spec['rounds'] - 1}), "
+                             f"not round {round_index}")
+        names = [a["name"] for a in spec["agents"]]
+        standings, played = standings_from_results(queue.results(name))
+        pairs = swiss_pairings(names, standings, played)
+        jobs = expand_spec(spec, pairs=pairs, round_index=round_index)
+    else:
+        jobs = expand_spec(spec, round_index=round_index)
+    return queue.enqueue(jobs, tournament=name, round_index=round_index,
+                         max_attempts=spec.get("max_attempts", 3), once=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand a tournament spec into the job queue")
+    parser.add_argument("spec", help="path to the tournament spec JSON file")
+    parser.add_argument("--db", default="tournament.db", help="job queue SQLite file")
+    parser.add_argument("--round", type=int, default=0, help="round to schedule (swiss)")
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+
+    queue = JobQueue(args.db)
+    try:
+        job_ids = schedule(spec, queue, round_index=args.round)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Enqueued {len(job_ids)} jobs into {args.db}")
+    print(queue.counts())
+
+
+if __name__ == "__main__":
+    main()
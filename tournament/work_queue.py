@@ -0,0 +1,195 @@
+"""
+Durable job queue backed by a SQLite file.
+
+Workers claim a job by taking a lease on it. A worker keeps its lease alive with
+heartbeat() while the match runs; if the worker dies the lease expires and the job
+goes back to pending for someone else. Failed jobs are retried until they run out
+of attempts.
+
+Several worker processes can share one queue file. For workers on several machines
+put the file on a shared filesystem and pass wal=False, since SQLite's WAL mode
+only works when every process is on the same host.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tournament TEXT NOT NULL,
+    round INTEGER NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_tournament ON jobs (tournament, round);
+"""
+
+
+class JobQueue:
+    def __init__(self, db_path, wal=True, timeout=30.0):
+        self.db_path = str(db_path)
+        # one connection per queue object, shared with the heartbeat thread under a lock
+        self._conn = sqlite3.connect(self.db_path, timeout=timeout,
+                                     isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        if wal:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _transaction(self, fn):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never
+        # both see the same pending job and claim it
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return out
+
+    def enqueue(self, jobs, tournament="default", round_index=0, max_attempts=3, once=False):
+        """
+        Add job dicts to the queue. Returns their ids.
+
+        once: raise ValueError instead if the tournament already has jobs for round_index
+        (checked in the same transaction, so two schedulers can't both get through)
+        """
+        now = time.time()
+
+        def _insert(conn):
+            if once and conn.execute("SELECT 1 FROM jobs WHERE tournament = ? AND round = ? LIMIT 1",
+                                     (tournament, round_index)).fetchone():
+                raise ValueError(f"round {round_index} of {tournament} is already queued")
+            ids = []
+            for job in jobs:
+                cur = conn.execute(
+                    "INSERT INTO jobs (tournament, round, payload, max_attempts, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (tournament, job.get("round", round_index), json.dumps(job), max_attempts, now, now)
+                )
+                ids.append(cur.lastrowid)
+            return ids
+
+        return self._transaction(_insert)
+
+    def requeue_expired(self):
+        """Put jobs whose lease ran out back to pending (or failed if out of attempts)."""
+        now = time.time()
+
+        def _requeue(conn):
+            return self._requeue_expired(conn, now)
+
+        return self._transaction(_requeue)
+
+    @staticmethod
+    def _requeue_expired(conn, now):
+        cur = conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, lease_expires = NULL, error = 'lease expired', updated = ? "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (now, now)
+        )
+        return cur.rowcount
+
+    def claim(self, worker_id, lease_seconds=600):
+        """
+        Lease the oldest pending job.
+
+        Returns:
+            (job_id, job dict) or None if there is nothing to do
+        """
+        now = time.time()
+
+        def _claim(conn):
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row[0])
+            )
+            return row[0], json.loads(row[1])
+
+        return self._transaction(_claim)
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=600):
+        """Extend a lease. Returns False if the worker no longer owns the job."""
+        now = time.time()
+
+        def _extend(conn):
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (now + lease_seconds, now, job_id, worker_id)
+            )
+            return cur.rowcount == 1
+
+        return self._transaction(_extend)
+
+    def complete(self, job_id, worker_id, result):
+        now = time.time()
+
+        def _complete(conn):
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (json.dumps(result), now, job_id, worker_id)
+            )
+            return cur.rowcount == 1
+
+        return self._transaction(_complete)
+
+    def fail(self, job_id, worker_id, error):
+        """Record a failed attempt. The job is retried unless it is out of attempts."""
+        now = time.time()
+
+        def _fail(conn):
+            cur = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, lease_expires = NULL, error = ?, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (str(error), now, job_id, worker_id)
+            )
+            return cur.rowcount == 1
+
+        return self._transaction(_fail)
+
+    def counts(self, tournament=None):
+        """Number of jobs in each status."""
+        with self._lock:
+            if tournament is None:
+                rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT status, COUNT(*) FROM jobs WHERE tournament = ? GROUP BY status", (tournament,)
+                ).fetchall()
+        return dict(rows)
+
+    def results(self, tournament="default"):
+        """(job dict, result dict) for every finished job of a tournament."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload, result FROM jobs WHERE tournament = ? AND status = 'done' ORDER BY id",
+                (tournament,)
+            ).fetchall()
+        return [(json.loads(payload), json.loads(result)) for payload, result in rows]
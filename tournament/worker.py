@@ -0,0 +1,111 @@
+"""
+Tournament worker: claims jobs from the queue, plays them and reports back.
+
+Start as many as you like, on one or several machines pointing at the same queue:
+
+    python -m tournament.worker --db tournament.db --processes 8
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+
+from engine.orchestration_engine import run_match
+from tournament.scheduler import build_agents, build_task
+from tournament.work_queue import JobQueue
+
+
+def run_job(job, log_dir="logs", compact=False, compression=None):
+    """Play a single job and return the summary stored in the queue."""
+    task = build_task(job["task"], seed=job["seed"])
+    agents = build_agents(job["agents"])
+    result = run_match(task, agents, seed=job["seed"], log_dir=log_dir, compact=compact, compression=compression)
+    return {
+        "match_id": result["match_id"],
+        "scores": result["scores"],
+        "log_dir": str(log_dir),
+    }
+
+
+def _keep_lease_alive(queue, job_id, worker_id, lease_seconds, stop):
+    # renew well before the lease runs out; stop quietly if someone else took the job
+    while not stop.wait(lease_seconds / 3):
+        if not queue.heartbeat(job_id, worker_id, lease_seconds):
+            return
+
+
+def run_worker(db_path, worker_id=None, log_dir="logs", lease_seconds=600,
+               poll_interval=2.0, exit_when_idle=False, max_jobs=None, compact=False, compression=None):
+    """
+    Claim and run jobs until the queue is empty (exit_when_idle) or forever.
+    compact / compression pick the match log format (see run_match).
+
+    Returns:
+        number of jobs this worker finished
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(db_path)
+    finished = 0
+
+    try:
+        while max_jobs is None or finished < max_jobs:
+            claimed = queue.claim(worker_id, lease_seconds=lease_seconds)
+            if claimed is None:
+                if exit_when_idle:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            job_id, job = claimed
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=_keep_lease_alive, args=(queue, job_id, worker_id, lease_seconds, stop), daemon=True
+            )
+            heartbeat.start()
+            try:
+                summary = run_job(job, log_dir=log_dir, compact=compact, compression=compression)
+            except Exception as e:
+                traceback.print_exc()
+                queue.fail(job_id, worker_id, f"{type(e).__name__}: {e}")
+            else:
+                queue.complete(job_id, worker_id, summary)
+                finished += 1
+            finally:
+                stop.set()
+                heartbeat.join()
+    finally:
+        queue.close()
+
+    return finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run tournament jobs from the queue")
+    parser.add_argument("--db", default="tournament.db", help="job queue SQLite file")
+    parser.add_argument("--log-dir", default="logs")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start")
+    parser.add_argument("--lease", type=float, default=600, help="lease length in seconds")
+    parser.add_argument("--exit-when-idle", action="store_true", help="stop once the queue is empty")
+    parser.add_argument("--compact-logs", action="store_true", help="write observations and states as deltas")
+    parser.add_argument("--compression", choices=["gzip", "lzma"], help="compress match logs")
+    args = parser.parse_args()
+
+    kwargs = {"log_dir": args.log_dir, "lease_seconds": args.lease, "exit_when_idle": args.exit_when_idle,
+              "compact": args.compact_logs, "compression": args.compression}
+    if args.processes == 1:
+        run_worker(args.db, **kwargs)
+        return
+
+    procs = [multiprocessing.Process(target=run_worker, args=(args.db,), kwargs=kwargs)
+             for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()